@@ -0,0 +1,149 @@
+# benchmarks/circulation_contention.py
+# Lasttest für Ausleihe und Rückgabe: Viele Threads leihen gleichzeitig dasselbe Buch aus.
+# Gemessen werden Durchsatz und Latenz; anschließend wird geprüft, ob Bestand und offene
+# Ausleihen übereinstimmen. Benötigt einen laufenden MongoDB-Server.
+#
+# Aufruf aus dem Projektverzeichnis:
+#   python -m benchmarks.circulation_contention --threads 32 --copies 20
+#   python -m benchmarks.circulation_contention --legacy   (alter Ablauf zum Vergleich)
+#
+# Geschrieben wird in die Benchmark-Datenbank (--db, Standard library_bench), nicht in die der App.
+
+import argparse
+import datetime
+import statistics
+import threading
+import time
+import uuid
+
+from bson.objectid import ObjectId
+
+from library_app import db
+from library_app.circulation import CirculationError, borrow, return_loan
+from library_app.db import books_collection, users_collection, loans_collection
+from library_app.versions import flush_writes
+
+from .seed_data import add_database_arguments, database_config
+
+def legacy_borrow(book_id, user_id):
+    # Früherer Ablauf aus users.borrow_book: lesen, in Python prüfen, dann getrennt schreiben
+    book = books_collection.find_one({'_id': ObjectId(book_id)})
+    if not book or book.get('available_copies', 0) <= 0:
+        raise CirculationError('nicht verfügbar')
+    books_collection.update_one({'_id': ObjectId(book_id)}, {'$inc': {'available_copies': -1}})
+    loan_date = datetime.datetime.now(datetime.timezone.utc)
+    loan = {'book_id': ObjectId(book_id), 'user_id': ObjectId(user_id), 'loan_date': loan_date,
+            'due_date': loan_date + datetime.timedelta(days=21), 'return_date': None}
+    loans_collection.insert_one(loan)
+    return book, loan
+
+def legacy_return(loan_id):
+    loan = loans_collection.find_one({'_id': ObjectId(loan_id), 'return_date': None})
+    if not loan:
+        raise CirculationError('nicht gefunden')
+    loans_collection.update_one({'_id': loan['_id']}, {'$set': {'return_date': datetime.datetime.now(datetime.timezone.utc)}})
+    books_collection.update_one({'_id': loan['book_id']}, {'$inc': {'available_copies': 1}})
+    return loan
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run(threads, copies, attempts, return_ratio, legacy):
+    borrow_fn, return_fn = (legacy_borrow, legacy_return) if legacy else (borrow, return_loan)
+    marker = f'bench-{uuid.uuid4().hex[:8]}'
+
+    book_id = books_collection.insert_one({
+        'title': f'Benchmark {marker}', 'isbn': marker, 'author_name': 'Benchmark',
+        'total_copies': copies, 'available_copies': copies
+    }).inserted_id
+    user_ids = users_collection.insert_many([
+        {'username': f'{marker}-{index}', 'role': 'user', 'password': '',
+         'registered_on': datetime.datetime.now(datetime.timezone.utc)}
+        for index in range(threads)
+    ]).inserted_ids
+
+    latencies, counters = [], {'borrowed': 0, 'rejected': 0, 'returned': 0}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(threads)
+
+    def worker(user_id):
+        local_latencies, local = [], {'borrowed': 0, 'rejected': 0, 'returned': 0}
+        open_loans = []
+        start_barrier.wait()
+
+        for attempt in range(attempts):
+            started = time.perf_counter()
+            try:
+                if open_loans and (attempt % 100) < return_ratio * 100:
+                    return_fn(open_loans.pop()['_id'])
+                    local['returned'] += 1
+                else:
+                    _, loan = borrow_fn(book_id, user_id)
+                    open_loans.append(loan)
+                    local['borrowed'] += 1
+            except CirculationError:
+                local['rejected'] += 1
+            local_latencies.append(time.perf_counter() - started)
+
+        # Die Schreibzugriffe werden pro Thread erfasst
+        flush_writes()
+        with lock:
+            latencies.extend(local_latencies)
+            for key, value in local.items():
+                counters[key] += value
+
+    workers = [threading.Thread(target=worker, args=(user_id,)) for user_id in user_ids]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    book = books_collection.find_one({'_id': book_id})
+    open_count = loans_collection.count_documents({'book_id': book_id, 'return_date': None})
+    expected_available = copies - open_count
+
+    print(f"Modus:              {'legacy (lesen-prüfen-schreiben)' if legacy else 'atomar (find_one_and_update)'}")
+    print(f"Threads/Versuche:   {threads} x {attempts}, {copies} Exemplare")
+    print(f"Operationen:        {len(latencies)} in {elapsed:.2f} s ({len(latencies) / elapsed:.0f} ops/s)")
+    print(f"Ausgeliehen/Zurück: {counters['borrowed']} / {counters['returned']}, abgelehnt: {counters['rejected']}")
+    print(f"Latenz p50/p95/p99: {percentile(latencies, 0.5) * 1000:.2f} / {percentile(latencies, 0.95) * 1000:.2f} / "
+          f"{percentile(latencies, 0.99) * 1000:.2f} ms (Mittel {statistics.mean(latencies) * 1000:.2f} ms)")
+    print(f"Bestand:            available_copies={book['available_copies']}, offene Ausleihen={open_count}, "
+          f"erwartet={expected_available}")
+
+    consistent = (
+        book['available_copies'] == expected_available
+        and 0 <= book['available_copies'] <= copies
+        and counters['borrowed'] - counters['returned'] == open_count
+    )
+    print(f"Korrekt:            {'ja' if consistent else 'NEIN'}")
+
+    loans_collection.delete_many({'book_id': book_id})
+    books_collection.delete_one({'_id': book_id})
+    users_collection.delete_many({'_id': {'$in': user_ids}})
+    flush_writes()
+    return consistent
+
+def main():
+    parser = argparse.ArgumentParser(description='Lasttest für gleichzeitige Ausleihen eines Buchs.')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--copies', type=int, default=10)
+    parser.add_argument('--attempts', type=int, default=200, help='Operationen pro Thread')
+    # Ohne Rückgaben (Standard) ist jede Überbuchung am Ende sichtbar; mit Rückgaben wird
+    # zusätzlich der gemischte Betrieb am Schalter gemessen
+    parser.add_argument('--return-ratio', type=float, default=0.0, help='Anteil Rückgaben, solange Ausleihen offen sind')
+    parser.add_argument('--legacy', action='store_true', help='alten, nicht atomaren Ablauf messen')
+    add_database_arguments(parser)
+    args = parser.parse_args()
+    db.configure(database_config(args))
+
+    consistent = run(args.threads, args.copies, args.attempts, args.return_ratio, args.legacy)
+    raise SystemExit(0 if consistent else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+# benchmarks/query_plans.py
+# Prüft die Abfragepläne aller Routen. Die Szenarien aus benchmarks.routes werden ausgeführt,
+# dazu die ändernden Routen, die dort nicht gemessen werden (Sammel-Rückgabe, Import, Bearbeiten
+# und Löschen, Autoren-Aufträge); dabei zeichnet der Command-Listener jede Abfrage auf. Jede Abfrageform wird einmal mit
+# explain (executionStats) ausgewertet. Der Lauf schlägt fehl bei einem Collection-Scan, einer
+# Sortierung im Speicher über --max-sort Dokumente oder wenn deutlich mehr Dokumente gelesen
+# als geliefert werden.
+#
+# Die zusätzlichen Szenarien legen ihre Daten selbst an und entfernen sie wieder. Routen ohne
+# Szenario stehen mit Begründung in NOT_CHECKED; weitere ungeprüfte Routen werden gemeldet.
+#
+# Voraussetzung ist ein Datenbestand aus benchmarks.seed_data (gleiche --db). Aufruf aus dem Projektverzeichnis:
+#   python -m benchmarks.query_plans
+#   python -m benchmarks.query_plans --max-ratio 5 --verbose
+
+import argparse
+import io
+import random
+import uuid
+
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure
+
+from library_app import create_app
+from library_app.author_jobs import jobs_collection, run_pending
+from library_app.db import db, authors_collection, books_collection, users_collection
+from library_app.metrics import command_metrics
+from library_app.search import AUTHOR_SEARCH, BOOK_SEARCH, USER_SEARCH, search_fields
+
+from .routes import Scenario, _build_scenarios, _get, _sample, _stream
+from .seed_data import ADMIN_USERNAME, PASSWORD, add_database_arguments, database_config
+
+# Befehle, deren Plan geprüft wird; Schreibbefehle werden pro Anweisung erklärt
+EXPLAINABLE = ('find', 'aggregate', 'count', 'distinct', 'findAndModify', 'update', 'delete')
+
+# Felder des Wire-Protokolls, die nicht Teil der Abfrage sind
+SESSION_FIELDS = ('lsid', '$db', '$clusterTime', 'txnNumber', 'autocommit', 'startTransaction',
+                  '$readPreference', 'readConcern', 'writeConcern', 'ordered', 'bypassDocumentValidation')
+
+# Bewusst zugelassene Pläne: (Route, Befehl, Collection) -> Begründung
+ALLOWED = {
+    ('main.export_books_csv', 'find', 'books'): 'Vollexport liest jedes Dokument genau einmal',
+    ('main.export_users_csv', 'find', 'users'): 'Vollexport liest jedes Dokument genau einmal',
+    ('main.export_authors_csv', 'find', 'authors'): 'Vollexport liest jedes Dokument genau einmal',
+}
+
+# Routen ohne Szenario: Endpunkt -> Begründung
+NOT_CHECKED = {
+    'static': 'keine Datenbankzugriffe',
+    'metrics': 'keine Datenbankzugriffe',
+    'auth.register': 'einzelner Zugriff über den eindeutigen Index username_unique',
+    'auth.login': 'einzelner Zugriff über den eindeutigen Index username_unique',
+    'auth.logout': 'keine Datenbankzugriffe',
+    'books.add_book': 'Autor über name_id, danach ein Einfügen',
+    'authors.add_author': 'Autor über name_id, danach ein Einfügen',
+    'main.export_users_csv': 'Vollexport wie export_books_csv',
+    'main.export_authors_csv': 'Vollexport wie export_books_csv',
+    'api.user_cache_stats': 'keine Datenbankzugriffe',
+    'api.db_pool_stats': 'keine Datenbankzugriffe',
+}
+
+def _edit_scenarios(app, sample):
+    # Ändernde Routen, die benchmarks.routes nicht misst. Jedes Szenario legt eigene Dokumente mit
+    # einer Kennung an und entfernt sie im teardown; Autoren-Aufträge laufen nur hier (ohne Thread).
+    books, admin_id = sample['books'], sample['admin_id']
+
+    def marker():
+        return f'plancheck-{uuid.uuid4().hex[:12]}'
+
+    def new_isbn():
+        return str(uuid.uuid4().int)[:13]
+
+    def new_book(author_id=None, author_name='Plancheck'):
+        book = {'title': marker(), 'isbn': new_isbn(), 'author_id': author_id, 'author_name': author_name,
+                'total_copies': 2, 'available_copies': 2}
+        book.update(search_fields(BOOK_SEARCH, book))
+        return books_collection.insert_one(book).inserted_id
+
+    def new_author(client=None, rng=None):
+        author = {'name': marker(), 'biography': ''}
+        author.update(search_fields(AUTHOR_SEARCH, author))
+        author_id = authors_collection.insert_one(author).inserted_id
+        for _ in range(3):
+            new_book(author_id, author['name'])
+        return author_id
+
+    def new_user(client, rng):
+        user = {'username': marker(), 'password': '!', 'role': 'user'}
+        user.update(search_fields(USER_SEARCH, user))
+        return users_collection.insert_one(user).inserted_id
+
+    def run_job(job_id):
+        with app.app_context():
+            run_pending(job_id=job_id)
+
+    def remove_author(author_id):
+        authors_collection.delete_one({'_id': author_id})
+        books_collection.delete_many({'author_id': author_id})
+        jobs_collection.delete_many({'author_id': author_id})
+
+    def finish_author(client, author_id):
+        # Aufträge aus edit/delete abarbeiten, danach alles entfernen
+        for job in jobs_collection.find({'author_id': author_id, 'status': {'$ne': 'done'}}, {'_id': 1}):
+            run_job(job['_id'])
+        remove_author(author_id)
+
+    def job_setup(action):
+        # Autor mit Büchern anlegen und über die Route einen Auftrag erzeugen; liefert (Autor, Auftrag)
+        def setup(client, rng):
+            author_id = new_author()
+            if action == 'rename':
+                client.post(f'/author/edit/{author_id}', data={'name': marker(), 'biography': ''})
+            else:
+                client.get(f'/author/delete/{author_id}')
+            job = jobs_collection.find_one({'author_id': author_id}, {'_id': 1}, sort=[('created_at', -1)])
+            return author_id, job['_id']
+        return setup
+
+    def checkout(client, rng):
+        items = [str(book['_id']) for book in rng.sample(books, min(5, len(books)))]
+        response = client.post('/api/circulation/checkout', json={'user_id': str(admin_id), 'items': items})
+        return [result['loan_id'] for result in response.get_json()['results'] if result['ok']]
+
+    def import_books(client, rng, isbns):
+        rows = ''.join(f'{marker()},{books[0]["author_name"]},{isbn},2 / 2\n' for isbn in isbns)
+        payload = io.BytesIO(f'Titel,Autor,ISBN,Status\n{rows}'.encode('utf-8'))
+        return client.post('/import', data={'kind': 'books', 'file': (payload, 'plancheck.csv')},
+                           content_type='multipart/form-data')
+
+    def edit_book(client, rng, book_id):
+        return client.post(f'/book/edit/{book_id}', data={'title': marker(), 'isbn': new_isbn(),
+                                                          'author_name': 'Plancheck', 'total_copies': 3})
+
+    def remove_book(client, book_id):
+        books_collection.delete_one({'_id': book_id})
+
+    def remove_user(client, user_id):
+        users_collection.delete_one({'_id': user_id})
+
+    return [
+        Scenario('api_return_5', lambda client, rng, loan_ids: client.post(
+            '/api/circulation/return', json={'user_id': str(admin_id), 'items': loan_ids}), setup=checkout),
+        Scenario('import_form', _get('/import')),
+        Scenario('import_books_csv', import_books, setup=lambda client, rng: [new_isbn() for _ in range(5)],
+                 teardown=lambda client, isbns: books_collection.delete_many({'isbn': {'$in': isbns}})),
+        Scenario('book_edit_form', lambda client, rng, book_id: client.get(f'/book/edit/{book_id}'),
+                 setup=lambda client, rng: new_book(), teardown=remove_book),
+        Scenario('book_edit', edit_book, setup=lambda client, rng: new_book(), teardown=remove_book),
+        Scenario('book_delete', lambda client, rng, book_id: client.get(f'/book/delete/{book_id}'),
+                 setup=lambda client, rng: new_book()),
+        Scenario('author_edit', lambda client, rng, author_id: client.post(
+            f'/author/edit/{author_id}', data={'name': marker(), 'biography': ''}),
+            setup=new_author, teardown=finish_author),
+        Scenario('author_delete', lambda client, rng, author_id: client.get(f'/author/delete/{author_id}'),
+                 setup=new_author, teardown=finish_author),
+        Scenario('author_job_progress', lambda client, rng, state: client.get(f'/api/jobs/authors/{state[1]}'),
+                 setup=job_setup('rename'), teardown=lambda client, state: finish_author(client, state[0])),
+        # Ohne Request-Kontext erscheinen die Abfragen der Aufträge als Endpunkt "ohne-request"
+        Scenario('author_job_rename', lambda client, rng, state: run_job(state[1]),
+                 setup=job_setup('rename'), teardown=lambda client, state: remove_author(state[0])),
+        Scenario('author_job_delete', lambda client, rng, state: run_job(state[1]),
+                 setup=job_setup('delete'), teardown=lambda client, state: remove_author(state[0])),
+        Scenario('user_edit', lambda client, rng, user_id: client.post(f'/user/edit/{user_id}', data={'role': 'librarian'}),
+                 setup=new_user, teardown=remove_user),
+        Scenario('user_delete', lambda client, rng, user_id: client.get(f'/user/delete/{user_id}'), setup=new_user),
+        Scenario('export_trends_csv', _stream('/export/trends/book/csv')),
+        Scenario('export_trends_total_csv', _stream('/export/trends/author/csv?granularity=total')),
+    ]
+
+def _shape(value):
+    # Abfrageform: Werte werden durch ihren Typ ersetzt, damit gleiche Abfragen nur einmal geprüft werden
+    if isinstance(value, dict):
+        return '{' + ','.join(f'{key}:{_shape(item)}' for key, item in value.items()) + '}'
+    if isinstance(value, list):
+        return '[' + ','.join(sorted({_shape(item) for item in value})) + ']'
+    if isinstance(value, ObjectId):
+        return 'oid'
+    return type(value).__name__
+
+def _statements(command_name, command):
+    # Zerlegt einen Befehl in einzeln erklärbare Befehle ohne Sitzungsfelder
+    command = {key: value for key, value in command.items() if key not in SESSION_FIELDS}
+    if command_name == 'update':
+        return [dict(command, updates=[statement]) for statement in command['updates']]
+    if command_name == 'delete':
+        return [dict(command, deletes=[statement]) for statement in command['deletes']]
+    return [command]
+
+def _walk(node):
+    # Alle verschachtelten Dokumente eines explain-Ergebnisses
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _walk(value)
+
+def analyse(explain, max_sort, max_ratio, min_examined):
+    problems = []
+    for node in _walk(explain):
+        stage = node.get('stage')
+        if stage == 'COLLSCAN':
+            problems.append('Collection-Scan')
+        elif stage == 'SORT':
+            sorted_count = node.get('inputStage', {}).get('nReturned', node.get('nReturned', 0))
+            if sorted_count > max_sort:
+                problems.append(f'Sortierung im Speicher über {sorted_count} Dokumente')
+        if '$sort' in node and 'nReturned' in node and node['nReturned'] > max_sort:
+            # $sort als eigene Pipeline-Stufe wurde nicht in die Indexabfrage verschoben
+            problems.append(f"Sortierung in der Pipeline über {node['nReturned']} Dokumente")
+        if 'totalDocsExamined' in node:
+            examined, returned = node['totalDocsExamined'], node.get('nReturned', 0)
+            if examined > max(min_examined, max_ratio * max(returned, 1)):
+                problems.append(f'{examined} Dokumente gelesen für {returned} Ergebnisse')
+    # Doppelte Meldungen aus Plan und executionStats zusammenfassen
+    return sorted(set(problems))
+
+def capture_commands(client, scenarios, rng):
+    commands = []
+    for scenario in scenarios:
+        state = scenario.setup(client, rng) if scenario.setup else None
+        with command_metrics.capture() as captured:
+            scenario.request(client, rng, state)
+        if scenario.teardown:
+            scenario.teardown(client, state)
+        commands.extend((scenario.name, endpoint, name, command)
+                        for endpoint, name, command in captured if name in EXPLAINABLE)
+    return commands
+
+def main():
+    parser = argparse.ArgumentParser(description='Abfragepläne aller Routen auf Index-Nutzung prüfen.')
+    parser.add_argument('--max-sort', type=int, default=1000, help='maximale Dokumente einer Sortierung im Speicher')
+    parser.add_argument('--max-ratio', type=float, default=10.0, help='maximales Verhältnis gelesen/geliefert')
+    parser.add_argument('--min-examined', type=int, default=200, help='darunter wird das Verhältnis nicht geprüft')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--verbose', action='store_true', help='auch unauffällige Abfragen ausgeben')
+    add_database_arguments(parser)
+    args = parser.parse_args()
+
+    # Ohne Ratenbegrenzung, sonst enden die wiederholten Autovervollständigungen mit 429.
+    # Autoren-Aufträge starten keinen Thread, die Szenarien führen sie selbst aus.
+    app = create_app({'AUTO_MIGRATE': False, 'SECRET_KEY': 'benchmark', 'SLOW_QUERY_MS': None, 'RATE_LIMITS': {},
+                      'AUTHOR_JOBS_IN_PROCESS': False, **database_config(args)})
+    client = app.test_client()
+    if client.post('/login', data={'username': ADMIN_USERNAME, 'password': PASSWORD}).status_code != 302:
+        raise SystemExit(f'Anmeldung als {ADMIN_USERNAME} fehlgeschlagen.')
+
+    sample = _sample()
+    scenarios = _build_scenarios(sample) + _edit_scenarios(app, sample)
+    commands = capture_commands(client, scenarios, random.Random(args.seed))
+    seen, failures = set(), 0
+
+    for scenario, endpoint, name, command in commands:
+        collection = command.get(name) if isinstance(command.get(name), str) else '-'
+        for statement in _statements(name, command):
+            key = (endpoint, name, _shape(statement))
+            if key in seen:
+                continue
+            seen.add(key)
+
+            try:
+                explain = db.command({'explain': statement, 'verbosity': 'executionStats'})
+            except OperationFailure as error:
+                print(f'FEHLER  {endpoint} {name} {collection}: explain nicht möglich ({error})')
+                failures += 1
+                continue
+
+            problems = analyse(explain, args.max_sort, args.max_ratio, args.min_examined)
+            allowed = ALLOWED.get((endpoint, name, collection))
+            if problems and not allowed:
+                failures += 1
+                print(f'FEHLER  {endpoint} {name} {collection}: {"; ".join(problems)}')
+                print(f'        Szenario {scenario}, Abfrage {statement}')
+            elif args.verbose:
+                note = f' (zugelassen: {allowed})' if problems else ''
+                print(f'OK      {endpoint} {name} {collection}{note}')
+
+    checked = {endpoint for _, endpoint, _, _ in commands}
+    unchecked = sorted(rule.endpoint for rule in app.url_map.iter_rules()
+                       if rule.endpoint not in checked and rule.endpoint not in NOT_CHECKED)
+    if unchecked:
+        print(f'Ohne Szenario und ohne Eintrag in NOT_CHECKED: {", ".join(unchecked)}')
+    print(f'{len(seen)} Abfrageformen geprüft, {failures} mit Problemen')
+    raise SystemExit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
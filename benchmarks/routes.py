@@ -0,0 +1,188 @@
+# benchmarks/routes.py
+# Lasttest aller wichtigen Routen über den Flask-Test-Client: Listen mit und ohne Suche,
+# Berichte, CSV-Exporte, Ausleihe/Rückgabe, Sammel-API und Autovervollständigung. Gemessen
+# werden p50/p95/p99, Durchsatz und MongoDB-Befehle pro Anfrage. Ergebnisse lassen sich als
+# Baseline speichern und mit späteren Läufen vergleichen.
+#
+# Voraussetzung ist ein Datenbestand aus benchmarks.seed_data (gleiche --db). Aufruf aus dem Projektverzeichnis:
+#   python -m benchmarks.routes --save-baseline benchmarks/baselines/routes.json
+#   python -m benchmarks.routes --compare benchmarks/baselines/routes.json --tolerance 0.25
+
+import argparse
+import json
+import os
+import random
+import time
+
+from library_app import create_app
+from library_app.db import books_collection, users_collection, loans_collection
+from library_app.metrics import command_metrics
+
+from .circulation_contention import percentile
+from .seed_data import ADMIN_USERNAME, PASSWORD, TITLE_WORDS, add_database_arguments, database_config
+
+class Scenario:
+    def __init__(self, name, request, setup=None, teardown=None):
+        self.name = name
+        # request(client, rng, state) führt genau eine gemessene Anfrage aus und liefert die Antwort
+        self.request = request
+        # setup(client, rng) bereitet ungemessen vor und liefert `state`; teardown(client, state)
+        # räumt ungemessen auf, z.B. die Rückgabe nach einer Ausleihe
+        self.setup = setup
+        self.teardown = teardown
+
+def _get(url):
+    return lambda client, rng, state: client.get(url)
+
+def _stream(url):
+    # Gestreamte Antworten vollständig lesen, sonst wird nur der erste Block gemessen, und
+    # schließen, damit der Platz der Zulassungskontrolle frei wird
+    def request(client, rng, state):
+        response = client.get(url)
+        response.get_data()
+        response.close()
+        return response
+    return request
+
+def _build_scenarios(sample):
+    books, usernames, admin_id = sample['books'], sample['usernames'], sample['admin_id']
+
+    def open_loan_ids():
+        return [loan['_id'] for loan in loans_collection.find({'user_id': admin_id, 'return_date': None}, {'_id': 1})]
+
+    def return_all(client, state):
+        for loan_id in open_loan_ids():
+            client.get(f'/return/{loan_id}')
+
+    def borrow_one(client, rng):
+        client.get(f"/borrow/{rng.choice(books)['_id']}")
+        return open_loan_ids()[0]
+
+    def pick_items(client, rng):
+        return [book['isbn'] for book in rng.sample(books, min(5, len(books)))]
+
+    def checkout(client, rng, items):
+        return client.post('/api/circulation/checkout', json={'user_id': str(admin_id), 'items': items})
+
+    return [
+        Scenario('index', _get('/')),
+        Scenario('books_list', _get('/books')),
+        Scenario('books_list_page_size_200', _get('/books?per_page=200')),
+        Scenario('books_search_title', lambda client, rng, state: client.get(f'/books?search={rng.choice(TITLE_WORDS)}')),
+        Scenario('books_search_isbn', lambda client, rng, state: client.get(f"/books?search={rng.choice(books)['isbn']}")),
+        Scenario('authors_list', _get('/authors')),
+        Scenario('authors_search', lambda client, rng, state: client.get(f"/authors?search={rng.choice(books)['author_name'].split()[0]}")),
+        Scenario('users_list', _get('/users')),
+        Scenario('users_search', lambda client, rng, state: client.get(f'/users?search={rng.choice(usernames)[:4]}')),
+        Scenario('user_loan_history', _get(f'/user/{sample["busy_user_id"]}/loans')),
+        Scenario('profile', _get('/profile')),
+        Scenario('reports', _get('/reports')),
+        Scenario('export_books_csv', _stream('/export/books/csv')),
+        Scenario('export_report_overdue_csv', _stream('/export/report/overdue_books/csv')),
+        Scenario('autocomplete', lambda client, rng, state: client.get(f"/api/search_authors?q={rng.choice(books)['author_name'][:2]}")),
+        Scenario('borrow', lambda client, rng, state: client.get(f"/borrow/{rng.choice(books)['_id']}"), teardown=return_all),
+        Scenario('return', lambda client, rng, loan_id: client.get(f'/return/{loan_id}'), setup=borrow_one),
+        Scenario('api_checkout_5', checkout, setup=pick_items, teardown=return_all),
+    ]
+
+def _sample():
+    admin = users_collection.find_one({'username': ADMIN_USERNAME}, {'_id': 1})
+    if admin is None:
+        raise SystemExit('Kein synthetischer Datenbestand gefunden, bitte zuerst benchmarks.seed_data ausführen.')
+    books = list(books_collection.aggregate([
+        {'$match': {'available_copies': {'$gt': 0}}}, {'$sample': {'size': 200}},
+        {'$project': {'isbn': 1, 'author_name': 1}}
+    ]))
+    usernames = [user['username'] for user in users_collection.find({}, {'username': 1}).limit(200)]
+    busy_user = users_collection.find_one({}, {'_id': 1}, sort=[('total_loans', -1)])
+    return {'books': books, 'usernames': usernames, 'admin_id': admin['_id'], 'busy_user_id': busy_user['_id']}
+
+def run_scenario(client, scenario, iterations, warmup, rng):
+    latencies, commands, errors = [], 0, 0
+    for iteration in range(warmup + iterations):
+        state = scenario.setup(client, rng) if scenario.setup else None
+        commands_before = command_metrics.command_count
+        started = time.perf_counter()
+        response = scenario.request(client, rng, state)
+        elapsed = time.perf_counter() - started
+        if scenario.teardown:
+            scenario.teardown(client, state)
+        if iteration < warmup:
+            continue
+
+        latencies.append(elapsed)
+        commands += command_metrics.command_count - commands_before
+        if response.status_code >= 400:
+            errors += 1
+
+    total = sum(latencies)
+    return {
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'requests_per_second': iterations / total if total else 0.0,
+        'db_commands_per_request': commands / iterations,
+        'errors': errors
+    }
+
+def compare(results, baseline, tolerance):
+    # Regression: p95 oder Befehle pro Anfrage mehr als `tolerance` (relativ) über der Baseline
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in ('p95_ms', 'db_commands_per_request'):
+            if current[metric] > previous[metric] * (1 + tolerance) + (0.5 if metric == 'p95_ms' else 0):
+                regressions.append(f'{name}: {metric} {previous[metric]:.2f} -> {current[metric]:.2f}')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Lasttest der Routen über den Flask-Test-Client.')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--only', nargs='*', help='nur diese Szenarien ausführen')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save-baseline', metavar='PFAD', help='Ergebnisse als Baseline (JSON) speichern')
+    parser.add_argument('--compare', metavar='PFAD', help='mit gespeicherter Baseline vergleichen')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='erlaubte relative Verschlechterung')
+    add_database_arguments(parser)
+    args = parser.parse_args()
+
+    # Ohne Ratenbegrenzung, sonst enden die wiederholten Autovervollständigungen mit 429
+    app = create_app({'AUTO_MIGRATE': False, 'SECRET_KEY': 'benchmark', 'SLOW_QUERY_MS': None, 'RATE_LIMITS': {},
+                      **database_config(args)})
+    client = app.test_client()
+    response = client.post('/login', data={'username': ADMIN_USERNAME, 'password': PASSWORD})
+    if response.status_code != 302:
+        raise SystemExit(f'Anmeldung als {ADMIN_USERNAME} fehlgeschlagen.')
+
+    sample = _sample()
+    rng = random.Random(args.seed)
+    results = {}
+
+    print(f"{'Szenario':<28} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'Anfr./s':>8} {'DB/Anfr.':>9} {'Fehler':>6}")
+    for scenario in _build_scenarios(sample):
+        if args.only and scenario.name not in args.only:
+            continue
+        result = results[scenario.name] = run_scenario(client, scenario, args.iterations, args.warmup, rng)
+        print(f"{scenario.name:<28} {result['p50_ms']:8.2f} {result['p95_ms']:8.2f} {result['p99_ms']:8.2f} "
+              f"{result['requests_per_second']:8.1f} {result['db_commands_per_request']:9.1f} {result['errors']:6d}")
+
+    if args.save_baseline:
+        directory = os.path.dirname(args.save_baseline)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.save_baseline, 'w', encoding='utf-8') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        print(f'Baseline gespeichert: {args.save_baseline}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as source:
+            regressions = compare(results, json.load(source), args.tolerance)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        raise SystemExit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+# benchmarks/seed_data.py
+# Erzeugt einen synthetischen Datenbestand für Lasttests: Autoren, Bücher, Nutzer und eine
+# Ausleihhistorie mit schiefer Beliebtheit (Zipf-Verteilung über Bücher und Nutzer) sowie
+# einem einstellbaren Anteil offener und überfälliger Ausleihen. Benötigt einen laufenden
+# MongoDB-Server und schreibt in eine eigene Datenbank (--db, Voreinstellung library_bench);
+# die übrigen Benchmarks lesen mit derselben Option aus ihr.
+#
+# Aufruf aus dem Projektverzeichnis:
+#   python -m benchmarks.seed_data --authors 2000 --books 50000 --users 10000 --loans 500000
+#   python -m benchmarks.seed_data --reset ...   (vorher die Benchmark-Datenbank löschen)
+#
+# Alle erzeugten Nutzer haben das Passwort "benchmark"; "bench-admin" ist Administrator.
+
+import argparse
+import datetime
+import itertools
+import random
+import time
+
+from flask import Config, Flask
+from werkzeug.security import generate_password_hash
+
+from library_app import db
+from library_app.circulation import LOAN_PERIOD
+from library_app.db import books_collection, authors_collection, users_collection, loans_collection
+from library_app.indexes import init_db
+from library_app.loan_rollups import rebuild_rollups
+from library_app.loan_stats import rebuild_loan_stats
+from library_app.search import BOOK_SEARCH, AUTHOR_SEARCH, USER_SEARCH, search_fields
+from library_app.versions import flush_writes
+
+PASSWORD = 'benchmark'
+ADMIN_USERNAME = 'bench-admin'
+BENCH_DB_NAME = 'library_bench'
+
+FIRST_NAMES = ['Anna', 'Bernd', 'Clara', 'David', 'Emma', 'Felix', 'Greta', 'Hannes', 'Ida', 'Jonas',
+               'Karla', 'Lukas', 'Mia', 'Noah', 'Olga', 'Paul', 'Rosa', 'Simon', 'Tina', 'Uwe']
+LAST_NAMES = ['Bauer', 'Fischer', 'Hoffmann', 'Keller', 'Lang', 'Meyer', 'Neumann', 'Richter',
+              'Schmidt', 'Schulz', 'Vogel', 'Wagner', 'Weber', 'Wolf', 'Zimmermann']
+TITLE_WORDS = ['Abend', 'Berge', 'Chronik', 'Dämmerung', 'Erbe', 'Fluss', 'Garten', 'Himmel', 'Insel',
+               'Jahre', 'Kinder', 'Licht', 'Meer', 'Nacht', 'Orden', 'Reise', 'Schatten', 'Stadt',
+               'Sturm', 'Traum', 'Wald', 'Winter', 'Zeit', 'Zug']
+
+def add_database_arguments(parser):
+    # Gemeinsame Optionen aller Benchmarks: Server und Datenbank der Lasttestdaten
+    parser.add_argument('--uri', default=db.DEFAULT_SETTINGS['MONGO_URI'], help='MongoDB-Server')
+    parser.add_argument('--db', default=BENCH_DB_NAME,
+                        help=f'Datenbank der Lasttestdaten (Voreinstellung {BENCH_DB_NAME})')
+
+def database_config(args):
+    # MONGO_*-Einstellungen für db.configure bzw. create_app
+    return {'MONGO_URI': args.uri, 'MONGO_DB_NAME': args.db}
+
+def app_database_name():
+    # Datenbank der Anwendung laut instance/config.py (wie create_app ohne test_config)
+    config = Config(Flask('library_app', instance_relative_config=True).instance_path)
+    config.from_pyfile('config.py', silent=True)
+    return config.get('MONGO_DB_NAME', db.DEFAULT_SETTINGS['MONGO_DB_NAME'])
+
+def zipf_cum_weights(count, exponent):
+    # Kumulierte Gewichte 1/rang^s für random.choices; Rang 1 ist das beliebteste Element
+    return list(itertools.accumulate(1.0 / rank ** exponent for rank in range(1, count + 1)))
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _insert(collection, documents, batch_size):
+    ids = []
+    for batch in _batches(documents, batch_size):
+        ids.extend(collection.insert_many(batch, ordered=False).inserted_ids)
+    return ids
+
+def _authors(rng, count):
+    for index in range(count):
+        author = {'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {index:05d}',
+                  'biography': f'Synthetischer Autor Nr. {index}'}
+        author.update(search_fields(AUTHOR_SEARCH, author))
+        yield author
+
+def _books(rng, count, authors):
+    for index in range(count):
+        author = rng.choice(authors)
+        copies = rng.choice((1, 1, 1, 2, 2, 3, 5))
+        book = {
+            'title': f"{rng.choice(TITLE_WORDS)} der {rng.choice(TITLE_WORDS)} {index:06d}",
+            'isbn': f'978{index:010d}',
+            'author_id': author['_id'],
+            'author_name': author['name'],
+            'total_copies': copies,
+            'available_copies': copies
+        }
+        book.update(search_fields(BOOK_SEARCH, book))
+        yield book
+
+def _users(rng, count, password_hash, now):
+    yield dict({'username': ADMIN_USERNAME, 'password': password_hash, 'role': 'admin', 'registered_on': now},
+               **search_fields(USER_SEARCH, {'username': ADMIN_USERNAME}))
+    for index in range(count):
+        username = f'{rng.choice(FIRST_NAMES).lower()}{index:06d}'
+        role = 'librarian' if index % 200 == 0 else 'user'
+        user = {'username': username, 'password': password_hash, 'role': role,
+                'registered_on': now - datetime.timedelta(days=rng.randint(0, 3 * 365))}
+        user.update(search_fields(USER_SEARCH, user))
+        yield user
+
+def _loans(rng, count, books, user_ids, zipf_exponent, open_fraction, overdue_fraction, history_days, now):
+    # Ausleihen werden über die letzten history_days verteilt. Offene Ausleihen belegen Exemplare;
+    # ist ein Buch vollständig verliehen, wird die Ausleihe als zurückgegeben erzeugt.
+    book_weights = zipf_cum_weights(len(books), zipf_exponent)
+    user_weights = zipf_cum_weights(len(user_ids), zipf_exponent * 0.8)
+    # Beliebtheit unabhängig von der Einfügereihenfolge
+    book_order = rng.sample(range(len(books)), len(books))
+    user_order = rng.sample(range(len(user_ids)), len(user_ids))
+    open_per_book = {}
+
+    for _ in range(count):
+        book = books[book_order[rng.choices(range(len(books)), cum_weights=book_weights)[0]]]
+        user_id = user_ids[user_order[rng.choices(range(len(user_ids)), cum_weights=user_weights)[0]]]
+        is_open = rng.random() < open_fraction and open_per_book.get(book['_id'], 0) < book['total_copies']
+
+        if is_open and rng.random() < overdue_fraction:
+            # Überfällig: ausgeliehen vor mehr als einer Leihfrist
+            loan_date = now - LOAN_PERIOD - datetime.timedelta(days=rng.uniform(1, 60))
+        elif is_open:
+            loan_date = now - datetime.timedelta(days=rng.uniform(0, LOAN_PERIOD.days - 1))
+        else:
+            loan_date = now - datetime.timedelta(days=rng.uniform(LOAN_PERIOD.days, history_days))
+
+        loan = {'book_id': book['_id'], 'user_id': user_id, 'loan_date': loan_date,
+                'due_date': loan_date + LOAN_PERIOD, 'return_date': None}
+        if is_open:
+            open_per_book[book['_id']] = open_per_book.get(book['_id'], 0) + 1
+        else:
+            loan['return_date'] = loan_date + datetime.timedelta(days=rng.uniform(1, LOAN_PERIOD.days + 10))
+        yield loan
+
+    # Verfügbarkeit an die offenen Ausleihen anpassen
+    for book_id, open_count in open_per_book.items():
+        books_collection.update_one({'_id': book_id}, {'$inc': {'available_copies': -open_count}})
+
+def seed(authors, books, users, loans, zipf_exponent=1.1, open_fraction=0.08, overdue_fraction=0.25,
+         history_days=730, batch_size=5000, random_seed=42, reset=False):
+    rng = random.Random(random_seed)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    timings = {}
+
+    if reset:
+        # Die ganze Benchmark-Datenbank, damit Archiv, Rollups und Versionsstempel nicht veralten
+        db.client.drop_database(db.settings['MONGO_DB_NAME'])
+
+    started = time.perf_counter()
+    author_ids = _insert(authors_collection, _authors(rng, authors), batch_size)
+    author_docs = list(authors_collection.find({'_id': {'$in': author_ids}}, {'name': 1}))
+    timings['authors'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    book_ids = _insert(books_collection, _books(rng, books, author_docs), batch_size)
+    book_docs = list(books_collection.find({'_id': {'$in': book_ids}}, {'total_copies': 1}))
+    timings['books'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    # Ein Hash für alle Nutzer, sonst dominiert die Passwort-Ableitung die Laufzeit
+    user_ids = _insert(users_collection, _users(rng, users, generate_password_hash(PASSWORD), now), batch_size)
+    timings['users'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    _insert(loans_collection, _loans(rng, loans, book_docs, user_ids, zipf_exponent,
+                                     open_fraction, overdue_fraction, history_days, now), batch_size)
+    timings['loans'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    init_db()
+    rebuild_loan_stats(batch_size)
+    # Der Seeder schreibt allein in seine Datenbank, daher ohne die Rollup-Sperre
+    rebuild_rollups(batch_size=batch_size)
+    timings['indexes_and_stats'] = time.perf_counter() - started
+    # Ohne App-Kontext erhöht niemand sonst die Versionsstempel
+    flush_writes()
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetische Bibliotheksdaten für Lasttests erzeugen.')
+    parser.add_argument('--authors', type=int, default=500)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--loans', type=int, default=100000)
+    parser.add_argument('--zipf', type=float, default=1.1, help='Exponent der Beliebtheitsverteilung')
+    parser.add_argument('--open', type=float, default=0.08, help='Anteil offener Ausleihen')
+    parser.add_argument('--overdue', type=float, default=0.25, help='Anteil überfälliger unter den offenen Ausleihen')
+    parser.add_argument('--history-days', type=int, default=730)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42, help='Startwert des Zufallsgenerators')
+    parser.add_argument('--reset', action='store_true', help='vorher die Benchmark-Datenbank löschen')
+    add_database_arguments(parser)
+    args = parser.parse_args()
+
+    if args.reset and args.db == app_database_name():
+        raise SystemExit(f'{args.db} ist die Datenbank der Anwendung; --reset nur mit eigener --db.')
+    db.configure(database_config(args))
+    if args.reset and input(f'Datenbank {args.db} löschen? [j/N] ').strip().lower() != 'j':
+        raise SystemExit(1)
+    if not args.reset and users_collection.find_one({'username': ADMIN_USERNAME}):
+        # Gleicher Startwert erzeugt gleiche Nutzernamen; ein zweiter Lauf würde am Unique-Index scheitern
+        raise SystemExit('Es gibt bereits synthetische Daten, bitte mit --reset neu erzeugen.')
+
+    timings = seed(args.authors, args.books, args.users, args.loans, args.zipf, args.open, args.overdue,
+                   args.history_days, args.batch_size, args.seed, args.reset)
+    for step, seconds in timings.items():
+        print(f'{step:<18} {seconds:8.2f} s')
+    print(f"Anmeldung für Benchmarks: {ADMIN_USERNAME} / {PASSWORD}")
+
+if __name__ == '__main__':
+    main()
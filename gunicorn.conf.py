@@ -0,0 +1,21 @@
+# gunicorn.conf.py
+# Beispielkonfiguration für den Betrieb mit gunicorn: gunicorn -c gunicorn.conf.py run:app
+# Mit preload_app lädt der Master die App einmal; jeder Worker baut nach dem fork seinen
+# eigenen MongoClient auf (siehe library_app/db.py) und wärmt ihn vor der ersten Anfrage auf.
+# Verbindungen zum Server: höchstens workers x MONGO_MAX_POOL_SIZE.
+
+import os
+
+from pymongo.errors import PyMongoError
+
+bind = os.environ.get('BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+preload_app = True
+
+def post_worker_init(worker):
+    from library_app.db import warm_up
+    try:
+        warm_up()
+    except PyMongoError as error:
+        # Ohne erreichbaren Server trotzdem starten; der erste Zugriff versucht es erneut
+        worker.log.warning('MongoDB-Verbindung konnte nicht aufgewärmt werden: %s', error)
@@ -6,16 +6,129 @@ import datetime
 
 from flask import Flask
 from flask_login import LoginManager
+from pymongo.errors import PyMongoError
 
-from .models import load_user_for_login
+from . import admission, author_jobs, circulation, db, metrics, read_routing
+from .async_db import async_runner
+from .author_index import author_index
+from .commands import register_commands
+from .decorators import current_role
+from .indexes import init_db
+from .models import load_user_for_login, user_cache
+from .reports import report_engine
+from .versions import flush_writes
 from .routes import main, auth, books, authors, users, api 
 
-def create_app():
+def create_app(test_config=None):
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_mapping(
         SECRET_KEY=os.urandom(24),
+        # MongoDB-Verbindung (alle Schlüssel siehe db.DEFAULT_SETTINGS). Jeder Prozess hat einen
+        # eigenen Pool: höchstens Worker-Prozesse x MONGO_MAX_POOL_SIZE Verbindungen zum Server
+        **db.DEFAULT_SETTINGS,
+        # Lese-Routing: Lesepräferenz pro Arbeitslast und Endpunkte (auch Muster) je Arbeitslast.
+        # Nicht zugeordnete Endpunkte, CLI-Befehle und Hintergrundaufträge lesen vom Primary.
+        READ_PREFERENCES={
+            'analytics': {'mode': 'secondaryPreferred', 'max_staleness': 120},
+            'lists': {'mode': 'secondaryPreferred', 'max_staleness': 120},
+        },
+        READ_ROUTES={
+            'main.reports': 'analytics',
+            'main.export_*': 'analytics',
+            'books.list_books': 'lists',
+            'authors.list_authors': 'lists',
+            'users.list_users': 'lists',
+            'users.view_user_loans': 'lists',
+        },
+        # Nach eigenen Schreibzugriffen liest eine Sitzung so viele Sekunden nur vom Primary
+        READ_YOUR_WRITES_SECONDS=120,
+        # Unabhängige Leseabfragen (Berichte, Ranglisten, Ausleihen mit Archiv) gleichzeitig über den
+        # AsyncMongoClient ausführen; Wartezeit einer Anfrage darauf in Sekunden
+        ASYNC_DB=False,
+        ASYNC_DB_TIMEOUT=30,
+        # Zulassungskontrolle pro Worker-Prozess: gleichzeitige Anfragen je Lastklasse, Wartezeit auf
+        # einen Platz (Sekunden), danach 503 mit Retry-After. Endpunkte mit '?parameter' zählen nur,
+        # wenn der Parameter gesetzt ist (Suche in den Listen).
+        ADMISSION_CLASSES={
+            'exports': {'limit': 2, 'queue_timeout': 10},
+            'reports': {'limit': 2, 'queue_timeout': 10},
+            'search': {'limit': 8, 'queue_timeout': 2},
+            'autocomplete': {'limit': 8, 'queue_timeout': 0.5, 'max_queue': 16},
+        },
+        ADMISSION_ROUTES={
+            'main.export_*': 'exports',
+            'main.reports': 'reports',
+            'books.list_books?search': 'search',
+            'authors.list_authors?search': 'search',
+            'users.list_users?search': 'search',
+            'api.search_authors': 'autocomplete',
+        },
+        # Anfragen pro Sekunde und Nutzer (Token-Bucket mit Spitzen bis burst), darüber 429
+        RATE_LIMITS={
+            'api.search_authors': {'rate': 5, 'burst': 20},
+        },
+        # Indizes und Migrationen beim Start anwenden (alternativ: flask --app run init-db)
+        AUTO_MIGRATE=True,
+        # Seitengröße der Listenansichten (über ?per_page= bis MAX_PAGE_SIZE änderbar)
+        PAGE_SIZE=50,
+        MAX_PAGE_SIZE=200,
+        # Maximales Alter des Präfix-Index für die Autoren-Autovervollständigung (Sekunden)
+        AUTHOR_INDEX_TTL=60,
+        # CSV-Exporte: Cursor-Batchgröße, Zeilen pro gestreamtem Block, gzip bei Accept-Encoding
+        EXPORT_BATCH_SIZE=1000,
+        EXPORT_CHUNK_ROWS=500,
+        EXPORT_GZIP=True,
+        # Berichte: Cache-Dauer (Sekunden) und maximale Zeilen pro zwischengespeichertem Bericht
+        REPORT_CACHE_TTL=60,
+        REPORT_CACHE_ROWS=1000,
+        # Ausleihe/Rückgabe in Transaktionen ausführen (nur mit Replica Set möglich)
+        CIRCULATION_TRANSACTIONS=False,
+        # Maximale Anzahl gescannter Einträge pro Sammel-Ausleihe/-Rückgabe
+        CIRCULATION_BATCH_LIMIT=100,
+        # Prozesslokaler Cache der angemeldeten Benutzer (Anzahl Einträge, Gültigkeit in Sekunden).
+        # Die TTL begrenzt auch, wie lange andere Worker eine geänderte Rolle noch anwenden.
+        USER_CACHE_SIZE=1024,
+        USER_CACHE_TTL=60,
+        # Erinnerungen: 'file' (JSON-Zeilen in REMINDER_FILE) oder 'smtp' (z.B. lokaler Debug-Server)
+        REMINDER_SENDER='file',
+        REMINDER_FILE=os.path.join(app.instance_path, 'reminders.log'),
+        REMINDER_SMTP_HOST='localhost',
+        REMINDER_SMTP_PORT=1025,
+        REMINDER_MAIL_FROM='bibliothek@localhost',
+        REMINDER_MAIL_DOMAIN='localhost',
+        # Datensätze pro bulk_write beim Datei-Import
+        IMPORT_BATCH_SIZE=1000,
+        # Autoren umbenennen/löschen: Bücher pro Stapel; mit False übernimmt nur `flask author-jobs`,
+        # sonst auch ein Thread pro Worker-Prozess (setzt abgebrochene Aufträge fort)
+        AUTHOR_JOB_BATCH_SIZE=500,
+        AUTHOR_JOBS_IN_PROCESS=True,
+        # Zurückgegebene Ausleihen nach so vielen Tagen ins Archiv verschieben (flask archive-loans)
+        LOAN_ARCHIVE_AFTER_DAYS=180,
+        # Ausleih-Rollups: /reports aktualisiert sie selbst, wenn sie älter als so viele Sekunden sind
+        LOAN_ROLLUP_REFRESH=300,
+        # Prometheus-Endpunkt /metrics (für Administratoren oder mit "Authorization: Bearer METRICS_TOKEN");
+        # MongoDB-Befehle ab SLOW_QUERY_MS werden mit Route und ohne Werte geloggt (None: aus)
+        METRICS_ENABLED=True,
+        METRICS_TOKEN=None,
+        SLOW_QUERY_MS=100,
     )
 
+    # Optionale Konfiguration aus instance/config.py oder direkt übergeben (z.B. für Tests)
+    if test_config is None:
+        app.config.from_pyfile('config.py', silent=True)
+    else:
+        app.config.from_mapping(test_config)
+
+    # Der Client selbst entsteht erst beim ersten Datenbankzugriff dieses Prozesses
+    db.configure(app.config)
+    author_index.ttl = app.config['AUTHOR_INDEX_TTL']
+    report_engine.ttl = app.config['REPORT_CACHE_TTL']
+    report_engine.row_limit = app.config['REPORT_CACHE_ROWS']
+    circulation.use_transactions = app.config['CIRCULATION_TRANSACTIONS']
+    async_runner.configure(app.config['ASYNC_DB'], app.config['ASYNC_DB_TIMEOUT'])
+    user_cache.max_size = app.config['USER_CACHE_SIZE']
+    user_cache.ttl = app.config['USER_CACHE_TTL']
+
     # Login Manager initialisieren
     login_manager = LoginManager()
     login_manager.init_app(app)
@@ -40,5 +153,43 @@ def create_app():
     app.register_blueprint(authors.authors_bp)
     app.register_blueprint(users.users_bp)
     app.register_blueprint(api.api_bp)
+
+    # Versionsstempel der beschriebenen Collections erhöhen, bevor die Antwort gesendet wird;
+    # teardown_appcontext deckt Fehler, CLI-Befehle und Hintergrund-Threads ab
+    @app.after_request
+    def bump_versions(response):
+        if flush_writes():
+            read_routing.note_write()
+        return response
+
+    @app.teardown_appcontext
+    def bump_versions_on_teardown(exception=None):
+        try:
+            flush_writes()
+        except PyMongoError as error:
+            app.logger.warning('Versionsstempel konnten nicht erhöht werden: %s', error)
+
+    register_commands(app)
+    read_routing.init_app(app)
+    if app.config['AUTHOR_JOBS_IN_PROCESS']:
+        author_jobs.init_app(app)
+
+    if app.config['METRICS_ENABLED']:
+        metrics.init_app(app, is_admin=lambda: current_role() == 'admin')
+
+    # Nach den Metriken registriert, damit Wartezeiten und Ablehnungen in den Antwortzeiten erscheinen
+    admission.init_app(app)
+
+    if app.config['AUTO_MIGRATE']:
+        try:
+            result = init_db()
+            created = [f"{e['collection']}.{e['index']}" for e in result['indexes'] if e['status'] == 'created']
+            failed = [f"{e['collection']}.{e['index']}" for e in result['indexes'] if e['status'] == 'failed']
+            if created:
+                app.logger.info('Indizes angelegt: %s', ', '.join(created))
+            if failed:
+                app.logger.warning('Indizes konnten nicht angelegt werden: %s', ', '.join(failed))
+        except PyMongoError as error:
+            app.logger.warning('Datenbank-Migration beim Start fehlgeschlagen: %s', error)
     
     return app
\ No newline at end of file
@@ -0,0 +1,167 @@
+# library_app/admission.py
+# Zulassungskontrolle für teure Endpunkte. Pro Lastklasse (Exporte, Berichte, Suche,
+# Autovervollständigung) laufen höchstens `limit` Anfragen gleichzeitig; weitere warten bis zu
+# `queue_timeout` Sekunden auf einen freien Platz und erhalten sonst 503 mit Retry-After.
+# Zusätzlich begrenzt ein Token-Bucket pro Nutzer einzelne Endpunkte (429). Die Grenzen
+# gelten pro Worker-Prozess; Ausleihe und Rückgabe sind keiner Klasse zugeordnet und finden
+# so auch unter Last freie Datenbankverbindungen.
+
+import fnmatch
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, jsonify, make_response, request
+from flask_login import current_user
+
+from .decorators import current_role
+from .metrics import admission_in_flight, admission_queued, admission_rejected, admission_wait, rate_limited
+
+class AdmissionClass:
+    def __init__(self, name, limit, queue_timeout=0, max_queue=None, retry_after=None):
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        # Höchstzahl wartender Anfragen; None: nur durch queue_timeout begrenzt
+        self.max_queue = max_queue
+        self.retry_after = retry_after or max(1, math.ceil(queue_timeout))
+        self.queued = 0
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Liefert None, sobald ein Platz belegt ist, sonst den Grund der Ablehnung
+        started = time.perf_counter()
+        if not self._semaphore.acquire(blocking=False):
+            with self._lock:
+                if self.max_queue is not None and self.queued >= self.max_queue:
+                    return 'queue_full'
+                self.queued += 1
+            admission_queued.inc(self.name)
+            try:
+                acquired = self.queue_timeout > 0 and self._semaphore.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self.queued -= 1
+                admission_queued.dec(self.name)
+            if not acquired:
+                return 'timeout'
+        admission_wait.observe(time.perf_counter() - started, self.name)
+        admission_in_flight.inc(self.name)
+        return None
+
+    def release(self):
+        admission_in_flight.dec(self.name)
+        self._semaphore.release()
+
+class RateLimit:
+    # Token-Bucket pro Schlüssel: im Mittel `rate` Anfragen pro Sekunde, kurzzeitig bis `burst`
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # Schlüssel -> (Tokens, Zeitpunkt); die am längsten unbenutzten fallen zuerst heraus
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key):
+        # Liefert 0, wenn die Anfrage erlaubt ist, sonst die Sekunden bis zum nächsten Token
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / self.rate
+            if not wait:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+def _match(patterns, endpoint, args):
+    # Muster wie 'main.export_*'; 'books.list_books?search' gilt nur mit gesetztem Parameter
+    for pattern, value in patterns.items():
+        pattern, _, parameter = pattern.partition('?')
+        if fnmatch.fnmatchcase(endpoint, pattern) and (not parameter or args.get(parameter)):
+            return value
+    return None
+
+class AdmissionControl:
+    def __init__(self):
+        self.classes = {}
+        # Endpunkt-Muster -> Name der Lastklasse
+        self.routes = {}
+        # Endpunkt-Muster -> RateLimit
+        self.rate_limits = {}
+
+    def configure(self, classes, routes, rate_limits):
+        self.classes = {name: AdmissionClass(name, **options) for name, options in classes.items()}
+        self.routes = dict(routes)
+        self.rate_limits = {pattern: RateLimit(**options) for pattern, options in rate_limits.items()}
+
+    def class_for(self, endpoint, args):
+        return self.classes.get(_match(self.routes, endpoint, args))
+
+    def rate_limit_for(self, endpoint, args):
+        return _match(self.rate_limits, endpoint, args)
+
+admission = AdmissionControl()
+
+def _reject(status, message, retry_after):
+    response = jsonify({'error': message}) if request.blueprint == 'api' else make_response(message)
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def init_app(app):
+    admission.configure(app.config['ADMISSION_CLASSES'], app.config['ADMISSION_ROUTES'], app.config['RATE_LIMITS'])
+
+    @app.before_request
+    def admit_request():
+        endpoint = request.endpoint
+        if endpoint is None:
+            return None
+
+        rate_limit = admission.rate_limit_for(endpoint, request.args)
+        if rate_limit is not None:
+            key = current_user.get_id() if current_user.is_authenticated else request.remote_addr
+            wait = rate_limit.hit(key)
+            if wait:
+                rate_limited.inc(endpoint)
+                return _reject(429, 'Zu viele Anfragen, bitte kurz warten.', math.ceil(wait))
+
+        admission_class = admission.class_for(endpoint, request.args)
+        if admission_class is not None:
+            # Der Hook läuft vor login_required und den Rollen-Decorators der View. Anfragen, die
+            # die View ohnehin abweist, belegen keinen Platz und antworten dort mit 401/Weiterleitung.
+            allowed_roles = getattr(current_app.view_functions.get(endpoint), 'allowed_roles', None)
+            if not current_user.is_authenticated or (allowed_roles is not None
+                                                     and current_role() not in allowed_roles):
+                return None
+            reason = admission_class.acquire()
+            if reason:
+                admission_rejected.inc(admission_class.name, reason)
+                return _reject(503, 'Der Server ist gerade ausgelastet, bitte gleich erneut versuchen.',
+                               admission_class.retry_after)
+            g.admission_class = admission_class
+        return None
+
+    @app.after_request
+    def release_admission_slot(response):
+        # Gestreamte Exporte lesen noch während des Sendens aus der Datenbank und geben ihren
+        # Platz erst frei, wenn der Server die Antwort schließt
+        admission_class = g.pop('admission_class', None)
+        if admission_class is not None:
+            if response.is_streamed:
+                response.call_on_close(admission_class.release)
+            else:
+                admission_class.release()
+        return response
+
+    @app.teardown_request
+    def release_admission(exception=None):
+        # Ohne Antwort (unbehandelter Fehler) sofort freigeben
+        admission_class = g.pop('admission_class', None)
+        if admission_class is not None:
+            admission_class.release()
@@ -0,0 +1,117 @@
+# library_app/async_db.py
+# Optionaler asynchroner Datenzugriff (ASYNC_DB) über den AsyncMongoClient von pymongo.
+# Pro Prozess läuft ein Ereignis-Loop in einem Hintergrund-Thread mit eigenem Client. Views
+# beschreiben unabhängige Leseabfragen als Query und übergeben sie gesammelt an fetch_all();
+# mit ASYNC_DB laufen sie gleichzeitig, sonst (oder ohne passende pymongo-Version) wie bisher
+# nacheinander über die Collections aus db.py. Schreibzugriffe bleiben synchron.
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+
+from . import db
+from .metrics import command_metrics, pool_metrics
+from .read_routing import read_router
+
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:
+    # pymongo vor 4.10: ASYNC_DB wird ignoriert
+    AsyncMongoClient = None
+
+logger = logging.getLogger(__name__)
+
+class Query:
+    # Eine Leseabfrage: find (Liste), aggregate (Liste), find_one oder count_documents auf
+    # einer Collection aus db.py, mit denselben Argumenten wie bei pymongo
+    METHODS = ('find', 'aggregate', 'find_one', 'count_documents')
+
+    def __init__(self, collection, method, *args, **kwargs):
+        if method not in self.METHODS:
+            raise ValueError(f'Nicht unterstützte Abfrage: {method}')
+        self.collection = collection
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        result = getattr(self.collection, self.method)(*self.args, **self.kwargs)
+        return list(result) if self.method in ('find', 'aggregate') else result
+
+    async def run_async(self, database, preference):
+        collection = database[self.collection.name]
+        if preference is not None:
+            collection = collection.with_options(read_preference=preference)
+        if self.method == 'find':
+            return await collection.find(*self.args, **self.kwargs).to_list()
+        if self.method == 'aggregate':
+            cursor = await collection.aggregate(*self.args, **self.kwargs)
+            return await cursor.to_list()
+        return await getattr(collection, self.method)(*self.args, **self.kwargs)
+
+class AsyncRunner:
+    def __init__(self):
+        self.enabled = False
+        # Maximale Wartezeit einer View auf fetch_all (Sekunden)
+        self.timeout = 30
+        self._loop = None
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def configure(self, enabled, timeout):
+        if enabled and AsyncMongoClient is None:
+            logger.warning('ASYNC_DB benötigt pymongo mit AsyncMongoClient (ab 4.10); Abfragen laufen nacheinander.')
+        self.enabled = bool(enabled) and AsyncMongoClient is not None
+        self.timeout = timeout
+
+    async def _create_client(self):
+        # Im Loop erzeugen, damit der Client an diesen Loop gebunden ist. Der Listener für
+        # Schreibzugriffe fehlt absichtlich, über diesen Client wird nur gelesen.
+        return AsyncMongoClient(db.settings['MONGO_URI'], tz_aware=True,
+                                event_listeners=[command_metrics, pool_metrics],
+                                **db.client_options(db.settings))
+
+    def _ensure_started(self):
+        # Einmal pro Prozess; nach einem fork existiert der Thread des Elternprozesses nicht mehr
+        pid = os.getpid()
+        if self._loop is not None and self._pid == pid:
+            return self._loop
+        with self._lock:
+            if self._loop is None or self._pid != pid:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='async-db', daemon=True).start()
+                self._client = asyncio.run_coroutine_threadsafe(self._create_client(), loop).result()
+                self._loop, self._pid = loop, pid
+            return self._loop
+
+    def reset_after_fork(self):
+        self._loop = self._client = self._pid = None
+        self._lock = threading.Lock()
+
+    async def _gather(self, queries, preference):
+        database = self._client[db.settings['MONGO_DB_NAME']]
+        return await asyncio.gather(*(query.run_async(database, preference) for query in queries))
+
+    def fetch_all(self, queries):
+        if not self.enabled or len(queries) < 2:
+            return [query.run() for query in queries]
+        loop = self._ensure_started()
+        # Die Lesepräferenz hängt an der aktuellen Anfrage und wird daher hier bestimmt
+        future = asyncio.run_coroutine_threadsafe(self._gather(queries, read_router.current_preference()), loop)
+        try:
+            return future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+async_runner = AsyncRunner()
+
+def fetch_all(queries):
+    # Ergebnisse in der Reihenfolge der Abfragen
+    return async_runner.fetch_all(list(queries))
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=async_runner.reset_after_fork)
@@ -0,0 +1,72 @@
+# library_app/author_index.py
+# Prozesslokaler Präfix-Index der Autorennamen für die Autovervollständigung.
+# Die Namen liegen normalisiert in einer sortierten Liste, gesucht wird per Binärsuche.
+
+import bisect
+import threading
+import time
+
+from .db import authors_collection
+from .search import normalize
+
+class AuthorPrefixIndex:
+    def __init__(self, ttl=60):
+        # ttl: Sicherheitsnetz für Änderungen aus anderen Worker-Prozessen (Sekunden)
+        self.ttl = ttl
+        self._entries = ([], [])
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def add(self, name):
+        # Neuen Namen einfügen, ohne den Index komplett neu zu laden (no-op, falls vorhanden)
+        if self._loaded_at is None or not name:
+            return
+        with self._lock:
+            keys, names = list(self._entries[0]), list(self._entries[1])
+            key = normalize(name)
+            position = bisect.bisect_left(keys, key)
+            while position < len(keys) and keys[position] == key:
+                if names[position] == name:
+                    return
+                position += 1
+            keys.insert(position, key)
+            names.insert(position, name)
+            self._entries = (keys, names)
+
+    def _load(self):
+        entries = sorted(
+            (normalize(author['name']), author['name'])
+            for author in authors_collection.find({}, {'name': 1, '_id': 0})
+            if author.get('name')
+        )
+        # Beide Listen als ein Tupel ersetzen, damit Leser nie einen halben Stand sehen
+        self._entries = ([key for key, _ in entries], [name for _, name in entries])
+        self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+                self._load()
+
+    def search(self, prefix, limit=10):
+        key = normalize(prefix)
+        if not key:
+            return []
+
+        self._ensure_loaded()
+        keys, names = self._entries
+        start = bisect.bisect_left(keys, key)
+        results = []
+
+        for position in range(start, len(keys)):
+            if len(results) >= limit or not keys[position].startswith(key):
+                break
+            results.append(names[position])
+        return results
+
+author_index = AuthorPrefixIndex()
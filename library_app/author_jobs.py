@@ -0,0 +1,228 @@
+# library_app/author_jobs.py
+# Hintergrundaufträge für Autoren: Umbenennen (denormalisierter Autorenname der Bücher) und
+# Löschen (Bücher samt offenen Ausleihen). Bücher werden stapelweise in _id-Reihenfolge
+# bearbeitet; nach jedem Stapel wird der Fortschritt gespeichert, sodass ein abgebrochener
+# Auftrag an derselben Stelle fortgesetzt werden kann. Beim Löschen geschlossene Ausleihen
+# tragen `closed_by_job`: ihr return_date ist keine Rückgabe durch den Nutzer.
+
+import datetime
+import os
+import threading
+import time
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import PyMongoError
+
+from .db import db, authors_collection, books_collection, users_collection, loans_collection, loans_archive_collection
+from .reports import report_engine
+from .search import BOOK_SEARCH, search_fields
+from .versions import flush_writes
+
+jobs_collection = db['author_jobs']
+
+# Ein laufender Auftrag gilt nach Ablauf der Sperre als abgebrochen und wird neu übernommen
+LEASE = datetime.timedelta(minutes=5)
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def enqueue(kind, author_id, author_name):
+    # kind: 'rename' oder 'delete'; liefert die ID des neuen Auftrags
+    now = _now()
+    job = {
+        'kind': kind,
+        'author_id': author_id,
+        'author_name': author_name,
+        'status': 'pending',
+        'last_id': None,
+        'books_total': books_collection.count_documents({'author_id': author_id}),
+        'books_done': 0,
+        'loans_updated': 0,
+        'loans_closed': 0,
+        'created_at': now,
+        'updated_at': now,
+        'lease_until': None
+    }
+    return jobs_collection.insert_one(job).inserted_id
+
+def _claim(query):
+    now = _now()
+    return jobs_collection.find_one_and_update(
+        {'$and': [query, {'$or': [
+            {'status': 'pending'},
+            {'status': 'running', 'lease_until': {'$lt': now}}
+        ]}]},
+        {'$set': {'status': 'running', 'lease_until': now + LEASE, 'updated_at': now}},
+        sort=[('created_at', ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def _next_books(job, projection, batch_size):
+    query = {'author_id': job['author_id']}
+    if job['last_id'] is not None:
+        query['_id'] = {'$gt': job['last_id']}
+    return list(books_collection.find(query, projection).sort('_id', ASCENDING).limit(batch_size))
+
+def _rename_batch(job, books):
+    # Der Name wird bei jedem Stapel neu gelesen; mehrere Umbenennungen laufen so auf den letzten Stand zu
+    author = authors_collection.find_one({'_id': job['author_id']}, {'name': 1})
+    if author is None:
+        # Autor inzwischen gelöscht: die Bücher übernimmt der Lösch-Auftrag
+        return None
+    updates = []
+    for book in books:
+        book['author_name'] = author['name']
+        changes = {'author_name': author['name']}
+        changes.update(search_fields(BOOK_SEARCH, book))
+        updates.append(UpdateOne({'_id': book['_id']}, {'$set': changes}))
+    books_collection.bulk_write(updates, ordered=False)
+    return {}
+
+def _delete_batch(job, books, now):
+    # Ausleihen behalten den Buchtitel als Kopie; offene Ausleihen werden geschlossen und die
+    # Zähler der Nutzer angepasst. Bricht der Lauf zwischen den Schritten ab, gleicht
+    # `flask rebuild-loan-stats` die Zähler wieder aus.
+    book_ids = [book['_id'] for book in books]
+    detached = 0
+    for collection in (loans_collection, loans_archive_collection):
+        detached += collection.bulk_write([
+            UpdateMany({'book_id': book['_id']}, {'$set': {'book_title': book.get('title'), 'book_deleted': True}})
+            for book in books
+        ], ordered=False).modified_count
+
+    per_user = {}
+    for loan in loans_collection.find({'book_id': {'$in': book_ids}, 'return_date': None}, {'user_id': 1}):
+        per_user[loan['user_id']] = per_user.get(loan['user_id'], 0) + 1
+    closed = 0
+    if per_user:
+        closed = loans_collection.update_many(
+            {'book_id': {'$in': book_ids}, 'return_date': None},
+            {'$set': {'return_date': now, 'closed_by_job': job['_id']}}
+        ).modified_count
+        users_collection.bulk_write([
+            UpdateOne({'_id': user_id}, {'$inc': {'active_loans': -count}})
+            for user_id, count in per_user.items()
+        ], ordered=False)
+
+    books_collection.delete_many({'_id': {'$in': book_ids}})
+    return {'loans_updated': detached, 'loans_closed': closed}
+
+def run_job(job, batch_size=500):
+    # Bearbeitet einen bereits übernommenen Auftrag bis zum Ende
+    projection = {'title': 1, 'isbn': 1} if job['kind'] == 'rename' else {'title': 1}
+
+    try:
+        while True:
+            books = _next_books(job, projection, batch_size)
+            if not books:
+                break
+            now = _now()
+            if job['kind'] == 'rename':
+                counts = _rename_batch(job, books)
+                if counts is None:
+                    break
+            else:
+                counts = _delete_batch(job, books, now)
+
+            job['last_id'] = books[-1]['_id']
+            increments = dict(counts, books_done=len(books))
+            jobs_collection.update_one(
+                {'_id': job['_id']},
+                {'$set': {'last_id': job['last_id'], 'updated_at': now, 'lease_until': now + LEASE},
+                 '$inc': increments}
+            )
+            # Listen und Exporte sehen die Änderungen schon während des Auftrags
+            flush_writes()
+    except Exception as error:
+        # Sperre freigeben, damit der nächste Lauf den Auftrag sofort fortsetzt
+        jobs_collection.update_one(
+            {'_id': job['_id']},
+            {'$set': {'status': 'pending', 'error': str(error), 'lease_until': None, 'updated_at': _now()}}
+        )
+        raise
+
+    jobs_collection.update_one(
+        {'_id': job['_id']},
+        {'$set': {'status': 'done', 'finished_at': _now(), 'lease_until': None}, '$unset': {'error': ''}}
+    )
+    report_engine.invalidate()
+    return jobs_collection.find_one({'_id': job['_id']})
+
+def run_pending(batch_size=500, job_id=None):
+    # Übernimmt ausstehende oder abgebrochene Aufträge nacheinander; liefert die erledigten Aufträge
+    finished = []
+    while True:
+        job = _claim({'_id': job_id} if job_id is not None else {})
+        if job is None:
+            return finished
+        finished.append(run_job(job, batch_size))
+        if job_id is not None:
+            return finished
+
+def start_in_background(app, job_id):
+    # Bearbeitet den Auftrag in einem Thread des Webprozesses; übernimmt ihn der Worker
+    # (`flask author-jobs`) zuerst, findet der Thread nichts mehr zu tun.
+    def work():
+        with app.app_context():
+            try:
+                run_pending(app.config.get('AUTHOR_JOB_BATCH_SIZE', 500), job_id=job_id)
+            except PyMongoError as error:
+                app.logger.warning('Autoren-Auftrag %s abgebrochen: %s', job_id, error)
+            except Exception:
+                app.logger.exception('Autoren-Auftrag %s abgebrochen', job_id)
+
+    thread = threading.Thread(target=work, name=f'author-job-{job_id}', daemon=True)
+    thread.start()
+    return thread
+
+_resumer_pid = None
+_resumer_lock = threading.Lock()
+
+def _resume_loop(app):
+    # Übernimmt liegengebliebene Aufträge, z.B. nach einem Neustart mitten im Auftrag; ein
+    # abgebrochener Auftrag wird frei, sobald seine Sperre (LEASE) abgelaufen ist
+    while True:
+        with app.app_context():
+            try:
+                run_pending(app.config.get('AUTHOR_JOB_BATCH_SIZE', 500))
+            except Exception:
+                app.logger.exception('Autoren-Aufträge konnten nicht fortgesetzt werden')
+        time.sleep(LEASE.total_seconds())
+
+def init_app(app):
+    # Mit AUTHOR_JOBS_IN_PROCESS: ein Thread pro Prozess setzt abgebrochene Aufträge fort. Er startet
+    # mit der ersten Anfrage, damit er nach dem fork im Worker-Prozess läuft.
+    @app.before_request
+    def resume_author_jobs():
+        global _resumer_pid
+        pid = os.getpid()
+        if _resumer_pid == pid:
+            return
+        with _resumer_lock:
+            if _resumer_pid != pid:
+                _resumer_pid = pid
+                threading.Thread(target=_resume_loop, args=(app,), name='author-job-resumer', daemon=True).start()
+
+def get_job(job_id):
+    if not ObjectId.is_valid(job_id):
+        return None
+    return jobs_collection.find_one({'_id': ObjectId(job_id)})
+
+def recent_jobs(limit=5):
+    return list(jobs_collection.find().sort('created_at', DESCENDING).limit(limit))
+
+def job_status(job):
+    return {
+        'id': str(job['_id']),
+        'kind': job['kind'],
+        'author_name': job['author_name'],
+        'status': job['status'],
+        'books_total': job['books_total'],
+        'books_done': job['books_done'],
+        'loans_updated': job['loans_updated'],
+        'loans_closed': job['loans_closed'],
+        'created_at': job['created_at'].isoformat(),
+        'finished_at': job['finished_at'].isoformat() if job.get('finished_at') else None,
+        'error': job.get('error')
+    }
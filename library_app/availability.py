@@ -0,0 +1,163 @@
+# library_app/availability.py
+# Abgleich von available_copies mit den offenen Ausleihen. Die Verfügbarkeit wird bei Ausleihe
+# und Rückgabe per $inc fortgeschrieben; Abbrüche zwischen Ausleih- und Buch-Update oder das
+# Löschen von Büchern mit offenen Ausleihen lassen sie auseinanderlaufen. Ein Lauf zählt die
+# offenen Ausleihen pro Buch in einer Aggregation, vergleicht sie mit total_copies -
+# available_copies und korrigiert Abweichungen stapelweise. Inkrementelle Läufe prüfen nur
+# Bücher mit Ausleihen, Rückgaben oder geändertem Bestand (updated_at) seit dem letzten Lauf.
+# Offene Ausleihen gelöschter Bücher findet nur ein vollständiger Lauf (--full), der daher
+# regelmäßig, z.B. nächtlich, eingeplant werden sollte.
+
+import datetime
+
+from pymongo import UpdateOne
+
+from .db import db, books_collection, loans_collection
+
+scheduler_state_collection = db['scheduler_state']
+
+STATE_ID = 'availability'
+
+# Bücher mit Ausleihen oder Rückgaben in diesem Zeitraum werden nicht korrigiert: Ausleihe und
+# Rückgabe schreiben Ausleihe und Buch nacheinander, dazwischen stimmen die Zähler kurz nicht
+SETTLE_DELAY = datetime.timedelta(minutes=1)
+
+# Höchstens so viele Abweichungen und Buch-IDs ohne Dokument werden im Ergebnis aufgeführt
+SAMPLE_SIZE = 20
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def get_watermark():
+    state = scheduler_state_collection.find_one({'_id': STATE_ID})
+    if not state:
+        return None
+    watermark = state['watermark']
+    return watermark if watermark.tzinfo else watermark.replace(tzinfo=datetime.timezone.utc)
+
+def set_watermark(value):
+    scheduler_state_collection.update_one({'_id': STATE_ID}, {'$set': {'watermark': value}}, upsert=True)
+
+def _touched_since(since):
+    # Bücher mit neuen Ausleihen oder Rückgaben (Indizes loan_date und open_loans_due) oder mit
+    # geändertem Bestand (Index updated_at) seit `since`
+    pipeline = [
+        {'$match': {'$or': [{'loan_date': {'$gte': since}}, {'return_date': {'$gte': since}}]}},
+        {'$group': {'_id': '$book_id'}}
+    ]
+    book_ids = {row['_id'] for row in loans_collection.aggregate(pipeline, allowDiskUse=True)}
+    book_ids.update(book['_id'] for book in books_collection.find({'updated_at': {'$gte': since}}, {'_id': 1}))
+    return list(book_ids)
+
+def open_loan_counts(book_ids=None):
+    # {book_id: offene Ausleihen} in einer Aggregation (Index book_open_loans bei book_ids)
+    match = {'return_date': None}
+    if book_ids is not None:
+        match['book_id'] = {'$in': list(book_ids)}
+    pipeline = [{'$match': match}, {'$group': {'_id': '$book_id', 'open': {'$sum': 1}}}]
+    return {row['_id']: row['open'] for row in loans_collection.aggregate(pipeline, allowDiskUse=True)}
+
+def _busy(book_ids, cutoff):
+    # Bücher mit Ausleihen oder Rückgaben nach `cutoff`; deren Zähler werden beim nächsten Lauf geprüft
+    pipeline = [
+        {'$match': {'book_id': {'$in': list(book_ids)},
+                    '$or': [{'loan_date': {'$gte': cutoff}}, {'return_date': {'$gte': cutoff}}]}},
+        {'$group': {'_id': '$book_id'}}
+    ]
+    return {row['_id'] for row in loans_collection.aggregate(pipeline)}
+
+def _settled(cutoff):
+    # Bücher ohne Ausleihe seit `cutoff`. Die Ausleihe verringert available_copies und setzt
+    # last_loan_date in derselben Anweisung, bevor die Ausleihe eingetragen wird.
+    return {'$or': [{'last_loan_date': {'$lt': cutoff}}, {'last_loan_date': None}]}
+
+def _verify_and_fix(candidates, now, dry_run):
+    # candidates: {book_id: gelesenes Buch}. Die offenen Ausleihen werden nach dem Lesen der Bücher
+    # erneut gezählt und erst danach die kürzlich geänderten Bücher bestimmt: Jede Ausleihe oder
+    # Rückgabe, die in die Zählung eingeflossen ist, taucht so auch in _busy auf. Das Update greift
+    # nur, wenn Bestand und Verfügbarkeit noch dem gelesenen Stand entsprechen, keine Sammel-Ausleihe
+    # läuft und seit `cutoff` nicht ausgeliehen wurde (Ausleihe noch nicht eingetragen).
+    cutoff = now - SETTLE_DELAY
+    counts = open_loan_counts(candidates)
+    busy = _busy(candidates, cutoff)
+    ids = [book_id for book_id in candidates if book_id not in busy]
+    operations, mismatches = [], []
+
+    for book_id in ids:
+        book = candidates[book_id]
+        open_loans = counts.get(book_id, 0)
+        total = book.get('total_copies', 0)
+        expected = max(total - open_loans, 0)
+        if expected == book.get('available_copies'):
+            continue
+        mismatches.append({'book_id': book_id, 'title': book.get('title'), 'total_copies': total,
+                           'available_copies': book.get('available_copies'), 'open_loans': open_loans,
+                           'expected': expected})
+        operations.append(UpdateOne(
+            {'_id': book_id, 'total_copies': total, 'available_copies': book.get('available_copies'),
+             'pending_checkouts.0': {'$exists': False}, **_settled(cutoff)},
+            {'$set': {'available_copies': expected, 'active_loans': open_loans}}
+        ))
+
+    fixed = 0
+    if operations and not dry_run:
+        fixed = books_collection.bulk_write(operations, ordered=False).modified_count
+    return mismatches, fixed, len(busy)
+
+def reconcile_availability(full=False, batch_size=1000, dry_run=False, now=None):
+    # Ohne Watermark oder mit full=True werden alle Bücher geprüft
+    now = now or _now()
+    watermark = None if full else get_watermark()
+    scope = None
+    if watermark is not None:
+        # Überlappung um SETTLE_DELAY, damit zuletzt übersprungene Bücher erneut geprüft werden
+        scope = _touched_since(watermark - SETTLE_DELAY)
+
+    result = {'full': scope is None, 'checked': 0, 'mismatched': 0, 'fixed': 0, 'skipped_busy': 0,
+              'overbooked': 0, 'orphaned_loans': 0, 'orphaned_books': [], 'mismatches': []}
+
+    if scope is None or scope:
+        counts = open_loan_counts(scope)
+        query = {} if scope is None else {'_id': {'$in': scope}}
+        books = books_collection.find(query, {'title': 1, 'total_copies': 1, 'available_copies': 1,
+                                              'pending_checkouts': 1, 'last_loan_date': 1}, batch_size=batch_size)
+        seen, candidates = set(), {}
+
+        for book in books:
+            seen.add(book['_id'])
+            result['checked'] += 1
+            total, open_loans = book.get('total_copies', 0), counts.get(book['_id'], 0)
+            if open_loans > total:
+                result['overbooked'] += 1
+            last_loan_date = book.get('last_loan_date')
+            if last_loan_date is not None and not last_loan_date.tzinfo:
+                last_loan_date = last_loan_date.replace(tzinfo=datetime.timezone.utc)
+            if book.get('pending_checkouts') or (last_loan_date is not None and last_loan_date >= now - SETTLE_DELAY):
+                result['skipped_busy'] += 1
+            elif max(total - open_loans, 0) != book.get('available_copies'):
+                candidates[book['_id']] = book
+            if len(candidates) >= batch_size:
+                _add_fixes(result, _verify_and_fix(candidates, now, dry_run))
+                candidates = {}
+        if candidates:
+            _add_fixes(result, _verify_and_fix(candidates, now, dry_run))
+
+        # Offene Ausleihen ohne Buch (z.B. gelöscht, während sie ausgeliehen waren); ein erneuter
+        # Blick in books schließt Bücher aus, die erst während des Laufs angelegt wurden
+        missing = [book_id for book_id in counts if book_id not in seen]
+        if missing:
+            existing = {book['_id'] for book in books_collection.find({'_id': {'$in': missing}}, {'_id': 1})}
+            orphaned = [book_id for book_id in missing if book_id not in existing]
+            result['orphaned_loans'] = sum(counts[book_id] for book_id in orphaned)
+            result['orphaned_books'] = orphaned[:SAMPLE_SIZE]
+
+    if not dry_run:
+        set_watermark(now)
+    return result
+
+def _add_fixes(result, outcome):
+    mismatches, fixed, busy = outcome
+    result['mismatched'] += len(mismatches)
+    result['fixed'] += fixed
+    result['skipped_busy'] += busy
+    result['mismatches'].extend(mismatches[:SAMPLE_SIZE - len(result['mismatches'])])
@@ -0,0 +1,236 @@
+# library_app/circulation.py
+# Ausleihe und Rückgabe als atomare Operationen. Die Verfügbarkeit wird in derselben
+# Anweisung geprüft und verringert (find_one_and_update mit available_copies > 0), sodass
+# gleichzeitige Ausleihen den Bestand nicht ins Negative treiben können.
+
+import datetime
+
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import PyMongoError
+
+from .db import client, books_collection, users_collection, loans_collection
+from .loan_stats import borrow_update, return_update, merge_updates
+from .search import normalize_isbn
+
+LOAN_PERIOD = datetime.timedelta(days=21)
+
+# Mit True laufen Buch-Update, Ausleih-Eintrag und Nutzerzähler in einer Transaktion (erfordert
+# Replica Set), sonst wird ein Fehler bei Eintrag oder Nutzerzähler durch eine Gegenbuchung ausgeglichen.
+use_transactions = False
+
+class CirculationError(Exception):
+    pass
+
+def _borrow(book_object_id, user_object_id, loan_date, session=None):
+    book = books_collection.find_one_and_update(
+        {'_id': book_object_id, 'available_copies': {'$gt': 0}},
+        merge_updates({'$inc': {'available_copies': -1}}, borrow_update(loan_date)),
+        projection={'title': 1},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    if book is None:
+        raise CirculationError('Dieses Buch ist leider nicht verfügbar oder alle Exemplare sind ausgeliehen.')
+
+    loan = {
+        'book_id': book_object_id, 'user_id': user_object_id,
+        'loan_date': loan_date, 'due_date': loan_date + LOAN_PERIOD, 'return_date': None
+    }
+    try:
+        loans_collection.insert_one(loan, session=session)
+        users_collection.update_one({'_id': user_object_id}, borrow_update(loan_date), session=session)
+    except PyMongoError:
+        if session is None:
+            # Gegenbuchung: Ausleihe entfernen (falls schon eingetragen), Exemplar und Zähler
+            # zurückgeben. last_loan_date bleibt stehen und verzögert nur den nächsten Abgleich.
+            if '_id' in loan:
+                loans_collection.delete_one({'_id': loan['_id']})
+            books_collection.update_one(
+                {'_id': book_object_id},
+                {'$inc': {'available_copies': 1, 'total_loans': -1, 'active_loans': -1}}
+            )
+        raise
+
+    return book, loan
+
+def borrow(book_id, user_id):
+    # Leiht ein Exemplar aus; liefert (Buch, Ausleihe) oder wirft CirculationError
+    book_object_id, user_object_id = ObjectId(book_id), ObjectId(user_id)
+    loan_date = datetime.datetime.now(datetime.timezone.utc)
+
+    if not use_transactions:
+        return _borrow(book_object_id, user_object_id, loan_date)
+
+    with client.start_session() as session:
+        return session.with_transaction(lambda s: _borrow(book_object_id, user_object_id, loan_date, session=s))
+
+def _return(loan_object_id, return_date, session=None):
+    # Das Setzen von return_date ist die Sperre: nur ein Aufruf findet die offene Ausleihe
+    loan = loans_collection.find_one_and_update(
+        {'_id': loan_object_id, 'return_date': None},
+        {'$set': {'return_date': return_date}},
+        projection={'book_id': 1, 'user_id': 1},
+        session=session
+    )
+    if loan is None:
+        raise CirculationError('Ausleihvorgang nicht gefunden oder bereits abgeschlossen.')
+
+    books_collection.update_one(
+        {'_id': loan['book_id']},
+        merge_updates({'$inc': {'available_copies': 1}}, return_update()),
+        session=session
+    )
+    users_collection.update_one({'_id': loan['user_id']}, return_update(), session=session)
+    return loan
+
+def return_loan(loan_id):
+    # Gibt eine offene Ausleihe zurück; liefert die Ausleihe oder wirft CirculationError
+    loan_object_id = ObjectId(loan_id)
+    return_date = datetime.datetime.now(datetime.timezone.utc)
+
+    if not use_transactions:
+        return _return(loan_object_id, return_date)
+
+    with client.start_session() as session:
+        return session.with_transaction(lambda s: _return(loan_object_id, return_date, session=s))
+
+def _resolve_books(identifiers, projection):
+    # Scanner liefern Buch-IDs oder ISBNs; beides wird mit einer Abfrage aufgelöst
+    object_ids = [ObjectId(identifier) for identifier in identifiers if ObjectId.is_valid(identifier)]
+    isbns = [normalize_isbn(identifier) for identifier in identifiers]
+    books = books_collection.find({'$or': [{'_id': {'$in': object_ids}}, {'isbn_normalized': {'$in': isbns}}]}, projection)
+
+    by_key = {}
+    for book in books:
+        by_key[str(book['_id'])] = book
+        if book.get('isbn_normalized'):
+            by_key.setdefault(book['isbn_normalized'], book)
+
+    return {identifier: by_key.get(identifier) or by_key.get(normalize_isbn(identifier)) for identifier in identifiers}
+
+def bulk_borrow(user_id, identifiers):
+    # Leiht mehrere Bücher für einen Nutzer aus und liefert ein Ergebnis pro gescanntem Eintrag.
+    # Jedes Exemplar wird einzeln atomar reserviert (available_copies > 0) und dabei mit der
+    # Vorgangs-ID markiert; eine Abfrage danach zeigt, wie viele Exemplare pro Buch erfolgreich waren.
+    user_object_id = ObjectId(user_id)
+    loan_date = datetime.datetime.now(datetime.timezone.utc)
+    batch_id = ObjectId()
+
+    books = _resolve_books(identifiers, {'title': 1, 'isbn_normalized': 1})
+    requested = [books[identifier]['_id'] for identifier in identifiers if books[identifier] is not None]
+
+    claimed = {}
+    if requested:
+        books_collection.bulk_write([
+            UpdateOne(
+                {'_id': book_id, 'available_copies': {'$gt': 0}},
+                merge_updates({'$inc': {'available_copies': -1}, '$push': {'pending_checkouts': batch_id}},
+                              borrow_update(loan_date))
+            )
+            for book_id in requested
+        ], ordered=False)
+        # pending_checkouts ist nicht indiziert; die bekannten Buch-IDs grenzen über _id ein
+        reserved = {'_id': {'$in': list(set(requested))}, 'pending_checkouts': batch_id}
+        for book in books_collection.find(reserved, {'pending_checkouts': 1}):
+            claimed[book['_id']] = book['pending_checkouts'].count(batch_id)
+        books_collection.update_many(reserved, {'$pull': {'pending_checkouts': batch_id}})
+
+    results, loans = [], []
+    for identifier in identifiers:
+        book = books[identifier]
+        if book is None:
+            results.append({'item': identifier, 'ok': False, 'error': 'Buch nicht gefunden.'})
+        elif not claimed.get(book['_id']):
+            results.append({'item': identifier, 'ok': False, 'error': 'Keine Exemplare mehr verfügbar.'})
+        else:
+            claimed[book['_id']] -= 1
+            loan = {
+                '_id': ObjectId(), 'book_id': book['_id'], 'user_id': user_object_id, 'checkout_batch': batch_id,
+                'loan_date': loan_date, 'due_date': loan_date + LOAN_PERIOD, 'return_date': None
+            }
+            loans.append(loan)
+            results.append({'item': identifier, 'ok': True, 'loan_id': str(loan['_id']), 'title': book.get('title'),
+                            'due_date': loan['due_date'].isoformat()})
+
+    if loans:
+        try:
+            loans_collection.insert_many(loans, ordered=False)
+            users_collection.update_one(
+                {'_id': user_object_id},
+                {'$inc': {'total_loans': len(loans), 'active_loans': len(loans)}, '$max': {'last_loan_date': loan_date}}
+            )
+        except PyMongoError:
+            # Gegenbuchung für alle reservierten Exemplare, Teilerfolge werden entfernt
+            loans_collection.delete_many({'_id': {'$in': [loan['_id'] for loan in loans]}, 'checkout_batch': batch_id})
+            per_book = {}
+            for loan in loans:
+                per_book[loan['book_id']] = per_book.get(loan['book_id'], 0) + 1
+            books_collection.bulk_write([
+                UpdateOne({'_id': book_id}, {'$inc': {'available_copies': count, 'total_loans': -count,
+                                                      'active_loans': -count}})
+                for book_id, count in per_book.items()
+            ], ordered=False)
+            raise
+
+    return results
+
+def bulk_return(user_id, identifiers):
+    # Gibt mehrere Ausleihen eines Nutzers zurück. Ein Eintrag ist eine Ausleih-ID oder eine
+    # Buch-ID/ISBN; bei Büchern wird die älteste noch nicht gewählte offene Ausleihe zurückgegeben.
+    user_object_id = ObjectId(user_id)
+    return_date = datetime.datetime.now(datetime.timezone.utc)
+    batch_id = ObjectId()
+
+    open_loans = list(loans_collection.find(
+        {'user_id': user_object_id, 'return_date': None}, {'book_id': 1}
+    ).sort('loan_date', 1))
+    loans_by_id = {str(loan['_id']): loan for loan in open_loans}
+
+    unresolved = [identifier for identifier in identifiers if identifier not in loans_by_id]
+    books = _resolve_books(unresolved, {'isbn_normalized': 1}) if unresolved else {}
+
+    # Zuordnung pro Position, damit doppelt gescannte Einträge nicht doppelt zählen
+    selected, chosen_ids = [], set()
+    for identifier in identifiers:
+        loan = loans_by_id.get(identifier)
+        if loan is None and books.get(identifier) is not None:
+            book_id = books[identifier]['_id']
+            loan = next((candidate for candidate in open_loans
+                         if candidate['book_id'] == book_id and candidate['_id'] not in chosen_ids), None)
+        if loan is not None and loan['_id'] in chosen_ids:
+            loan = None
+        if loan is not None:
+            chosen_ids.add(loan['_id'])
+        selected.append(loan)
+
+    returned = set()
+    if chosen_ids:
+        # Nur noch offene Ausleihen werden markiert; parallele Rückgaben zählen nicht doppelt
+        loans_collection.update_many(
+            {'_id': {'$in': list(chosen_ids)}, 'return_date': None},
+            {'$set': {'return_date': return_date, 'return_batch': batch_id}}
+        )
+        returned = {loan['_id'] for loan in loans_collection.find(
+            {'_id': {'$in': list(chosen_ids)}, 'return_batch': batch_id}, {'_id': 1}
+        )}
+
+    per_book = {}
+    results = []
+    for identifier, loan in zip(identifiers, selected):
+        if loan is None:
+            results.append({'item': identifier, 'ok': False, 'error': 'Keine offene Ausleihe gefunden.'})
+        elif loan['_id'] not in returned:
+            results.append({'item': identifier, 'ok': False, 'error': 'Ausleihe wurde bereits zurückgegeben.'})
+        else:
+            per_book[loan['book_id']] = per_book.get(loan['book_id'], 0) + 1
+            results.append({'item': identifier, 'ok': True, 'loan_id': str(loan['_id'])})
+
+    if per_book:
+        books_collection.bulk_write([
+            UpdateOne({'_id': book_id}, {'$inc': {'available_copies': count, 'active_loans': -count}})
+            for book_id, count in per_book.items()
+        ], ordered=False)
+        users_collection.update_one({'_id': user_object_id}, {'$inc': {'active_loans': -len(returned)}})
+
+    return results
@@ -0,0 +1,194 @@
+# library_app/commands.py
+# CLI-Befehle der Anwendung, die mit `flask --app run <befehl>` ausgeführt werden.
+
+import datetime
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from .author_jobs import run_pending
+from .availability import reconcile_availability
+from .importer import detect_format, import_stream
+from .indexes import init_db
+from .loan_archive import archive_returned_loans
+from .loan_rollups import rebuild_rollups, refresh_lease, update_rollups
+from .loan_stats import rebuild_loan_stats
+from .reminders import deliver_pending, scan, sender_from_config
+from .search import BOOK_SEARCH, AUTHOR_SEARCH, USER_SEARCH, reindex
+
+@click.command('init-db')
+@with_appcontext
+@click.option('--backfill', is_flag=True,
+              help='Danach Suchfelder, Ausleih-Zähler und Rollups des Bestands neu berechnen.')
+def init_db_command(backfill):
+    # Indizes anlegen und ausstehende Migrationen anwenden. Die Datenläufe über den Bestand laufen
+    # nicht beim Start der App, sondern nur hier mit --backfill (z.B. einmalig nach einem Upgrade).
+    result = init_db()
+
+    for migration in result['migrations']:
+        status = 'OK' if migration['ok'] else 'FEHLER'
+        click.echo(f"Migration {migration['version']} ({migration['description']}): {status}")
+
+    for entry in result['indexes']:
+        line = f"{entry['collection']}.{entry['index']}: {entry['status']}"
+        if 'error' in entry:
+            line += f" - {entry['error']}"
+        click.echo(line)
+
+    click.echo(f"Schema-Version: {result['schema_version']}")
+
+    if backfill:
+        for label, spec in (('Bücher', BOOK_SEARCH), ('Autoren', AUTHOR_SEARCH), ('Nutzer', USER_SEARCH)):
+            click.echo(f"Suchfelder {label}: {reindex(spec)} Dokumente aktualisiert")
+        stats = rebuild_loan_stats()
+        click.echo(f"Ausleih-Zähler: {stats['books']} Bücher, {stats['users']} Nutzer")
+        with refresh_lease() as claimed:
+            if claimed:
+                click.echo(f"Rollups: {rebuild_rollups()['written']} Einträge")
+            else:
+                click.echo('Rollups: übersprungen, ein anderer Lauf hält die Sperre')
+
+@click.command('reindex-search')
+@with_appcontext
+def reindex_search_command():
+    # Suchfelder aller Bücher, Autoren und Nutzer neu berechnen
+    for label, spec in (('Bücher', BOOK_SEARCH), ('Autoren', AUTHOR_SEARCH), ('Nutzer', USER_SEARCH)):
+        click.echo(f"{label}: {reindex(spec)} Dokumente aktualisiert")
+
+@click.command('rebuild-loan-stats')
+@with_appcontext
+@click.option('--batch-size', default=1000, show_default=True, help='Dokumente pro bulk_write.')
+def rebuild_loan_stats_command(batch_size):
+    # Ausleih-Zähler aller Bücher und Nutzer aus der Ausleihhistorie neu berechnen
+    result = rebuild_loan_stats(batch_size)
+    click.echo(f"Bücher aktualisiert: {result['books']}")
+    click.echo(f"Nutzer aktualisiert: {result['users']}")
+
+@click.command('reminders')
+@with_appcontext
+@click.option('--loop', is_flag=True, help='Als Worker dauerhaft laufen.')
+@click.option('--interval', default=300, show_default=True, help='Sekunden zwischen zwei Läufen.')
+@click.option('--soon-days', default=2, show_default=True, help='Vorlauf für "bald fällig" in Tagen.')
+@click.option('--batch-size', default=500, show_default=True, help='Ausleihen pro Outbox-Stapel.')
+def reminders_command(loop, interval, soon_days, batch_size):
+    # Neue Erinnerungen in die Outbox schreiben und ausstehende zustellen
+    sender = sender_from_config(current_app.config)
+
+    while True:
+        result = scan(soon_window=datetime.timedelta(days=soon_days), batch_size=batch_size)
+        click.echo(f"Überfällig: {result['overdue_created']} neu / {result['overdue_scanned']} geprüft, "
+                   f"bald fällig: {result['due_soon_created']} neu / {result['due_soon_scanned']} geprüft")
+
+        while True:
+            delivery = deliver_pending(sender)
+            if delivery['delivered'] or delivery['failed']:
+                click.echo(f"Zugestellt: {delivery['delivered']}, fehlgeschlagen: {delivery['failed']}")
+            if not delivery['delivered']:
+                break
+
+        if not loop:
+            break
+        time.sleep(interval)
+
+@click.command('import-data')
+@with_appcontext
+@click.argument('kind', type=click.Choice(['books', 'authors', 'users']))
+@click.argument('source', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--format', 'data_format', type=click.Choice(['csv', 'ndjson']), help='Standard: nach Dateiendung.')
+@click.option('--batch-size', default=1000, show_default=True, help='Datensätze pro bulk_write.')
+def import_data_command(kind, source, data_format, batch_size):
+    # Bücher, Autoren oder Nutzer aus einer CSV-/NDJSON-Datei importieren (- liest von stdin)
+    report = import_stream(kind, source, detect_format(source.name, data_format), batch_size)
+
+    click.echo(f"{report.rows} Zeilen gelesen, {report.written} geschrieben, {report.error_count} Fehler "
+               f"in {report.elapsed:.2f} s ({report.rows_per_second:.0f} Zeilen/s)")
+    for error in report.errors:
+        click.echo(f"Zeile {error['line']}: {error['error']}")
+
+@click.command('author-jobs')
+@with_appcontext
+@click.option('--loop', is_flag=True, help='Als Worker dauerhaft laufen.')
+@click.option('--interval', default=10, show_default=True, help='Sekunden zwischen zwei Läufen.')
+@click.option('--batch-size', default=500, show_default=True, help='Bücher pro Stapel.')
+def author_jobs_command(loop, interval, batch_size):
+    # Ausstehende oder abgebrochene Autoren-Aufträge (Umbenennen, Löschen) abarbeiten
+    while True:
+        for job in run_pending(batch_size):
+            click.echo(f"{job['kind']} '{job['author_name']}': {job['books_done']} Bücher, "
+                       f"{job['loans_updated']} Ausleihen angepasst, {job['loans_closed']} geschlossen")
+        if not loop:
+            break
+        time.sleep(interval)
+
+@click.command('archive-loans')
+@with_appcontext
+@click.option('--older-than-days', type=int, help='Standard: LOAN_ARCHIVE_AFTER_DAYS.')
+@click.option('--batch-size', default=1000, show_default=True, help='Ausleihen pro Stapel.')
+def archive_loans_command(older_than_days, batch_size):
+    # Zurückgegebene Ausleihen nach Ablauf der Frist nach loans_archive verschieben
+    days = older_than_days if older_than_days is not None else current_app.config['LOAN_ARCHIVE_AFTER_DAYS']
+    result = archive_returned_loans(datetime.timedelta(days=days), batch_size)
+    click.echo(f"{result['archived']} Ausleihen mit Rückgabe vor {result['cutoff']:%d.%m.%Y} archiviert")
+
+@click.command('loan-rollups')
+@with_appcontext
+@click.option('--rebuild', is_flag=True, help='Alle Rollups aus Ausleihen und Archiv neu aufbauen.')
+@click.option('--loop', is_flag=True, help='Als Worker dauerhaft laufen.')
+@click.option('--interval', default=300, show_default=True, help='Sekunden zwischen zwei Läufen.')
+def loan_rollups_command(rebuild, loop, interval):
+    # Tägliche Ausleih-Zahlen ab der Watermark (oder vollständig) neu berechnen
+    while True:
+        with refresh_lease() as claimed:
+            if claimed:
+                result = rebuild_rollups() if rebuild else update_rollups()
+                rebuild = False
+                click.echo(f"{result['written']} Tageswerte geschrieben, Stand {result['watermark']:%d.%m.%Y %H:%M}")
+            else:
+                click.echo('Eine andere Aktualisierung läuft gerade, übersprungen.')
+        if not loop:
+            break
+        time.sleep(interval)
+
+@click.command('reconcile-availability')
+@with_appcontext
+@click.option('--full', is_flag=True, help='Alle Bücher prüfen statt nur der seit dem letzten Lauf ausgeliehenen oder geänderten; '
+                   'findet auch offene Ausleihen gelöschter Bücher.')
+@click.option('--dry-run', is_flag=True, help='Abweichungen nur melden, nichts ändern.')
+@click.option('--batch-size', default=1000, show_default=True, help='Korrekturen pro bulk_write.')
+@click.option('--loop', is_flag=True, help='Als Worker dauerhaft laufen.')
+@click.option('--interval', default=600, show_default=True, help='Sekunden zwischen zwei Läufen.')
+def reconcile_availability_command(full, dry_run, batch_size, loop, interval):
+    # available_copies mit den offenen Ausleihen abgleichen
+    while True:
+        result = reconcile_availability(full, batch_size, dry_run)
+        for mismatch in result['mismatches']:
+            click.echo(f"{mismatch['title']} ({mismatch['book_id']}): {mismatch['available_copies']} verfügbar, "
+                       f"erwartet {mismatch['expected']} ({mismatch['total_copies']} Exemplare, "
+                       f"{mismatch['open_loans']} offen)")
+        if result['mismatched'] > len(result['mismatches']):
+            click.echo(f"... und {result['mismatched'] - len(result['mismatches'])} weitere")
+        scope = 'alle Bücher' if result['full'] else 'seit dem letzten Lauf ausgeliehene oder geänderte Bücher'
+        click.echo(f"{result['checked']} Bücher geprüft ({scope}), {result['mismatched']} Abweichungen, "
+                   f"{result['fixed']} korrigiert, {result['skipped_busy']} wegen laufender Ausleihen übersprungen")
+        if result['overbooked']:
+            click.echo(f"{result['overbooked']} Bücher mit mehr offenen Ausleihen als Exemplaren")
+        if result['orphaned_loans']:
+            click.echo(f"{result['orphaned_loans']} offene Ausleihen gelöschter Bücher, z.B. "
+                       + ', '.join(str(book_id) for book_id in result['orphaned_books']))
+        if not loop:
+            break
+        full = False
+        time.sleep(interval)
+
+def register_commands(app):
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(reindex_search_command)
+    app.cli.add_command(rebuild_loan_stats_command)
+    app.cli.add_command(reminders_command)
+    app.cli.add_command(import_data_command)
+    app.cli.add_command(author_jobs_command)
+    app.cli.add_command(archive_loans_command)
+    app.cli.add_command(loan_rollups_command)
+    app.cli.add_command(reconcile_availability_command)
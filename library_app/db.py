@@ -1,13 +1,166 @@
 # library_app/db.py
 # Konfiguriert die Verbindung zur MongoDB-Datenbank und stellt die Collections bereit.
+# Der MongoClient wird erst beim ersten Zugriff erzeugt, und zwar einmal pro Prozess: Nach
+# einem fork (z.B. gunicorn-Worker) baut der Kindprozess einen eigenen Client mit eigenem
+# Verbindungspool auf. `client`, `db` und die Collections sind Stellvertreter, die bei jedem
+# Zugriff an den Client des aktuellen Prozesses weiterreichen und daher beim Import der
+# übrigen Module keine Verbindung öffnen.
+
+import os
+import threading
 
 from pymongo import MongoClient
 
-client = MongoClient('mongodb://localhost:27017/', tz_aware = True)
-db = client['library_db']
+from .metrics import command_metrics, pool_metrics
+from .read_routing import read_router
+from .write_tracking import write_tracker
+
+# Voreinstellungen, überschreibbar über die gleichnamigen Schlüssel der App-Konfiguration.
+# None übernimmt die Voreinstellung von pymongo.
+DEFAULT_SETTINGS = {
+    'MONGO_URI': 'mongodb://localhost:27017/',
+    'MONGO_DB_NAME': 'library_db',
+    'MONGO_MAX_POOL_SIZE': 100,
+    'MONGO_MIN_POOL_SIZE': 0,
+    'MONGO_MAX_IDLE_TIME_MS': None,
+    'MONGO_CONNECT_TIMEOUT_MS': None,
+    'MONGO_SOCKET_TIMEOUT_MS': None,
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': None,
+    'MONGO_WAIT_QUEUE_TIMEOUT_MS': None,
+    'MONGO_COMPRESSORS': None,
+    'MONGO_READ_CONCERN': None,
+    'MONGO_WRITE_CONCERN': None,
+}
+
+# Einstellung -> Parameter des MongoClient
+CLIENT_OPTIONS = {
+    'MONGO_MAX_POOL_SIZE': 'maxPoolSize',
+    'MONGO_MIN_POOL_SIZE': 'minPoolSize',
+    'MONGO_MAX_IDLE_TIME_MS': 'maxIdleTimeMS',
+    'MONGO_CONNECT_TIMEOUT_MS': 'connectTimeoutMS',
+    'MONGO_SOCKET_TIMEOUT_MS': 'socketTimeoutMS',
+    'MONGO_SERVER_SELECTION_TIMEOUT_MS': 'serverSelectionTimeoutMS',
+    'MONGO_WAIT_QUEUE_TIMEOUT_MS': 'waitQueueTimeoutMS',
+    'MONGO_COMPRESSORS': 'compressors',
+}
+
+settings = dict(DEFAULT_SETTINGS)
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+def client_options(current):
+    options = {CLIENT_OPTIONS[key]: current[key] for key in CLIENT_OPTIONS if current[key] is not None}
+    if current['MONGO_READ_CONCERN']:
+        # z.B. 'majority'
+        options['readConcernLevel'] = current['MONGO_READ_CONCERN']
+    if current['MONGO_WRITE_CONCERN']:
+        # Parameter des MongoClient, z.B. {'w': 'majority', 'wTimeoutMS': 5000, 'journal': True}
+        options.update(current['MONGO_WRITE_CONCERN'])
+    return options
+
+def configure(config):
+    # Aus create_app: MONGO_*-Einstellungen übernehmen. Ein schon erzeugter Client mit anderen
+    # Einstellungen wird geschlossen und beim nächsten Zugriff neu aufgebaut.
+    global _client, _client_pid
+    new_settings = {key: config.get(key, default) for key, default in DEFAULT_SETTINGS.items()}
+    with _lock:
+        if new_settings == settings:
+            return
+        settings.update(new_settings)
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = _client_pid = None
+
+def get_client():
+    global _client, _client_pid
+    client, pid = _client, os.getpid()
+    if client is not None and _client_pid == pid:
+        return client
+    with _lock:
+        if _client is None or _client_pid != pid:
+            # Die Listener messen jeden Befehl und den Pool für /metrics und merken sich
+            # Schreibzugriffe für die Versionsstempel
+            _client = MongoClient(settings['MONGO_URI'], tz_aware=True,
+                                  event_listeners=[command_metrics, pool_metrics, write_tracker],
+                                  **client_options(settings))
+            _client_pid = pid
+        return _client
+
+def get_database():
+    return get_client()[settings['MONGO_DB_NAME']]
+
+def warm_up():
+    # Nach dem fork eines Workers aufrufen (siehe gunicorn.conf.py): baut den Client auf, wartet
+    # auf die Serverauswahl und öffnet die erste Verbindung, bevor die erste Anfrage kommt.
+    # Mit MONGO_MIN_POOL_SIZE füllt pymongo den Pool anschließend im Hintergrund auf.
+    get_client().admin.command('ping')
+
+def _after_fork_in_child():
+    # Verbindungen des Elternprozesses nicht weiterverwenden und nicht schließen (die Sockets
+    # gehören weiter dem Elternprozess); der nächste Zugriff erzeugt einen neuen Client
+    global _client, _client_pid, _lock
+    _client = _client_pid = None
+    _lock = threading.Lock()
+    pool_metrics.reset()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+class _LazyClient:
+    def __getattr__(self, attribute):
+        return getattr(get_client(), attribute)
+
+    def __getitem__(self, name):
+        return get_client()[name]
+
+class _LazyCollection:
+    def __init__(self, name):
+        self.name = name
+        self._client = None
+        self._collection = None
+        # (Arbeitslast, Generation des Routings) -> Collection mit passender Lesepräferenz
+        self._routed = {}
+
+    def _resolve(self):
+        client = get_client()
+        if self._client is not client:
+            self._collection = client[settings['MONGO_DB_NAME']][self.name]
+            self._routed = {}
+            self._client = client
+        preference = read_router.current_preference()
+        if preference is None:
+            return self._collection
+        key = (read_router.current_workload(), read_router.generation)
+        collection = self._routed.get(key)
+        if collection is None:
+            collection = self._routed[key] = self._collection.with_options(read_preference=preference)
+        return collection
+
+    def __getattr__(self, attribute):
+        return getattr(self._resolve(), attribute)
+
+    def __repr__(self):
+        return f'<Collection {self.name} (lazy)>'
+
+class _LazyDatabase:
+    def __getitem__(self, name):
+        return _LazyCollection(name)
+
+    def __getattr__(self, attribute):
+        database, preference = get_database(), read_router.current_preference()
+        if preference is not None:
+            database = database.with_options(read_preference=preference)
+        return getattr(database, attribute)
+
+client = _LazyClient()
+db = _LazyDatabase()
 
 # Kollektionen exportieren, um sie in anderen Dateien zu nutzen
 users_collection = db['users']
 books_collection = db['books']
 authors_collection = db['authors']
-loans_collection = db['loans']
\ No newline at end of file
+loans_collection = db['loans']
+# Zurückgegebene Ausleihen nach Ablauf von LOAN_ARCHIVE_AFTER_DAYS (siehe loan_archive.py)
+loans_archive_collection = db['loans_archive']
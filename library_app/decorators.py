@@ -1,21 +1,111 @@
 # library_app/decorators.py
 # Enthält benutzerdefinierte Decorators zur Überprüfung von Benutzerrollen und Zugriffsrechten.
 
+import datetime
+import hashlib
 from functools import wraps
 
-from flask import flash, redirect, url_for
+from flask import flash, g, jsonify, make_response, redirect, request, session, url_for
 from flask_login import current_user
 
+from .read_routing import PRIMARY, read_router
+from .versions import get_versions
+
+def current_role():
+    # Rolle aus dem Benutzer-Cache (models.user_cache). edit_user und delete_user leeren den Eintrag
+    # im eigenen Prozess; andere Worker sehen eine geänderte Rolle nach spätestens USER_CACHE_TTL.
+    if not current_user.is_authenticated:
+        return None
+    return current_user.role
+
 def role_required(roles):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            if not current_user.is_authenticated or current_user.role not in roles:
+            if current_role() not in roles:
                 flash('Für diese Aktion haben Sie nicht die erforderlichen Rechte.', 'danger')
                 return redirect(url_for('main.index'))
             return f(*args, **kwargs)
+        # Für die Zulassungskontrolle, die vor der View läuft (siehe admission.admit_request)
+        decorated_function.allowed_roles = roles
+        return decorated_function
+    return decorator
+
+def api_role_required(roles):
+    # Variante für JSON-Endpunkte: liefert 401/403 statt einer Weiterleitung
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not current_user.is_authenticated:
+                return jsonify({'error': 'Anmeldung erforderlich.'}), 401
+            if current_role() not in roles:
+                return jsonify({'error': 'Für diese Aktion haben Sie nicht die erforderlichen Rechte.'}), 403
+            return f(*args, **kwargs)
+        decorated_function.allowed_roles = roles
         return decorated_function
     return decorator
 
 admin_required = role_required(['admin'])
-librarian_required = role_required(['admin', 'librarian'])
\ No newline at end of file
+librarian_required = role_required(['admin', 'librarian'])
+api_admin_required = api_role_required(['admin'])
+api_librarian_required = api_role_required(['admin', 'librarian'])
+
+def _settled(versions):
+    # True, wenn jeder Knoten der aktuellen Arbeitslast alle Änderungen bis zu den gelesenen Stempeln
+    # hat. Stempel und Daten können von verschiedenen Secondaries kommen; nach einer jüngeren
+    # Änderung würden sonst veraltete Daten unter dem neuen ETag zwischengespeichert.
+    bound = read_router.lag_bound()
+    if bound == 0:
+        return True
+    if bound is None:
+        return False
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return all(stamp is None or (now - stamp).total_seconds() > bound for _, stamp in versions.values())
+
+def conditional(*collection_names, daily=False):
+    # Bedingte GET-Antworten: ETag aus Route, Parametern, Nutzer und den Versionsstempeln der
+    # Collections, Last-Modified aus deren letzter Änderung. Passt die Anfrage, wird die View
+    # gar nicht erst ausgeführt (304). Mit daily=True ändert sich das ETag zusätzlich jeden Tag (UTC,
+    # wie die Tage der Rollups), z.B. für Berichte über relative Zeiträume. Nicht geeignet für Daten,
+    # die sich im Laufe des Tages ohne Schreibzugriff ändern (z.B. Überfälligkeit). Wurde eine der Collections
+    # innerhalb des möglichen Rückstands der Secondaries geändert, liest die View vom Primary.
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # Ausstehende Flash-Meldungen müssen gerendert werden
+            if request.method != 'GET' or session.get('_flashes'):
+                return f(*args, **kwargs)
+
+            versions = get_versions(collection_names)
+            fingerprint = repr((
+                request.endpoint, sorted(request.args.items(multi=True)),
+                current_user.get_id() if current_user.is_authenticated else None,
+                'gzip' in request.headers.get('Accept-Encoding', ''),
+                sorted(versions.items()),
+                datetime.datetime.now(datetime.timezone.utc).date().isoformat() if daily else None
+            ))
+            etag = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+            modified = [stamp for _, stamp in versions.values() if stamp is not None]
+            last_modified = max(modified).replace(microsecond=0) if len(modified) == len(versions) and not daily else None
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                not_modified = bool(last_modified and request.if_modified_since
+                                    and last_modified <= request.if_modified_since)
+
+            if not not_modified and not _settled(versions):
+                # Für die ganze Anfrage, auch für erst beim Streamen ausgeführte Abfragen
+                g.read_workload = PRIMARY
+            response = make_response('', 304) if not_modified else make_response(f(*args, **kwargs))
+            if response.status_code in (200, 304):
+                response.set_etag(etag, weak=True)
+                if last_modified:
+                    response.last_modified = last_modified
+                # Rollenabhängige Daten: nur im Browser zwischenspeichern und immer nachfragen
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+                response.vary.add('Cookie')
+            return response
+        return decorated_function
+    return decorator
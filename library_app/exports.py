@@ -0,0 +1,64 @@
+# library_app/exports.py
+# Gemeinsame Pipeline für CSV-Exporte. Die Zeilen werden direkt aus dem Datenbank-Cursor
+# in Blöcken kodiert und gestreamt, statt die komplette Datei im Speicher aufzubauen.
+
+import csv
+import zlib
+
+from flask import Response, current_app, request, stream_with_context
+
+class _RowBuffer:
+    # Minimales Datei-Objekt für csv.writer, das die geschriebenen Zeilen sammelt
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def drain(self):
+        text = ''.join(self.parts)
+        self.parts = []
+        return text
+
+def iter_csv(header, rows, chunk_rows=500):
+    # Liefert die CSV-Datei als UTF-8-Blöcke zu je `chunk_rows` Zeilen
+    buffer = _RowBuffer()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    pending = 1
+
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.drain().encode('utf-8')
+            pending = 0
+
+    if pending:
+        yield buffer.drain().encode('utf-8')
+
+def gzip_chunks(chunks, level=6):
+    # Komprimiert die Blöcke fortlaufend im gzip-Format (wbits=31)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def client_accepts_gzip():
+    return current_app.config.get('EXPORT_GZIP', True) and 'gzip' in request.headers.get('Accept-Encoding', '')
+
+def csv_response(filename, header, rows):
+    # Streamende Antwort; `rows` ist ein Iterator (z.B. Generator über einen Cursor)
+    chunks = iter_csv(header, rows, current_app.config.get('EXPORT_CHUNK_ROWS', 500))
+    headers = {'Content-Disposition': f'attachment; filename={filename}', 'Vary': 'Accept-Encoding'}
+
+    if client_accepts_gzip():
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+
+    return Response(stream_with_context(chunks), mimetype='text/csv', headers=headers)
+
+def export_batch_size():
+    return current_app.config.get('EXPORT_BATCH_SIZE', 1000)
@@ -0,0 +1,260 @@
+# library_app/importer.py
+# Streaming-Import von Büchern, Autoren und Nutzern aus CSV oder NDJSON. Die CSV-Formate
+# entsprechen den Exporten unter /export/*/csv, sodass exportierte Dateien wieder importiert
+# werden können. Geschrieben wird stapelweise mit ungeordnetem bulk_write. Bücher werden über
+# die normalisierte ISBN zusammengeführt, sodass ein erneuter Import keine Dubletten anlegt.
+
+import csv
+import datetime
+import json
+import time
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .author_index import author_index
+from .db import books_collection, authors_collection, users_collection
+from .search import BOOK_SEARCH, AUTHOR_SEARCH, USER_SEARCH, normalize_isbn, search_fields
+
+# CSV-Spaltenüberschriften der Exporte -> interne Feldnamen
+CSV_COLUMNS = {
+    'books': {'Titel': 'title', 'Autor': 'author_name', 'ISBN': 'isbn', 'Status': 'status'},
+    'authors': {'Name': 'name', 'Biografie': 'biography'},
+    'users': {'Benutzername': 'username', 'Rolle': 'role', 'Registriert am (UTC)': 'registered_on'},
+}
+
+# Importierte Nutzer haben kein Passwort; dieser Wert passt zu keinem Passwort-Hash
+UNUSABLE_PASSWORD = '!'
+MAX_REPORTED_ERRORS = 100
+
+class RowError(ValueError):
+    pass
+
+def iter_records(stream, kind, data_format):
+    # Liefert (Zeilennummer, Datensatz) aus einem Text-Stream, ohne die Datei komplett zu lesen
+    if data_format == 'ndjson':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as error:
+                yield line_number, RowError(f'Ungültiges JSON: {error.msg}')
+                continue
+            yield line_number, record if isinstance(record, dict) else RowError('Zeile ist kein JSON-Objekt.')
+    else:
+        columns = CSV_COLUMNS[kind]
+        reader = csv.DictReader(stream)
+        for record in reader:
+            # Zeile 1 ist die Kopfzeile
+            yield reader.line_num, {columns.get(key, key): value for key, value in record.items() if key}
+
+def _required(record, field):
+    value = str(record.get(field) or '').strip()
+    if not value:
+        raise RowError(f'Feld "{field}" fehlt.')
+    return value
+
+def _book_document(record):
+    # Verfügbare Exemplare ergeben sich aus den Ausleihen dieser Datenbank, nicht aus der Datei
+    # (siehe _book_update); der Status "verfügbar / gesamt" wird nur auf Gültigkeit geprüft
+    total = record.get('total_copies')
+    available = record.get('available_copies')
+    if record.get('status'):
+        # Export-Format "verfügbar / gesamt"
+        try:
+            available, total = (int(part) for part in str(record['status']).split('/'))
+        except ValueError:
+            raise RowError(f'Ungültiger Status "{record["status"]}".')
+    try:
+        total = int(total if total not in (None, '') else 1)
+        available = int(available if available not in (None, '') else total)
+    except (TypeError, ValueError):
+        raise RowError('Anzahl der Exemplare ist keine Zahl.')
+    if total < 1 or not 0 <= available <= total:
+        raise RowError('Ungültige Anzahl der Exemplare.')
+
+    return {
+        'title': _required(record, 'title'),
+        'isbn': _required(record, 'isbn'),
+        'author_name': _required(record, 'author_name'),
+        'total_copies': total
+    }
+
+def _book_update(document):
+    # Upsert über isbn_normalized. Neue Bücher haben noch keine Ausleihen, alle Exemplare sind
+    # verfügbar. Bei vorhandenen Büchern ändert sich available_copies nur um die Differenz im
+    # Bestand, sodass die offenen Ausleihen weiter stimmen (nie unter 0, siehe reconcile-availability).
+    total = document['total_copies']
+    fields = {key: value for key, value in document.items() if key != 'total_copies'}
+    return UpdateOne({'isbn_normalized': document['isbn_normalized']}, [{'$set': dict(fields, **{
+        'total_copies': total,
+        # Für den inkrementellen Verfügbarkeitsabgleich (availability._touched_since)
+        'updated_at': datetime.datetime.now(datetime.timezone.utc),
+        'available_copies': {'$max': [0, {'$ifNull': [
+            {'$add': ['$available_copies', {'$subtract': [total, '$total_copies']}]}, total
+        ]}]}
+    })}], upsert=True)
+
+def _user_document(record):
+    role = str(record.get('role') or 'user').strip()
+    if role not in ('user', 'librarian', 'admin'):
+        raise RowError(f'Ungültige Rolle "{role}".')
+
+    registered_on = record.get('registered_on')
+    if registered_on:
+        try:
+            registered_on = datetime.datetime.fromisoformat(str(registered_on).replace('Z', '+00:00'))
+        except ValueError:
+            raise RowError(f'Ungültiges Datum "{registered_on}".')
+        if registered_on.tzinfo is None:
+            registered_on = registered_on.replace(tzinfo=datetime.timezone.utc)
+    else:
+        registered_on = datetime.datetime.now(datetime.timezone.utc)
+
+    user = {'username': _required(record, 'username'), 'password': UNUSABLE_PASSWORD,
+            'role': role, 'registered_on': registered_on}
+    user.update(search_fields(USER_SEARCH, user))
+    return user
+
+class AuthorResolver:
+    # Cache Autorenname -> _id; unbekannte Namen werden pro Stapel gemeinsam angelegt
+    def __init__(self):
+        self.ids = {}
+
+    def resolve(self, names):
+        missing = list({name for name in names if name not in self.ids})
+        if not missing:
+            return
+        for author in authors_collection.find({'name': {'$in': missing}}, {'name': 1}):
+            self.ids[author['name']] = author['_id']
+
+        to_create = [name for name in missing if name not in self.ids]
+        if to_create:
+            authors_collection.bulk_write([
+                UpdateOne({'name': name}, {'$setOnInsert': dict(
+                    {'name': name, 'biography': ''}, **search_fields(AUTHOR_SEARCH, {'name': name, 'biography': ''})
+                )}, upsert=True)
+                for name in to_create
+            ], ordered=False)
+            for author in authors_collection.find({'name': {'$in': to_create}}, {'name': 1}):
+                self.ids[author['name']] = author['_id']
+            for name in to_create:
+                author_index.add(name)
+
+class ImportReport:
+    def __init__(self, kind):
+        self.kind = kind
+        self.rows = 0
+        self.written = 0
+        self.error_count = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add_error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+class Importer:
+    def __init__(self, kind, batch_size=1000):
+        if kind not in CSV_COLUMNS:
+            raise ValueError(f'Unbekannter Import-Typ "{kind}".')
+        self.kind = kind
+        self.batch_size = batch_size
+        self.authors = AuthorResolver()
+        self.report = ImportReport(kind)
+
+    def _operations(self, batch):
+        # Wandelt (Zeilennummer, Datensatz) in Schreiboperationen um; fehlerhafte Zeilen werden gemeldet
+        documents = []
+        for line_number, record in batch:
+            if isinstance(record, RowError):
+                self.report.add_error(line_number, str(record))
+                continue
+            try:
+                if self.kind == 'books':
+                    documents.append((line_number, _book_document(record)))
+                elif self.kind == 'users':
+                    documents.append((line_number, _user_document(record)))
+                else:
+                    documents.append((line_number, {'name': _required(record, 'name'),
+                                                    'biography': str(record.get('biography') or '')}))
+            except RowError as error:
+                self.report.add_error(line_number, str(error))
+
+        if self.kind == 'books':
+            # Dieselbe ISBN mehrfach im Stapel: der letzte Eintrag gilt, sonst legten gleichzeitige
+            # Upserts das Buch doppelt an
+            latest = {}
+            for line_number, document in documents:
+                isbn = normalize_isbn(document['isbn'])
+                if isbn in latest:
+                    self.report.add_error(latest[isbn][0], f'ISBN {document["isbn"]} kommt in Zeile {line_number} erneut vor.')
+                latest[isbn] = (line_number, document)
+            documents = sorted(latest.values(), key=lambda entry: entry[0])
+
+            self.authors.resolve([document['author_name'] for _, document in documents])
+            operations = []
+            for _, document in documents:
+                document['author_id'] = self.authors.ids[document['author_name']]
+                document.update(search_fields(BOOK_SEARCH, document))
+                operations.append(_book_update(document))
+            return [line for line, _ in documents], operations
+
+        if self.kind == 'users':
+            return [line for line, _ in documents], [InsertOne(document) for _, document in documents]
+
+        # Autoren: vorhandene Namen werden aktualisiert, neue angelegt
+        operations = [
+            UpdateOne({'name': document['name']},
+                      {'$set': dict(document, **search_fields(AUTHOR_SEARCH, document))}, upsert=True)
+            for _, document in documents
+        ]
+        return [line for line, _ in documents], operations
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        collection = {'books': books_collection, 'authors': authors_collection, 'users': users_collection}[self.kind]
+        lines, operations = self._operations(batch)
+        if not operations:
+            return
+
+        try:
+            result = collection.bulk_write(operations, ordered=False)
+            self.report.written += result.inserted_count + result.upserted_count + result.modified_count
+        except BulkWriteError as error:
+            details = error.details
+            self.report.written += details.get('nInserted', 0) + details.get('nUpserted', 0) + details.get('nModified', 0)
+            for write_error in details.get('writeErrors', []):
+                message = 'Eintrag existiert bereits.' if write_error.get('code') == 11000 else write_error.get('errmsg')
+                self.report.add_error(lines[write_error['index']], message)
+
+    def run(self, stream, data_format):
+        batch = []
+        for line_number, record in iter_records(stream, self.kind, data_format):
+            self.report.rows += 1
+            batch.append((line_number, record))
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        self._flush(batch)
+
+        if self.kind == 'authors':
+            author_index.invalidate()
+        self.report.elapsed = time.perf_counter() - self.report.started
+        return self.report
+
+def detect_format(filename, data_format=None):
+    if data_format:
+        return data_format
+    return 'ndjson' if filename.lower().endswith(('.ndjson', '.jsonl')) else 'csv'
+
+def import_stream(kind, stream, data_format, batch_size=1000):
+    return Importer(kind, batch_size).run(stream, data_format)
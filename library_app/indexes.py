@@ -0,0 +1,293 @@
+# library_app/indexes.py
+# Deklaratives Index-Register und versionierte Migrationen für die MongoDB-Datenbank.
+# Wird beim Start der Anwendung oder über den CLI-Befehl `flask --app run init-db` ausgeführt.
+
+import datetime
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from .db import db
+
+# Indizes je Migration: Collection-Name -> Liste von IndexModels. Jede Migration legt genau ihre
+# eigenen Indizes an; die Listen werden wie die Migrationen nie verändert, neue Indizes kommen
+# mit einer neuen Migration. Jeder Index hat einen festen Namen, damit er wiedererkannt wird.
+BASE_INDEXES = {
+    'loans': [
+        # Aktuelle Ausleihen eines Nutzers (Profil) und Ausleihhistorie sortiert nach Datum
+        IndexModel([('user_id', ASCENDING), ('return_date', ASCENDING), ('loan_date', DESCENDING)],
+                   name='user_open_loans'),
+        # Anzahl offener Ausleihen pro Buch (edit_book)
+        IndexModel([('book_id', ASCENDING), ('return_date', ASCENDING)], name='book_open_loans'),
+        # Überfällige Ausleihen (Berichte)
+        IndexModel([('return_date', ASCENDING), ('due_date', ASCENDING)], name='open_loans_due'),
+    ],
+    'users': [
+        IndexModel([('username', ASCENDING)], name='username_unique', unique=True),
+    ],
+    'books': [
+        IndexModel([('title', ASCENDING)], name='title'),
+        IndexModel([('isbn', ASCENDING)], name='isbn'),
+        IndexModel([('author_id', ASCENDING)], name='author_id'),
+    ],
+    'authors': [
+        IndexModel([('name', ASCENDING)], name='name'),
+    ],
+}
+
+KEYSET_INDEXES = {
+    'users': [
+        # Keyset-Pagination der Benutzerliste (Sortierung nach username, _id)
+        IndexModel([('username', ASCENDING), ('_id', ASCENDING)], name='username_id'),
+    ],
+    'books': [
+        # Keyset-Pagination der Bücherliste, deckt auch Suchen nach Titel ab
+        IndexModel([('title', ASCENDING), ('_id', ASCENDING)], name='title_id'),
+    ],
+    'authors': [
+        IndexModel([('name', ASCENDING), ('_id', ASCENDING)], name='name_id'),
+    ],
+}
+
+# Indizes, die durch die zusammengesetzten Keyset-Indizes ersetzt wurden
+SUPERSEDED_INDEXES = {
+    'books': ['title'],
+    'authors': ['name'],
+}
+
+SEARCH_INDEXES = {
+    # Katalogsuche: Multikey-Index über normalisierte Wörter und ISBN-Schnellpfad
+    'users': [IndexModel([('search_tokens', ASCENDING)], name='search_tokens')],
+    'books': [
+        IndexModel([('search_tokens', ASCENDING)], name='search_tokens'),
+        IndexModel([('isbn_normalized', ASCENDING)], name='isbn_normalized'),
+    ],
+    'authors': [IndexModel([('search_tokens', ASCENDING)], name='search_tokens')],
+}
+
+LOAN_STATS_INDEXES = {
+    # Top-Bücher und Top-Nutzer über den materialisierten Ausleih-Zähler
+    'users': [IndexModel([('total_loans', DESCENDING)], name='total_loans')],
+    'books': [IndexModel([('total_loans', DESCENDING)], name='total_loans')],
+}
+
+LOAN_HISTORY_INDEXES = {
+    'loans': [
+        # Ausleihhistorie eines Nutzers, neueste zuerst (Keyset-Pagination über loan_date, _id)
+        IndexModel([('user_id', ASCENDING), ('loan_date', DESCENDING), ('_id', DESCENDING)],
+                   name='user_loan_history'),
+    ],
+}
+
+REMINDER_INDEXES = {
+    'reminder_outbox': [
+        # Zustellung ausstehender Erinnerungen in Eingangsreihenfolge
+        IndexModel([('status', ASCENDING), ('created_at', ASCENDING)], name='status_created'),
+    ],
+}
+
+AUTHOR_JOB_INDEXES = {
+    'author_jobs': [
+        # Übernahme ausstehender Aufträge und Liste der letzten Aufträge
+        IndexModel([('status', ASCENDING), ('created_at', ASCENDING)], name='status_created'),
+        IndexModel([('created_at', DESCENDING)], name='created_at'),
+    ],
+}
+
+ARCHIVE_INDEXES = {
+    'loans_archive': [
+        # Ausleihhistorie eines Nutzers (gemischt mit loans, siehe loan_views.loan_history_page)
+        IndexModel([('user_id', ASCENDING), ('loan_date', DESCENDING), ('_id', DESCENDING)],
+                   name='user_loan_history'),
+        # Titel-Kopie beim Löschen von Büchern (author_jobs)
+        IndexModel([('book_id', ASCENDING)], name='book_id'),
+    ],
+}
+
+ROLLUP_INDEXES = {
+    # Neue Ausleihen seit der Watermark und monatsweiser Neuaufbau der Rollups
+    'loans': [IndexModel([('loan_date', ASCENDING)], name='loan_date')],
+    'loans_archive': [IndexModel([('loan_date', ASCENDING)], name='loan_date')],
+    'loan_rollups': [
+        IndexModel([('dimension', ASCENDING), ('key', ASCENDING), ('day', ASCENDING)],
+                   name='dimension_key_day', unique=True),
+        # Zeitraum-Abfragen der Berichte
+        IndexModel([('dimension', ASCENDING), ('day', ASCENDING)], name='dimension_day'),
+    ],
+}
+
+BOOK_UPDATED_INDEXES = {
+    # Bücher mit geändertem Bestand seit dem letzten Verfügbarkeitsabgleich (ältere Bücher ohne Feld)
+    'books': [IndexModel([('updated_at', ASCENDING)], name='updated_at', sparse=True)],
+}
+
+def _registry(index_sets, superseded):
+    # Soll-Zustand nach allen Migrationen: alle Indizes ohne die ersetzten
+    registry = {}
+    for index_set in index_sets:
+        for collection_name, index_models in index_set.items():
+            dropped = superseded.get(collection_name, [])
+            registry.setdefault(collection_name, []).extend(
+                index_model for index_model in index_models if index_model.document['name'] not in dropped
+            )
+    return registry
+
+# Register aller Indizes, gegen das init_db nach den Migrationen abgleicht
+INDEXES = _registry([BASE_INDEXES, KEYSET_INDEXES, SEARCH_INDEXES, LOAN_STATS_INDEXES, LOAN_HISTORY_INDEXES,
+                     REMINDER_INDEXES, AUTHOR_JOB_INDEXES, ARCHIVE_INDEXES, ROLLUP_INDEXES, BOOK_UPDATED_INDEXES],
+                    SUPERSEDED_INDEXES)
+
+migrations_collection = db['schema_migrations']
+
+def ensure_indexes(registry=None):
+    # Legt alle fehlenden Indizes an und liefert einen Bericht pro Index.
+    # Bereits vorhandene Indizes werden nicht erneut gebaut (idempotent).
+    registry = registry if registry is not None else INDEXES
+    report = []
+
+    for collection_name, index_models in registry.items():
+        collection = db[collection_name]
+        existing = collection.index_information()
+
+        for index_model in index_models:
+            name = index_model.document['name']
+            entry = {'collection': collection_name, 'index': name}
+
+            if name in existing:
+                # Gleicher Name mit anderen Schlüsseln oder anderer Eindeutigkeit ist ein Konflikt,
+                # den nur ein manuelles Entfernen des alten Index auflöst
+                expected = (list(index_model.document['key'].items()), index_model.document.get('unique', False))
+                found = (list(existing[name]['key']), existing[name].get('unique', False))
+                if expected == found:
+                    entry['status'] = 'exists'
+                else:
+                    entry['status'] = 'failed'
+                    entry['error'] = f'Index existiert mit abweichender Definition {found}, erwartet {expected}'
+            else:
+                try:
+                    collection.create_indexes([index_model])
+                    entry['status'] = 'created'
+                except PyMongoError as error:
+                    entry['status'] = 'failed'
+                    entry['error'] = str(error)
+            report.append(entry)
+
+    return report
+
+def drop_indexes(superseded):
+    report = []
+
+    for collection_name, index_names in superseded.items():
+        collection = db[collection_name]
+        existing = collection.index_information()
+
+        for name in index_names:
+            entry = {'collection': collection_name, 'index': name}
+            if name not in existing:
+                entry['status'] = 'absent'
+            else:
+                try:
+                    collection.drop_index(name)
+                    entry['status'] = 'dropped'
+                except PyMongoError as error:
+                    entry['status'] = 'failed'
+                    entry['error'] = str(error)
+            report.append(entry)
+
+    return report
+
+def _migration_001_base_indexes():
+    return ensure_indexes(BASE_INDEXES)
+
+def _migration_002_keyset_pagination():
+    # Erst die zusammengesetzten Indizes bauen, dann die einfachen Vorgänger entfernen
+    created = ensure_indexes(KEYSET_INDEXES)
+    if any(entry['status'] == 'failed' for entry in created):
+        return created
+    return created + drop_indexes(SUPERSEDED_INDEXES)
+
+def _migration_003_search_tokens():
+    # Suchfelder des Bestands: `flask --app run init-db --backfill` bzw. reindex-search
+    return ensure_indexes(SEARCH_INDEXES)
+
+def _migration_004_loan_stats():
+    # Zähler des Bestands: `flask --app run init-db --backfill` bzw. rebuild-loan-stats
+    return ensure_indexes(LOAN_STATS_INDEXES)
+
+def _migration_005_loan_history_index():
+    return ensure_indexes(LOAN_HISTORY_INDEXES)
+
+def _migration_006_reminder_outbox():
+    return ensure_indexes(REMINDER_INDEXES)
+
+def _migration_007_author_jobs():
+    return ensure_indexes(AUTHOR_JOB_INDEXES)
+
+def _migration_008_loans_archive():
+    return ensure_indexes(ARCHIVE_INDEXES)
+
+def _migration_009_loan_rollups():
+    # Ohne Watermark baut der erste Rollup-Lauf (Worker oder Berichtsseite) alles unter der Sperre auf
+    return ensure_indexes(ROLLUP_INDEXES)
+
+def _migration_010_book_updated_at():
+    return ensure_indexes(BOOK_UPDATED_INDEXES)
+
+# Versionierte Migrationen: (Version, Beschreibung, Funktion).
+# Neue Migrationen werden nur angehängt, bestehende Einträge nie verändert. Migrationen legen nur
+# Indizes an und entfernen sie; das ist idempotent und darf in mehreren gleichzeitig startenden
+# Prozessen laufen. Datenläufe über den Bestand gehören in CLI-Befehle (init-db --backfill).
+MIGRATIONS = [
+    (1, 'Basis-Indizes für Ausleihen, Nutzer, Bücher und Autoren', _migration_001_base_indexes),
+    (2, 'Zusammengesetzte Indizes für Keyset-Pagination', _migration_002_keyset_pagination),
+    (3, 'Suchfelder und Such-Indizes für Bücher, Autoren und Nutzer', _migration_003_search_tokens),
+    (4, 'Materialisierte Ausleih-Zähler für Bücher und Nutzer', _migration_004_loan_stats),
+    (5, 'Index für die seitenweise Ausleihhistorie', _migration_005_loan_history_index),
+    (6, 'Outbox für Erinnerungen', _migration_006_reminder_outbox),
+    (7, 'Hintergrundaufträge für Autoren', _migration_007_author_jobs),
+    (8, 'Archiv für zurückgegebene Ausleihen', _migration_008_loans_archive),
+    (9, 'Tägliche Ausleih-Rollups für Trendberichte', _migration_009_loan_rollups),
+    (10, 'Index für Bestandsänderungen (Verfügbarkeitsabgleich)', _migration_010_book_updated_at),
+]
+
+def current_schema_version():
+    latest = migrations_collection.find_one(sort=[('_id', DESCENDING)])
+    return latest['_id'] if latest else 0
+
+def apply_migrations():
+    # Führt alle noch nicht angewendeten Migrationen in aufsteigender Reihenfolge aus.
+    # Eine Migration mit fehlgeschlagenen Indizes wird nicht als angewendet markiert.
+    applied_version = current_schema_version()
+    report = []
+
+    for version, description, migration in MIGRATIONS:
+        if version <= applied_version:
+            continue
+
+        result = migration() or []
+        failed = [entry for entry in result if entry.get('status') == 'failed']
+        report.append({'version': version, 'description': description, 'result': result, 'ok': not failed})
+
+        if failed:
+            break
+
+        try:
+            migrations_collection.insert_one({
+                '_id': version,
+                'description': description,
+                'applied_on': datetime.datetime.now(datetime.timezone.utc)
+            })
+        except DuplicateKeyError:
+            # Ein gleichzeitig gestarteter Prozess hat dieselbe Migration schon eingetragen
+            pass
+
+    return report
+
+def init_db():
+    # Migrationen anwenden und anschließend das Index-Register abgleichen,
+    # damit auch nachträglich gelöschte Indizes wiederhergestellt werden.
+    return {
+        'migrations': apply_migrations(),
+        'indexes': ensure_indexes(),
+        'schema_version': current_schema_version()
+    }
@@ -0,0 +1,40 @@
+# library_app/loan_archive.py
+# Archivierung der Ausleihhistorie: Zurückgegebene Ausleihen, deren Rückgabe länger als eine
+# einstellbare Frist zurückliegt, werden stapelweise nach loans_archive verschoben. Die
+# Collection loans enthält danach im Wesentlichen offene und kürzlich zurückgegebene
+# Ausleihen, sodass ihre Indizes für Profil, Bestand und Berichte klein bleiben.
+
+import datetime
+
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+from .db import loans_collection, loans_archive_collection
+
+DUPLICATE_KEY = 11000
+
+def _copy_to_archive(loans):
+    # Bereits archivierte Ausleihen (Wiederholung nach Abbruch) werden übersprungen
+    try:
+        loans_archive_collection.insert_many(loans, ordered=False)
+    except BulkWriteError as error:
+        if any(write_error['code'] != DUPLICATE_KEY for write_error in error.details['writeErrors']):
+            raise
+
+def archive_returned_loans(older_than=datetime.timedelta(days=180), batch_size=1000, now=None):
+    # Erst kopieren, dann löschen: Bricht ein Lauf ab, liegt eine Ausleihe höchstens kurz in
+    # beiden Collections und wird beim nächsten Lauf fertig verschoben.
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    cutoff = now - older_than
+    archived = 0
+
+    while True:
+        # {'$lt': Datum} trifft keine offenen Ausleihen (return_date None); Index open_loans_due
+        loans = list(loans_collection.find({'return_date': {'$lt': cutoff}})
+                     .sort('return_date', ASCENDING).limit(batch_size))
+        if not loans:
+            break
+        _copy_to_archive(loans)
+        archived += loans_collection.delete_many({'_id': {'$in': [loan['_id'] for loan in loans]}}).deleted_count
+
+    return {'archived': archived, 'cutoff': cutoff}
@@ -0,0 +1,225 @@
+# library_app/loan_rollups.py
+# Tägliche Ausleih-Zahlen pro Buch, Autor und Nutzer (plus Gesamtsumme) in loan_rollups.
+# Ein Lauf berechnet nur die Tage ab der Watermark neu und setzt die Zählerstände absolut,
+# sodass Wiederholungen und abgebrochene Läufe nichts doppelt zählen. Wochen- und
+# Monatswerte werden aus den Tageswerten summiert, nie aus den Roh-Ausleihen.
+
+import contextlib
+import datetime
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from .async_db import Query
+from .db import db, books_collection, users_collection, loans_collection, loans_archive_collection
+from .read_routing import PRIMARY, read_workload
+from .versions import background_writes
+
+rollups_collection = db['loan_rollups']
+scheduler_state_collection = db['scheduler_state']
+
+STATE_ID = 'loan_rollups'
+DIMENSIONS = ('all', 'book', 'author', 'user')
+GRANULARITIES = ('day', 'week', 'month')
+
+# Ausleihen werden erst nach dieser Verzögerung gezählt, damit gerade geschriebene
+# Ausleihen mit etwas älterem loan_date nicht übersprungen werden
+SETTLE_DELAY = datetime.timedelta(minutes=1)
+
+# Höchstdauer einer Aktualisierung; danach gilt die Sperre eines abgebrochenen Laufs als frei
+REFRESH_LEASE = datetime.timedelta(minutes=10)
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def start_of_day(value):
+    return datetime.datetime(value.year, value.month, value.day, tzinfo=datetime.timezone.utc)
+
+def period_start(day, granularity):
+    if granularity == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+def get_watermark():
+    state = scheduler_state_collection.find_one({'_id': STATE_ID})
+    watermark = state.get('watermark') if state else None
+    if watermark is None:
+        return None
+    return watermark if watermark.tzinfo else watermark.replace(tzinfo=datetime.timezone.utc)
+
+def set_watermark(value):
+    scheduler_state_collection.update_one({'_id': STATE_ID}, {'$set': {'watermark': value}}, upsert=True)
+
+def _daily_counts(start, end, group_field, include_archive):
+    pipeline = [{'$match': {'loan_date': {'$gte': start, '$lt': end}}}]
+    if include_archive:
+        pipeline.append({'$unionWith': {'coll': loans_archive_collection.name,
+                                        'pipeline': [{'$match': {'loan_date': {'$gte': start, '$lt': end}}}]}})
+    pipeline.append({'$group': {
+        '_id': {'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$loan_date'}}, 'key': f'${group_field}'},
+        'loans': {'$sum': 1}
+    }})
+    for row in loans_collection.aggregate(pipeline, allowDiskUse=True):
+        day = datetime.datetime.strptime(row['_id']['day'], '%Y-%m-%d').replace(tzinfo=datetime.timezone.utc)
+        yield day, row['_id']['key'], row['loans']
+
+def _documents(collection, ids, projection):
+    ids = [object_id for object_id in set(ids) if object_id is not None]
+    if not ids:
+        return {}
+    return {document['_id']: document for document in collection.find({'_id': {'$in': ids}}, projection)}
+
+def _recompute(start, end, include_archive=False, batch_size=1000):
+    # Zählt alle Ausleihen mit loan_date in [start, end) neu und setzt die Tageswerte.
+    # start liegt immer auf einem Tagesanfang, damit jeder berührte Tag vollständig gezählt wird.
+    counts = {}
+
+    book_days = list(_daily_counts(start, end, 'book_id', include_archive))
+    books = _documents(books_collection, [book_id for _, book_id, _ in book_days],
+                       {'title': 1, 'author_id': 1, 'author_name': 1})
+    for day, book_id, loans in book_days:
+        book = books.get(book_id, {})
+        for dimension, key, label in (('all', None, None),
+                                      ('book', book_id, book.get('title')),
+                                      ('author', book.get('author_id'), book.get('author_name'))):
+            if dimension == 'author' and key is None:
+                continue
+            entry = counts.setdefault((dimension, key, day), {'loans': 0, 'label': label})
+            entry['loans'] += loans
+
+    user_days = list(_daily_counts(start, end, 'user_id', include_archive))
+    users = _documents(users_collection, [user_id for _, user_id, _ in user_days], {'username': 1})
+    for day, user_id, loans in user_days:
+        counts[('user', user_id, day)] = {'loans': loans, 'label': users.get(user_id, {}).get('username')}
+
+    operations, written = [], 0
+    for (dimension, key, day), entry in counts.items():
+        changes = {'loans': entry['loans']}
+        if entry['label']:
+            # Bei gelöschten Büchern/Nutzern bleibt der zuletzt bekannte Name erhalten
+            changes['label'] = entry['label']
+        operations.append(UpdateOne({'dimension': dimension, 'key': key, 'day': day}, {'$set': changes}, upsert=True))
+        if len(operations) >= batch_size:
+            written += len(operations)
+            rollups_collection.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        written += len(operations)
+        rollups_collection.bulk_write(operations, ordered=False)
+    return written
+
+# Die Zählerstände werden absolut gesetzt; von einem nachlaufenden Secondary gelesen, fehlten
+# die jüngsten Ausleihen dauerhaft hinter der Watermark. Daher immer vom Primary, auch aus /reports.
+@read_workload(PRIMARY)
+def update_rollups(now=None, batch_size=1000):
+    # Inkrementeller Lauf: alle Tage ab dem Tag der Watermark neu berechnen
+    end = (now or _now()) - SETTLE_DELAY
+    watermark = get_watermark()
+    if watermark is None:
+        return rebuild_rollups(now, batch_size)
+
+    written = _recompute(start_of_day(watermark), end, batch_size=batch_size)
+    set_watermark(end)
+    return {'written': written, 'watermark': end}
+
+@read_workload(PRIMARY)
+def rebuild_rollups(now=None, batch_size=1000):
+    # Vollständiger Neuaufbau aus Ausleihen und Archiv, monatsweise, um den Speicher zu begrenzen
+    end = (now or _now()) - SETTLE_DELAY
+    rollups_collection.delete_many({})
+
+    first = [collection.find_one({}, {'loan_date': 1}, sort=[('loan_date', ASCENDING)])
+             for collection in (loans_collection, loans_archive_collection)]
+    dates = [loan['loan_date'] for loan in first if loan]
+    written = 0
+
+    if dates:
+        start = period_start(start_of_day(min(dates)), 'month')
+        while start < end:
+            next_month = (start + datetime.timedelta(days=32)).replace(day=1)
+            written += _recompute(start, min(next_month, end), include_archive=True, batch_size=batch_size)
+            start = next_month
+
+    set_watermark(end)
+    return {'written': written, 'watermark': end}
+
+@contextlib.contextmanager
+def refresh_lease():
+    # Sperre in scheduler_state, damit Worker und Berichtsseiten verschiedener Prozesse nicht
+    # gleichzeitig aktualisieren. Liefert False, wenn gerade ein anderer Lauf die Sperre hält.
+    now = _now()
+    until = now + REFRESH_LEASE
+    try:
+        scheduler_state_collection.update_one(
+            {'_id': STATE_ID, '$or': [{'refresh_until': None}, {'refresh_until': {'$lt': now}}]},
+            {'$set': {'refresh_until': until}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Dokument vorhanden, Sperre aber noch gültig
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        scheduler_state_collection.update_one({'_id': STATE_ID, 'refresh_until': until},
+                                              {'$set': {'refresh_until': None}})
+
+def refresh_if_stale(max_age):
+    # Für die Berichtsseite: ohne laufenden Worker höchstens alle max_age Sekunden aktualisieren.
+    # Läuft gerade eine Aktualisierung, zeigt die Seite den bisherigen Stand.
+    watermark = get_watermark()
+    if watermark is None or _now() - SETTLE_DELAY - watermark >= datetime.timedelta(seconds=max_age):
+        with refresh_lease() as claimed, background_writes():
+            if claimed:
+                update_rollups()
+
+def _range_query(dimension, start, end):
+    return {'dimension': dimension, 'day': {'$gte': start, '$lt': end}}
+
+def top_in_range_query(dimension, start, end, limit=10):
+    # Meist ausgeliehene Bücher/Autoren/Nutzer im Zeitraum [start, end)
+    pipeline = [
+        {'$match': _range_query(dimension, start, end)},
+        # Nach Tag sortiert (Index dimension_day), damit $last den neuesten Namen liefert
+        {'$sort': {'day': 1}},
+        {'$group': {'_id': '$key', 'loans': {'$sum': '$loans'}, 'label': {'$last': '$label'}}},
+        {'$sort': {'loans': -1, '_id': 1}},
+    ]
+    if limit:
+        pipeline.append({'$limit': limit})
+    return Query(rollups_collection, 'aggregate', pipeline, allowDiskUse=True)
+
+def top_in_range(dimension, start, end, limit=10):
+    return top_in_range_query(dimension, start, end, limit).run()
+
+def series(dimension, start, end, granularity='day', batch_size=1000):
+    # Liefert (Periodenbeginn, Schlüssel, Name, Ausleihen) sortiert nach Periode; die Tageswerte
+    # kommen nach Tag sortiert und werden pro Periode summiert
+    current, totals = None, {}
+    cursor = rollups_collection.find(
+        _range_query(dimension, start, end), {'key': 1, 'label': 1, 'day': 1, 'loans': 1}, batch_size=batch_size
+    ).sort('day', ASCENDING)
+
+    for rollup in cursor:
+        day = rollup['day'] if rollup['day'].tzinfo else rollup['day'].replace(tzinfo=datetime.timezone.utc)
+        period = period_start(day, granularity)
+        if period != current:
+            yield from _flush(current, totals)
+            current, totals = period, {}
+        entry = totals.setdefault(rollup['key'], [rollup.get('label'), 0])
+        entry[1] += rollup['loans']
+    yield from _flush(current, totals)
+
+def _flush(period, totals):
+    for key, (label, loans) in sorted(totals.items(), key=lambda item: -item[1][1]):
+        yield period, key, label, loans
+
+def totals_by_period(start, end, granularity='day'):
+    return [(period, loans) for period, _, _, loans in series('all', start, end, granularity)]
+
+def recent_range(days=30, now=None):
+    end = start_of_day(now or _now()) + datetime.timedelta(days=1)
+    return end - datetime.timedelta(days=days), end
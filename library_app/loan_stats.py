@@ -0,0 +1,71 @@
+# library_app/loan_stats.py
+# Materialisierte Ausleih-Zähler auf den Buch- und Nutzer-Dokumenten (total_loans,
+# active_loans, last_loan_date). Sie werden bei Ausleihe und Rückgabe fortgeschrieben,
+# sodass "Top N"-Berichte eine indizierte Sortierung statt einer $group-Aggregation sind.
+
+from pymongo import UpdateOne
+
+from .db import books_collection, users_collection, loans_collection, loans_archive_collection
+
+STATS_FIELDS = ('total_loans', 'active_loans', 'last_loan_date')
+
+def borrow_update(loan_date):
+    # Update-Fragment für Buch und Nutzer bei einer neuen Ausleihe
+    return {'$inc': {'total_loans': 1, 'active_loans': 1}, '$max': {'last_loan_date': loan_date}}
+
+def return_update():
+    return {'$inc': {'active_loans': -1}}
+
+def merge_updates(*updates):
+    # Führt mehrere Update-Dokumente zusammen, z.B. {'$inc': ...} aus Route und Zählern
+    merged = {}
+    for update in updates:
+        for operator, fields in update.items():
+            merged.setdefault(operator, {}).update(fields)
+    return merged
+
+def _rebuild(collection, group_field, batch_size):
+    # Zähler aus der Ausleihhistorie in einem Durchlauf neu berechnen und pro Dokument setzen.
+    # Es gibt kein vorheriges Zurücksetzen aller Dokumente, Berichte sehen also nie Nullen.
+    # Die gespeicherten Zähler werden vor der Aggregation gelesen; gesetzt wird nur, wenn sie
+    # unverändert sind (Compare-and-Set). Wer währenddessen ausleiht oder zurückgibt, behält
+    # seine fortgeschriebenen Zähler bis zum nächsten Lauf.
+    stored = {document['_id']: tuple(document.get(field) for field in STATS_FIELDS)
+              for document in collection.find({}, {field: 1 for field in STATS_FIELDS}, batch_size=batch_size)}
+
+    # Archivierte Ausleihen zählen mit (erfordert MongoDB 4.4 für $unionWith)
+    pipeline = [
+        {'$unionWith': loans_archive_collection.name},
+        {'$group': {
+            '_id': f'${group_field}',
+            'total_loans': {'$sum': 1},
+            'active_loans': {'$sum': {'$cond': [{'$eq': [{'$ifNull': ['$return_date', None]}, None]}, 1, 0]}},
+            'last_loan_date': {'$max': '$loan_date'}
+        }}
+    ]
+    computed = {stats['_id']: stats for stats in loans_collection.aggregate(pipeline, allowDiskUse=True,
+                                                                            batchSize=batch_size)}
+    operations = []
+    updated = 0
+
+    for document_id, (total_loans, active_loans, last_loan_date) in stored.items():
+        stats = computed.get(document_id, {'total_loans': 0, 'active_loans': 0, 'last_loan_date': None})
+        if (total_loans, active_loans, last_loan_date) == tuple(stats[field] for field in STATS_FIELDS):
+            continue
+        operations.append(UpdateOne(
+            {'_id': document_id, 'total_loans': total_loans, 'active_loans': active_loans},
+            {'$set': {field: stats[field] for field in STATS_FIELDS}}
+        ))
+        if len(operations) >= batch_size:
+            updated += collection.bulk_write(operations, ordered=False).matched_count
+            operations = []
+
+    if operations:
+        updated += collection.bulk_write(operations, ordered=False).matched_count
+    return updated
+
+def rebuild_loan_stats(batch_size=1000):
+    return {
+        'books': _rebuild(books_collection, 'book_id', batch_size),
+        'users': _rebuild(users_collection, 'user_id', batch_size)
+    }
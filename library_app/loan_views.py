@@ -0,0 +1,66 @@
+# library_app/loan_views.py
+# Datenzugriff für Ausleih-Ansichten. Buchtitel und Nutzernamen werden pro Seite mit einer
+# einzigen $in-Abfrage aufgelöst, statt ein find_one pro Ausleihe auszuführen.
+
+from bson.objectid import ObjectId
+
+from .async_db import Query, fetch_all
+from .db import books_collection, users_collection, loans_collection, loans_archive_collection
+from .pagination import paginate
+
+LOAN_PROJECTION = {'book_id': 1, 'user_id': 1, 'loan_date': 1, 'due_date': 1, 'return_date': 1, 'book_title': 1,
+                   'closed_by_job': 1}
+
+def _lookup_all(lookups):
+    # lookups: (Collection, IDs, Feld); liefert je Eintrag {_id: Feldwert}. Die $in-Abfragen
+    # laufen mit ASYNC_DB gleichzeitig.
+    lookups = [(collection, list(set(ids)), field) for collection, ids, field in lookups]
+    results = iter(fetch_all(Query(collection, 'find', {'_id': {'$in': ids}}, {field: 1})
+                             for collection, ids, field in lookups if ids))
+    return [{document['_id']: document.get(field) for document in next(results)} if ids else {}
+            for _, ids, field in lookups]
+
+def _book_lookup(loans):
+    return books_collection, [loan['book_id'] for loan in loans], 'title'
+
+def _user_lookup(loans):
+    return users_collection, [loan['user_id'] for loan in loans], 'username'
+
+def _set_book_titles(loans, titles):
+    for loan in loans:
+        # Ausleihen gelöschter Bücher tragen den Titel als Kopie (siehe author_jobs)
+        loan['book_title'] = titles.get(loan['book_id']) or loan.get('book_title') or 'Unbekanntes Buch'
+    return loans
+
+def _set_usernames(loans, usernames):
+    for loan in loans:
+        loan['username'] = usernames.get(loan['user_id']) or 'Unbekannter Nutzer'
+    return loans
+
+def attach_book_titles(loans):
+    titles, = _lookup_all([_book_lookup(loans)])
+    return _set_book_titles(loans, titles)
+
+def attach_usernames(loans):
+    usernames, = _lookup_all([_user_lookup(loans)])
+    return _set_usernames(loans, usernames)
+
+def attach_details(loans):
+    # Buchtitel und Nutzernamen in einem Schritt
+    titles, usernames = _lookup_all([_book_lookup(loans), _user_lookup(loans)])
+    return _set_usernames(_set_book_titles(loans, titles), usernames)
+
+def open_loans_for_user(user_id):
+    # Aktuell ausgeliehene Bücher eines Nutzers inklusive Buchtitel
+    loans = list(loans_collection.find(
+        {'user_id': ObjectId(user_id), 'return_date': None}, LOAN_PROJECTION
+    ).sort('loan_date', -1))
+    return attach_book_titles(loans)
+
+def loan_history_page(user_id):
+    # Ausleihhistorie eines Nutzers, neueste zuerst, seitenweise per Keyset-Pagination über
+    # aktuelle und archivierte Ausleihen
+    page = paginate([loans_collection, loans_archive_collection], {'user_id': ObjectId(user_id)},
+                    'loan_date', LOAN_PROJECTION, descending=True)
+    attach_book_titles(page.items)
+    return page
@@ -0,0 +1,379 @@
+# library_app/metrics.py
+# Laufzeitmessungen im Prometheus-Textformat: Antwortzeiten pro Route, Dauer und gelieferte
+# Dokumente pro MongoDB-Befehl und Collection, ein Log für langsame Abfragen sowie der Zustand
+# des Verbindungspools. Die Werte sind prozesslokal; bei mehreren Worker-Prozessen liefert
+# jeder seine eigenen Zahlen.
+
+import contextlib
+import hmac
+import logging
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+from pymongo import monitoring
+
+# Standard-Grenzen der Prometheus-Clients (Sekunden)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_query_logger = logging.getLogger('library_app.slow_queries')
+
+# Felder, die im Log für langsame Befehle unverändert erscheinen; alle übrigen Werte (Filter,
+# Updates, Pipelines) werden auf ihre Form reduziert, eingefügte Dokumente nur gezählt
+PLAIN_FIELDS = frozenset({'collection', 'getMore', 'limit', 'skip', 'batchSize', 'singleBatch', 'sort',
+                          'projection', 'hint', 'ordered', 'allowDiskUse', 'maxTimeMS', 'new', 'upsert'})
+SESSION_FIELDS = frozenset({'lsid', 'txnNumber', 'autocommit', 'startTransaction', 'readConcern', 'writeConcern'})
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_number(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {_format_number(value)}')
+        return lines
+
+class Gauge:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {_format_number(value)}')
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # Labelwerte -> [Zähler pro Grenze, Summe, Anzahl]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, (bucket_counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    labels = _format_labels(self.labels, label_values, ('le', _format_number(bound)))
+                    lines.append(f'{self.name}_bucket{labels} {bucket_count}')
+                labels = _format_labels(self.labels, label_values, ('le', '+Inf'))
+                lines.append(f'{self.name}_bucket{labels} {count}')
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f'{self.name}_sum{labels} {_format_number(total)}')
+                lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+request_duration = registry.add(Histogram(
+    'library_http_request_duration_seconds', 'Antwortzeit pro Route.', ('endpoint', 'method', 'status')
+))
+mongo_command_duration = registry.add(Histogram(
+    'library_mongo_command_duration_seconds', 'Dauer der MongoDB-Befehle.', ('command', 'collection')
+))
+mongo_documents_returned = registry.add(Counter(
+    'library_mongo_documents_returned_total', 'Von MongoDB gelieferte Dokumente.', ('command', 'collection')
+))
+mongo_command_failures = registry.add(Counter(
+    'library_mongo_command_failures_total', 'Fehlgeschlagene MongoDB-Befehle.', ('command', 'collection')
+))
+slow_queries = registry.add(Counter(
+    'library_mongo_slow_queries_total', 'MongoDB-Befehle über der Schwelle SLOW_QUERY_MS.', ('command', 'endpoint')
+))
+admission_in_flight = registry.add(Gauge(
+    'library_admission_in_flight', 'Laufende Anfragen pro Lastklasse.', ('admission_class',)
+))
+admission_queued = registry.add(Gauge(
+    'library_admission_queued', 'Auf einen freien Platz wartende Anfragen pro Lastklasse.', ('admission_class',)
+))
+admission_wait = registry.add(Histogram(
+    'library_admission_wait_seconds', 'Wartezeit auf einen freien Platz pro Lastklasse.', ('admission_class',)
+))
+admission_rejected = registry.add(Counter(
+    'library_admission_rejected_total', 'Abgewiesene Anfragen (503) pro Lastklasse und Grund.',
+    ('admission_class', 'reason')
+))
+rate_limited = registry.add(Counter(
+    'library_rate_limited_total', 'Wegen RATE_LIMITS abgewiesene Anfragen (429) pro Route.', ('endpoint',)
+))
+
+def _current_endpoint():
+    if has_request_context():
+        return request.endpoint or 'unbekannt'
+    return 'ohne-request'
+
+def _shape(value):
+    # Schlüssel und Operatoren bleiben, Werte werden zu '?'; lange Listen werden gekürzt
+    if isinstance(value, dict):
+        return {key: _shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_shape(item) for item in value[:3]] + (['...'] if len(value) > 3 else [])
+    return '?'
+
+def redact_command(command_name, command):
+    # Befehl für das Log ohne Nutzdaten (z.B. Passwort-Hashes in insert/update)
+    shown = {}
+    for key, value in command.items():
+        if key in SESSION_FIELDS or key.startswith('$'):
+            continue
+        if key == command_name or key in PLAIN_FIELDS:
+            shown[key] = value
+        elif key == 'documents':
+            shown[key] = f'<{len(value)} Dokumente>'
+        else:
+            shown[key] = _shape(value)
+    return shown
+
+def _documents_in_reply(reply):
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        return len(cursor.get('firstBatch') or cursor.get('nextBatch') or [])
+    if 'values' in reply:
+        return len(reply['values'])
+    return 0
+
+class CommandMetrics(monitoring.CommandListener):
+    # Beim MongoClient registriert (siehe db.py); misst jeden Befehl und merkt sich pro
+    # request_id die Collection und den Befehlstext, die nur das Start-Ereignis enthält.
+    def __init__(self, slow_query_ms=100):
+        self.slow_query_ms = slow_query_ms
+        self._pending = {}
+        self._lock = threading.Lock()
+        # Anzahl aller abgeschlossenen Befehle, z.B. für Befehle pro Anfrage in Benchmarks
+        self.command_count = 0
+        # Während capture(): Liste aller gestarteten Befehle mit ihrer Route
+        self._captured = None
+
+    @contextlib.contextmanager
+    def capture(self):
+        # Zeichnet alle Befehle im with-Block auf, z.B. für die Prüfung der Abfragepläne
+        captured = []
+        with self._lock:
+            self._captured = captured
+        try:
+            yield captured
+        finally:
+            with self._lock:
+                self._captured = None
+
+    def started(self, event):
+        # Bei getMore steht im Befehl die Cursor-ID, die Collection im Feld "collection"
+        target = event.command.get(event.command_name)
+        collection = target if isinstance(target, str) else event.command.get('collection', '')
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = (collection, event.command)
+            if self._captured is not None:
+                self._captured.append((_current_endpoint(), event.command_name, dict(event.command)))
+
+    def _finish(self, event):
+        with self._lock:
+            self.command_count += 1
+            return self._pending.pop((event.request_id, event.connection_id), ('', None))
+
+    def succeeded(self, event):
+        collection, command = self._finish(event)
+        seconds = event.duration_micros / 1e6
+        mongo_command_duration.observe(seconds, event.command_name, collection)
+        mongo_documents_returned.inc(event.command_name, collection, amount=_documents_in_reply(event.reply))
+
+        if self.slow_query_ms is not None and seconds * 1000 >= self.slow_query_ms:
+            endpoint = _current_endpoint()
+            slow_queries.inc(event.command_name, endpoint)
+            slow_query_logger.warning(
+                'Langsamer MongoDB-Befehl: %s auf %s in %.1f ms (Route %s): %.500s',
+                event.command_name, collection or '-', seconds * 1000, endpoint,
+                redact_command(event.command_name, command or {})
+            )
+
+    def failed(self, event):
+        collection, _ = self._finish(event)
+        mongo_command_duration.observe(event.duration_micros / 1e6, event.command_name, collection)
+        mongo_command_failures.inc(event.command_name, collection)
+
+command_metrics = CommandMetrics()
+
+pool_checkout_duration = registry.add(Histogram(
+    'library_mongo_pool_checkout_seconds', 'Wartezeit auf eine Verbindung aus dem Pool.', ('address',)
+))
+
+# Zähler pro Server im Verbindungspool: Momentanwerte (gauge) und fortlaufende Summen (counter)
+POOL_GAUGES = {
+    'open': 'Offene Verbindungen.',
+    'in_use': 'Ausgeliehene Verbindungen.',
+    'waiting': 'Auf eine Verbindung wartende Threads.',
+}
+POOL_COUNTERS = {
+    'created': 'Aufgebaute Verbindungen.',
+    'closed': 'Geschlossene Verbindungen.',
+    'checkout_failed': 'Fehlgeschlagene Anforderungen einer Verbindung, z.B. nach waitQueueTimeoutMS.',
+    'cleared': 'Geleerte Pools nach Netzwerkfehlern.',
+}
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    # Beim MongoClient registriert (siehe db.py); führt pro Serveradresse Buch über den
+    # Verbindungspool dieses Prozesses. Für /metrics und /api/monitoring/db_pool.
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        # Nach einem fork gehören die gezählten Verbindungen dem Elternprozess
+        with self._lock:
+            self._pools = {}
+
+    def _change(self, event, **changes):
+        address = '%s:%s' % event.address
+        with self._lock:
+            pool = self._pools.get(address)
+            if pool is None:
+                pool = self._pools[address] = dict.fromkeys(list(POOL_GAUGES) + list(POOL_COUNTERS), 0)
+            for key, amount in changes.items():
+                pool[key] += amount
+
+    def stats(self):
+        with self._lock:
+            return {address: dict(pool) for address, pool in self._pools.items()}
+
+    def pool_created(self, event):
+        self._change(event)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._change(event, cleared=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._change(event, open=1, created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._change(event, open=-1, closed=1)
+
+    def connection_check_out_started(self, event):
+        self._change(event, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._change(event, waiting=-1, checkout_failed=1)
+
+    def connection_checked_out(self, event):
+        self._change(event, waiting=-1, in_use=1)
+        # Ab pymongo 4.7 enthält das Ereignis die Wartezeit
+        if getattr(event, 'duration', None) is not None:
+            pool_checkout_duration.observe(event.duration, '%s:%s' % event.address)
+
+    def connection_checked_in(self, event):
+        self._change(event, in_use=-1)
+
+    def render(self):
+        pools = sorted(self.stats().items())
+        lines = []
+        for metrics, metric_type, suffix in ((POOL_GAUGES, 'gauge', ''), (POOL_COUNTERS, 'counter', '_total')):
+            for key, documentation in metrics.items():
+                name = f'library_mongo_pool_{key}{suffix}'
+                lines.extend([f'# HELP {name} {documentation}', f'# TYPE {name} {metric_type}'])
+                lines.extend(f"{name}{_format_labels(('address',), (address,))} {_format_number(pool[key])}"
+                             for address, pool in pools)
+        return lines
+
+pool_metrics = registry.add(PoolMetrics())
+
+def _token_matches(token):
+    # "Authorization: Bearer <token>", z.B. authorization.credentials in der Prometheus-Konfiguration
+    header = request.headers.get('Authorization', '')
+    return bool(token) and header.startswith('Bearer ') and hmac.compare_digest(header[7:].encode(), token.encode())
+
+def init_app(app, is_admin):
+    # Zeitmessung pro Anfrage und Endpunkt /metrics registrieren. /metrics verlangt METRICS_TOKEN
+    # oder einen angemeldeten Administrator (is_admin, aus create_app wegen der Importreihenfolge)
+    command_metrics.slow_query_ms = app.config.get('SLOW_QUERY_MS')
+    token = app.config.get('METRICS_TOKEN')
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_duration(response):
+        started = g.pop('metrics_started', None)
+        if started is not None and request.endpoint != 'metrics':
+            request_duration.observe(time.perf_counter() - started,
+                                     request.endpoint or 'unbekannt', request.method, str(response.status_code))
+        return response
+
+    def metrics():
+        if not (_token_matches(token) or is_admin()):
+            return Response('Zugriff verweigert.\n', 401, {'WWW-Authenticate': 'Bearer'}, mimetype='text/plain')
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
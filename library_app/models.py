@@ -1,17 +1,109 @@
 # library_app/models.py
-# Definiert die Datenmodelle der Anwendung, wie z.B. die `User`-Klasse für Flask-Login.
+# Definiert die Datenmodelle der Anwendung, wie z.B. die `User`-Klasse für Flask-Login,
+# sowie einen prozesslokalen Cache für die bei jeder Anfrage geladenen Benutzer.
+
+import threading
+import time
+from collections import OrderedDict
 
-from flask_login import UserMixin
 from bson.objectid import ObjectId
 
 from .db import users_collection
+from .read_routing import PRIMARY, read_workload
+
+class User:
+    # Kompaktes Objekt für Flask-Login: nur ID, Name und Rolle, ohne Instanz-Dictionary
+    __slots__ = ('id', 'username', 'role')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
 
-class User(UserMixin):
     def __init__(self, user_data):
         self.id = str(user_data['_id'])
         self.username = user_data['username']
         self.role = user_data.get('role', 'user')
 
+    def get_id(self):
+        return self.id
+
+    def __eq__(self, other):
+        return isinstance(other, User) and self.id == other.id
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.id)
+
+class UserCache:
+    # Begrenzter LRU-Cache mit TTL, Schlüssel ist die Benutzer-ID als String
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def put(self, user_id, user):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic(), user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+user_cache = UserCache()
+
+def _load_user(user_id):
+    user_data = users_collection.find_one({'_id': ObjectId(user_id)}, {'username': 1, 'role': 1})
+    if not user_data:
+        user_cache.invalidate(user_id)
+        return None
+
+    user = User(user_data)
+    user_cache.put(user_id, user)
+    return user
+
+# Rollen und gerade registrierte Nutzer immer vom Primary, auch auf Routen, die von Secondaries lesen
+@read_workload(PRIMARY)
 def load_user_for_login(user_id):
-    user_data = users_collection.find_one({'_id': ObjectId(user_id)})
-    return User(user_data) if user_data else None
\ No newline at end of file
+    if not ObjectId.is_valid(user_id):
+        return None
+
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    return _load_user(user_id)
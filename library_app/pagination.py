@@ -0,0 +1,133 @@
+# library_app/pagination.py
+# Keyset-Pagination (Seek-Methode) für Listenansichten. Statt skip/limit wird ab dem
+# letzten Sortierwert plus `_id` weitergelesen, sodass jede Seite gleich schnell ist.
+
+import base64
+import binascii
+
+from bson import json_util
+from flask import current_app, request
+from pymongo import ASCENDING, DESCENDING
+
+from .async_db import Query, fetch_all
+
+class Page:
+    def __init__(self, items, next_token=None, prev_token=None, per_page=None, truncated=False):
+        self.items = items
+        self.next_token = next_token
+        self.prev_token = prev_token
+        self.per_page = per_page
+        # True, wenn die Ergebnismenge begrenzt wurde (z.B. Suche mit zu vielen Treffern)
+        self.truncated = truncated
+
+    @property
+    def has_next(self):
+        return self.next_token is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_token is not None
+
+def encode_values(values):
+    raw = json_util.dumps(list(values))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_values(token, count):
+    # Ungültige oder manipulierte Tokens führen zur ersten Seite statt zu einem Fehler
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if not isinstance(values, list) or len(values) != count:
+        return None
+    return tuple(values)
+
+def encode_token(document, sort_field):
+    return encode_values([document.get(sort_field), document['_id']])
+
+def decode_token(token):
+    return decode_values(token, 2)
+
+def _seek_filter(sort_field, value, object_id, operator):
+    # Vergleiche wie $gt/$lt greifen nur innerhalb eines BSON-Typs; null und fehlende Felder
+    # sortieren vor allen Werten und brauchen daher eigene Zweige
+    if value is None:
+        if operator == '$gt':
+            return {'$or': [
+                {sort_field: {'$ne': None}},
+                {sort_field: None, '_id': {'$gt': object_id}}
+            ]}
+        return {sort_field: None, '_id': {'$lt': object_id}}
+
+    branches = [
+        {sort_field: {operator: value}},
+        {sort_field: value, '_id': {operator: object_id}}
+    ]
+    if operator == '$lt':
+        branches.append({sort_field: None})
+    return {'$or': branches}
+
+def _sort_key(document, sort_field):
+    # Wie MongoDB: null und fehlende Felder vor allen Werten
+    value = document.get(sort_field)
+    return (value is not None, value, document['_id'])
+
+def get_per_page():
+    # Seitengröße aus der URL, begrenzt durch die Konfiguration
+    default = current_app.config.get('PAGE_SIZE', 50)
+    maximum = current_app.config.get('MAX_PAGE_SIZE', 200)
+    per_page = request.args.get('per_page', default, type=int)
+    return max(1, min(per_page, maximum))
+
+def keyset_page(collection, query, sort_field, projection=None, per_page=50, after=None, before=None,
+                descending=False):
+    # Liefert eine Seite nach `sort_field` (und `_id`) sortierter Dokumente.
+    # `after` blättert vorwärts, `before` rückwärts; beide sind Tokens aus encode_token.
+    # `collection` darf auch eine Liste sein (z.B. Ausleihen und Archiv), die Seiten werden gemischt.
+    cursor_position = decode_token(before or after) if (before or after) else None
+    backwards = bool(before) and cursor_position is not None
+    # Rückwärtsblättern kehrt Sortierung und Vergleich um
+    reverse = backwards != descending
+    filters = [query] if query else []
+
+    if cursor_position is not None:
+        value, object_id = cursor_position
+        filters.append(_seek_filter(sort_field, value, object_id, '$lt' if reverse else '$gt'))
+
+    direction = DESCENDING if reverse else ASCENDING
+    final_query = {'$and': filters} if len(filters) > 1 else (filters[0] if filters else {})
+
+    collections = collection if isinstance(collection, (list, tuple)) else [collection]
+    # Mehrere Collections werden mit ASYNC_DB gleichzeitig gelesen
+    documents = []
+    for found in fetch_all(Query(source, 'find', final_query, projection, limit=per_page + 1,
+                                 sort=[(sort_field, direction), ('_id', direction)])
+                           for source in collections):
+        documents.extend(found)
+    if len(collections) > 1:
+        documents.sort(key=lambda document: _sort_key(document, sort_field), reverse=reverse)
+        documents = documents[:per_page + 1]
+    has_more = len(documents) > per_page
+    documents = documents[:per_page]
+
+    if backwards:
+        documents.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = cursor_position is not None, has_more
+
+    next_token = encode_token(documents[-1], sort_field) if documents and has_next else None
+    prev_token = encode_token(documents[0], sort_field) if documents and has_prev else None
+
+    return Page(documents, next_token=next_token, prev_token=prev_token, per_page=per_page)
+
+def paginate(collection, query, sort_field, projection=None, descending=False):
+    # Liest Seitengröße und Tokens aus der aktuellen Anfrage
+    return keyset_page(
+        collection, query, sort_field, projection,
+        per_page=get_per_page(),
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        descending=descending
+    )
@@ -0,0 +1,103 @@
+# library_app/read_routing.py
+# Lese-Routing pro Arbeitslast: Berichte, Exporte und Listen dürfen von Secondaries lesen,
+# Ausleihe, Rückgabe, Anmeldung und alle übrigen Pfade lesen vom Primary. Die Arbeitslast
+# einer Anfrage ergibt sich aus ihrem Endpunkt (READ_ROUTES); einzelne Funktionen legen sie
+# mit read_workload() fest. Die Collections aus db.py wenden bei jedem Zugriff die
+# Lesepräferenz der aktuellen Arbeitslast an. Schreibbefehle gehen immer an den Primary.
+
+import contextlib
+import contextvars
+import fnmatch
+import time
+
+from flask import g, has_app_context, has_request_context, request, session
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+
+PRIMARY = 'primary'
+
+# Zuschlag auf maxStalenessSeconds: der Client schätzt den Rückstand aus den Heartbeats
+# (heartbeatFrequencyMS, Voreinstellung 10 s)
+STALENESS_MARGIN = 10
+
+# Von read_workload() gesetzt; hat Vorrang vor der Arbeitslast der Anfrage
+_override = contextvars.ContextVar('read_workload', default=None)
+
+def make_preference(spec):
+    # {'mode': 'secondaryPreferred', 'max_staleness': 120, 'tags': [{'dc': 'ost'}]}
+    return make_read_preference(read_pref_mode_from_name(spec.get('mode', PRIMARY)),
+                                spec.get('tags'), spec.get('max_staleness', -1))
+
+class ReadRouter:
+    def __init__(self):
+        # Arbeitslast -> ReadPreference; nicht aufgeführte Arbeitslasten lesen vom Primary
+        self.preferences = {}
+        # Endpunkt oder Muster (z.B. 'main.export_*') -> Arbeitslast
+        self.routes = {}
+        self.read_your_writes = 0
+        # Wird bei jeder Änderung erhöht, damit db.py zwischengespeicherte Collections verwirft
+        self.generation = 0
+
+    def configure(self, preferences, routes, read_your_writes=0):
+        self.preferences = {name: make_preference(spec) for name, spec in preferences.items()}
+        self.routes = dict(routes)
+        self.read_your_writes = read_your_writes
+        self.generation += 1
+
+    def workload_for(self, endpoint):
+        if endpoint is None:
+            return PRIMARY
+        if endpoint in self.routes:
+            return self.routes[endpoint]
+        for pattern, workload in self.routes.items():
+            if fnmatch.fnmatchcase(endpoint, pattern):
+                return workload
+        return PRIMARY
+
+    def current_workload(self):
+        workload = _override.get()
+        if workload is None and has_app_context():
+            workload = g.get('read_workload')
+        return workload or PRIMARY
+
+    def current_preference(self):
+        # None: Voreinstellung des Clients (Primary)
+        return self.preferences.get(self.current_workload())
+
+    def lag_bound(self):
+        # Höchster Rückstand (Sekunden) der Knoten, von denen die aktuelle Arbeitslast liest:
+        # 0 für den Primary, None ohne max_staleness (unbegrenzt)
+        preference = self.current_preference()
+        if preference is None or preference.mode == 0:
+            return 0
+        if preference.max_staleness == -1:
+            return None
+        return preference.max_staleness + STALENESS_MARGIN
+
+read_router = ReadRouter()
+
+@contextlib.contextmanager
+def read_workload(name):
+    # Als with-Block oder Dekorator, z.B. @read_workload(PRIMARY) für Lesezugriffe, deren
+    # Ergebnis wieder geschrieben wird und daher nicht veraltet sein darf
+    token = _override.set(name)
+    try:
+        yield
+    finally:
+        _override.reset(token)
+
+def note_write():
+    # Nach eigenen Schreibzugriffen liest die Sitzung READ_YOUR_WRITES_SECONDS lang vom Primary,
+    # damit z.B. ein neu angelegtes Buch nach der Weiterleitung in der Liste erscheint
+    if read_router.read_your_writes and has_request_context():
+        session['read_primary_until'] = time.time() + read_router.read_your_writes
+
+def init_app(app):
+    read_router.configure(app.config['READ_PREFERENCES'], app.config['READ_ROUTES'],
+                          app.config['READ_YOUR_WRITES_SECONDS'])
+
+    @app.before_request
+    def choose_read_workload():
+        workload = read_router.workload_for(request.endpoint)
+        if workload != PRIMARY and session.get('read_primary_until', 0) > time.time():
+            workload = PRIMARY
+        g.read_workload = workload
@@ -0,0 +1,177 @@
+# library_app/reminders.py
+# Erinnerungen für bald fällige und überfällige Ausleihen. Ein Lauf betrachtet nur Ausleihen,
+# deren Fälligkeit seit dem letzten Lauf (Watermark) in ein Zeitfenster gerückt ist, und
+# schreibt Erinnerungen stapelweise in eine Outbox. Ein austauschbarer Sender stellt sie zu.
+
+import datetime
+import json
+import os
+import smtplib
+from email.message import EmailMessage
+
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+from .db import db, loans_collection
+from .loan_views import attach_details
+
+outbox_collection = db['reminder_outbox']
+scheduler_state_collection = db['scheduler_state']
+
+STATE_ID = 'reminders'
+DUPLICATE_KEY = 11000
+
+def get_watermark():
+    state = scheduler_state_collection.find_one({'_id': STATE_ID})
+    return state['watermark'] if state else None
+
+def set_watermark(value):
+    scheduler_state_collection.update_one({'_id': STATE_ID}, {'$set': {'watermark': value}}, upsert=True)
+
+def _reminder(loan, kind, now):
+    return {
+        # Idempotenzschlüssel: pro Ausleihe und Art höchstens eine Erinnerung
+        '_id': f"{loan['_id']}:{kind}",
+        'kind': kind,
+        'loan_id': loan['_id'],
+        'user_id': loan['user_id'],
+        'username': loan['username'],
+        'book_title': loan['book_title'],
+        'due_date': loan['due_date'],
+        'created_at': now,
+        'status': 'pending',
+        'attempts': 0
+    }
+
+def _insert_batch(reminders):
+    # Bereits vorhandene Schlüssel (Wiederholungen nach Abbruch) werden übersprungen
+    if not reminders:
+        return 0
+    try:
+        return len(outbox_collection.insert_many(reminders, ordered=False).inserted_ids)
+    except BulkWriteError as error:
+        if any(write_error['code'] != DUPLICATE_KEY for write_error in error.details['writeErrors']):
+            raise
+        return error.details['nInserted']
+
+def _enqueue(query, kind, now, batch_size):
+    created, scanned, batch = 0, 0, []
+    cursor = loans_collection.find(
+        query, {'book_id': 1, 'user_id': 1, 'due_date': 1}, batch_size=batch_size
+    ).sort('due_date', ASCENDING)
+
+    for loan in cursor:
+        batch.append(loan)
+        if len(batch) >= batch_size:
+            created += _insert_batch([_reminder(item, kind, now) for item in attach_details(batch)])
+            scanned += len(batch)
+            batch = []
+
+    if batch:
+        created += _insert_batch([_reminder(item, kind, now) for item in attach_details(batch)])
+        scanned += len(batch)
+    return scanned, created
+
+def scan(soon_window=datetime.timedelta(days=2), lookback=None, batch_size=500, now=None):
+    # Schreibt Erinnerungen für alle offenen Ausleihen, die seit dem letzten Lauf
+    # überfällig oder bald fällig geworden sind, und verschiebt anschließend die Watermark.
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    watermark = get_watermark()
+    if watermark is None:
+        # Erster Lauf: alle bereits überfälligen Ausleihen (optional begrenzt) erfassen
+        watermark = now - lookback if lookback else datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+    elif watermark.tzinfo is None:
+        watermark = watermark.replace(tzinfo=datetime.timezone.utc)
+
+    overdue = _enqueue(
+        {'return_date': None, 'due_date': {'$gte': watermark, '$lt': now}}, 'overdue', now, batch_size
+    )
+    due_soon = _enqueue(
+        {'return_date': None, 'due_date': {'$gte': max(watermark + soon_window, now), '$lt': now + soon_window}},
+        'due_soon', now, batch_size
+    )
+    set_watermark(now)
+
+    return {
+        'watermark': watermark, 'now': now,
+        'overdue_scanned': overdue[0], 'overdue_created': overdue[1],
+        'due_soon_scanned': due_soon[0], 'due_soon_created': due_soon[1]
+    }
+
+def render_message(reminder):
+    due = reminder['due_date'].strftime('%d.%m.%Y')
+    if reminder['kind'] == 'overdue':
+        subject = f"Überfällig: {reminder['book_title']}"
+        body = f"Hallo {reminder['username']},\n\ndas Buch '{reminder['book_title']}' war am {due} fällig. Bitte geben Sie es zurück."
+    else:
+        subject = f"Bald fällig: {reminder['book_title']}"
+        body = f"Hallo {reminder['username']},\n\ndas Buch '{reminder['book_title']}' ist am {due} fällig."
+    return subject, body
+
+class FileSender:
+    # Schreibt jede Erinnerung als JSON-Zeile in eine Datei (lokaler Ersatz für Mailversand)
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, reminder):
+        subject, body = render_message(reminder)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as output:
+            output.write(json.dumps({
+                'id': reminder['_id'], 'to': reminder['username'], 'subject': subject, 'body': body
+            }, ensure_ascii=False) + '\n')
+
+class SmtpSender:
+    # Versand per SMTP, z.B. an einen lokalen Debug-Server: python -m aiosmtpd -n -l localhost:1025
+    def __init__(self, host='localhost', port=1025, sender='bibliothek@localhost', domain='localhost'):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.domain = domain
+
+    def send(self, reminder):
+        subject, body = render_message(reminder)
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = f"{reminder['username']}@{self.domain}"
+        message['Subject'] = subject
+        message.set_content(body)
+        with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+            smtp.send_message(message)
+
+def sender_from_config(config):
+    if config.get('REMINDER_SENDER') == 'smtp':
+        return SmtpSender(
+            config.get('REMINDER_SMTP_HOST', 'localhost'), config.get('REMINDER_SMTP_PORT', 1025),
+            config.get('REMINDER_MAIL_FROM', 'bibliothek@localhost'), config.get('REMINDER_MAIL_DOMAIN', 'localhost')
+        )
+    return FileSender(config.get('REMINDER_FILE', 'reminders.log'))
+
+def deliver_pending(sender, batch_size=100, max_attempts=5):
+    # Stellt ausstehende Erinnerungen zu; Fehlschläge werden bis max_attempts erneut versucht
+    delivered, failed = 0, 0
+    pending = list(outbox_collection.find(
+        {'status': 'pending', 'attempts': {'$lt': max_attempts}}
+    ).sort('created_at', ASCENDING).limit(batch_size))
+
+    for reminder in pending:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        try:
+            sender.send(reminder)
+        except (OSError, smtplib.SMTPException) as error:
+            failed += 1
+            outbox_collection.update_one(
+                {'_id': reminder['_id']},
+                {'$inc': {'attempts': 1}, '$set': {'last_error': str(error), 'last_attempt': now}}
+            )
+            continue
+
+        delivered += 1
+        outbox_collection.update_one(
+            {'_id': reminder['_id']},
+            {'$inc': {'attempts': 1}, '$set': {'status': 'sent', 'sent_at': now}}
+        )
+
+    return {'delivered': delivered, 'failed': failed}
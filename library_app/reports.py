@@ -0,0 +1,168 @@
+# library_app/reports.py
+# Berichts-Engine: Jeder Bericht ist genau einmal definiert und wird sowohl für die
+# Berichtsseite als auch für die CSV-Exporte genutzt. Alle Berichte werden in einer
+# einzigen Aggregation ausgeführt (mit ASYNC_DB als gleichzeitige Einzelabfragen) und mit
+# TTL prozesslokal zwischengespeichert.
+
+import datetime
+import threading
+import time
+
+from pymongo.errors import OperationFailure
+
+from .async_db import Query, async_runner, fetch_all
+from .db import db
+
+class ReportDefinition:
+    def __init__(self, name, collection_name, pipeline, filename, header, row):
+        self.name = name
+        self.collection_name = collection_name
+        # pipeline(now) liefert die Aggregations-Stufen des Berichts
+        self.pipeline = pipeline
+        self.filename = filename
+        self.header = header
+        # row(dokument) liefert eine CSV-Zeile
+        self.row = row
+
+def _top_books_pipeline(now):
+    return [
+        {'$match': {'total_loans': {'$gt': 0}}},
+        {'$sort': {'total_loans': -1}},
+        {'$project': {'_id': 0, 'title': 1, 'author_name': 1, 'loan_count': '$total_loans'}}
+    ]
+
+def _top_users_pipeline(now):
+    return [
+        {'$match': {'total_loans': {'$gt': 0}}},
+        {'$sort': {'total_loans': -1}},
+        {'$project': {'_id': 0, 'username': 1, 'loan_count': '$total_loans'}}
+    ]
+
+def _overdue_pipeline(now):
+    return [
+        {'$match': {'return_date': None, 'due_date': {'$lt': now}}},
+        {'$sort': {'due_date': 1}},
+        {'$lookup': {'from': 'books', 'localField': 'book_id', 'foreignField': '_id', 'as': 'book_details'}},
+        {'$lookup': {'from': 'users', 'localField': 'user_id', 'foreignField': '_id', 'as': 'user_details'}},
+        {'$unwind': '$book_details'}, {'$unwind': '$user_details'},
+        {'$project': {
+            '_id': 0, 'username': '$user_details.username', 'book_title': '$book_details.title',
+            'due_date': '$due_date',
+            'days_overdue': {'$floor': {'$divide': [{'$subtract': [now, '$due_date']}, 1000 * 60 * 60 * 24]}}
+        }}
+    ]
+
+REPORTS = {
+    'top_books': ReportDefinition(
+        'top_books', 'books', _top_books_pipeline, 'bericht_top_buecher.csv',
+        ['Titel', 'Autor', 'Anzahl Ausleihen'],
+        lambda row: [row.get('title'), row.get('author_name'), row.get('loan_count')]
+    ),
+    'top_users': ReportDefinition(
+        'top_users', 'users', _top_users_pipeline, 'bericht_top_nutzer.csv',
+        ['Benutzername', 'Anzahl Ausleihen'],
+        lambda row: [row.get('username'), row.get('loan_count')]
+    ),
+    'overdue_books': ReportDefinition(
+        'overdue_books', 'loans', _overdue_pipeline, 'bericht_ueberfaellige_buecher.csv',
+        ['Nutzername', 'Buchtitel', 'Fällig am', 'Tage überfällig'],
+        lambda row: [row.get('username'), row.get('book_title'), row['due_date'].strftime('%d.%m.%Y'), row.get('days_overdue')]
+    ),
+}
+
+class ReportResult:
+    def __init__(self, rows, truncated, generated_at):
+        self.rows = rows
+        # truncated: Ergebnis wurde durch das Zeilenlimit des Caches abgeschnitten
+        self.truncated = truncated
+        self.generated_at = generated_at
+
+class ReportEngine:
+    def __init__(self, ttl=60, row_limit=1000):
+        self.ttl = ttl
+        self.row_limit = row_limit
+        self._cache = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        # Wird nach schreibenden Ausleih-Operationen aufgerufen
+        self._generation += 1
+        self._cache = {}
+
+    def _fetch_combined(self, definitions, now):
+        # Ein Roundtrip: Datenbank-Aggregation mit einem $lookup-Unterpipeline je Bericht.
+        # Die Unterpipelines nutzen die Indizes der jeweiligen Collection.
+        pipeline = [{'$documents': [{}]}]
+        for definition in definitions:
+            pipeline.append({'$lookup': {
+                'from': definition.collection_name,
+                'pipeline': definition.pipeline(now) + [{'$limit': self.row_limit + 1}],
+                'as': definition.name
+            }})
+        combined = next(db.aggregate(pipeline, allowDiskUse=True))
+        return {definition.name: combined[definition.name] for definition in definitions}
+
+    def _fetch_separately(self, definitions, now):
+        # Eine Aggregation je Bericht, mit ASYNC_DB gleichzeitig auf dem Server ausgeführt;
+        # ohne ASYNC_DB der Rückfall für Server ohne $documents (MongoDB < 5.1)
+        results = fetch_all(
+            Query(db[definition.collection_name], 'aggregate',
+                  definition.pipeline(now) + [{'$limit': self.row_limit + 1}], allowDiskUse=True)
+            for definition in definitions
+        )
+        return {definition.name: rows for definition, rows in zip(definitions, results)}
+
+    def _missing(self, cache, names):
+        current = time.monotonic()
+        return [name for name in names if name not in cache or current - cache[name][0] >= self.ttl]
+
+    def get(self, names):
+        # Liefert {name: ReportResult}; abgelaufene oder fehlende Berichte werden gemeinsam geladen
+        cache = self._cache
+
+        if self._missing(cache, names):
+            with self._lock:
+                # Erneut prüfen: ein anderer Thread hat die Berichte eventuell gerade geladen
+                cache = self._cache
+                missing = self._missing(cache, names)
+                if not missing:
+                    return {name: cache[name][1] for name in names}
+
+                generation = self._generation
+                now = datetime.datetime.now(datetime.timezone.utc)
+                definitions = [REPORTS[name] for name in missing]
+                if async_runner.enabled:
+                    fetched = self._fetch_separately(definitions, now)
+                else:
+                    try:
+                        fetched = self._fetch_combined(definitions, now)
+                    except OperationFailure:
+                        fetched = self._fetch_separately(definitions, now)
+
+                cache = dict(self._cache)
+                for name, rows in fetched.items():
+                    truncated = len(rows) > self.row_limit
+                    cache[name] = (time.monotonic(), ReportResult(rows[:self.row_limit], truncated, now))
+
+                # Während des Ladens invalidierte Ergebnisse werden ausgeliefert, aber nicht gespeichert
+                if generation == self._generation:
+                    self._cache = cache
+
+        return {name: cache[name][1] for name in names}
+
+    def stream(self, name, batch_size=1000):
+        # Zeilen für den CSV-Export: aus dem Cache, solange das Ergebnis vollständig ist,
+        # sonst direkt per Cursor über dieselbe Definition
+        definition = REPORTS[name]
+        result = self.get([name])[name]
+        if not result.truncated:
+            return (definition.row(row) for row in result.rows)
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cursor = db[definition.collection_name].aggregate(
+            definition.pipeline(now), allowDiskUse=True, batchSize=batch_size
+        )
+        return (definition.row(row) for row in cursor)
+
+report_engine = ReportEngine()
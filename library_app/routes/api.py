@@ -1,10 +1,19 @@
 # library_app/routes/api.py
 # Blueprint für API-Endpunkte, die Daten im JSON-Format für Frontend-Interaktionen bereitstellen.
 
-from flask import Blueprint, request, jsonify
+from bson.objectid import ObjectId
+from flask import Blueprint, current_app, request, jsonify
 from flask_login import login_required 
 
-from ..db import authors_collection
+from ..author_index import author_index
+from ..author_jobs import get_job, job_status
+from ..circulation import bulk_borrow, bulk_return
+from ..db import client_options, settings, users_collection
+from ..decorators import api_admin_required, api_librarian_required
+from ..metrics import pool_metrics
+from ..read_routing import read_router
+from ..models import user_cache
+from ..reports import report_engine
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -15,15 +24,85 @@ def search_authors():
    
     if not query:
         return jsonify([])
-        
-    # Das '^'-Zeichen sorgt dafür, dass nur der Anfang des Namens zählt.
-    regex_query = f"^{query}"
-
-    authors = authors_collection.find(
-        {'name': {'$regex': regex_query, '$options': 'i'}},
-        {'name': 1, '_id': 0} # Nur das 'name'-Feld zurückgeben
-    ).limit(10)
-    
-    author_names = [author['name'] for author in authors]
-    
-    return jsonify(author_names)
\ No newline at end of file
+
+    # Antwort aus dem prozesslokalen Präfix-Index statt einer Datenbankabfrage pro Tastendruck.
+    # Kein @conditional: die Versionsstempel wären wieder eine Abfrage pro Tastendruck und passen
+    # nicht zum Stand des Index, der bis zu seiner Auffrischung ältere Namen liefert.
+    return jsonify(author_index.search(query, limit=10))
+
+def _parse_circulation_request():
+    # Erwartet {"user_id": "...", "items": ["<Buch-ID, ISBN oder Ausleih-ID>", ...]}
+    # oder statt user_id einen "username". Liefert (user, items) oder eine Fehlerantwort.
+    payload = request.get_json(silent=True) or {}
+    items = payload.get('items')
+    limit = current_app.config.get('CIRCULATION_BATCH_LIMIT', 100)
+
+    if not isinstance(items, list) or not items or not all(isinstance(item, str) for item in items):
+        return None, None, (jsonify({'error': '"items" muss eine nicht leere Liste von Zeichenketten sein.'}), 400)
+    if len(items) > limit:
+        return None, None, (jsonify({'error': f'Höchstens {limit} Einträge pro Anfrage.'}), 400)
+
+    if ObjectId.is_valid(str(payload.get('user_id', ''))):
+        user = users_collection.find_one({'_id': ObjectId(payload['user_id'])}, {'username': 1})
+    elif payload.get('username'):
+        user = users_collection.find_one({'username': payload['username']}, {'username': 1})
+    else:
+        user = None
+
+    if user is None:
+        return None, None, (jsonify({'error': 'Benutzer nicht gefunden.'}), 404)
+    return user, [item.strip() for item in items], None
+
+def _circulation_response(user, results):
+    succeeded = sum(1 for result in results if result['ok'])
+    if succeeded:
+        report_engine.invalidate()
+    return jsonify({
+        'user_id': str(user['_id']),
+        'username': user['username'],
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results
+    })
+
+@api_bp.route('/circulation/checkout', methods=['POST'])
+@api_librarian_required
+def bulk_checkout():
+    user, items, error = _parse_circulation_request()
+    if error:
+        return error
+    return _circulation_response(user, bulk_borrow(user['_id'], items))
+
+@api_bp.route('/circulation/return', methods=['POST'])
+@api_librarian_required
+def bulk_checkin():
+    user, items, error = _parse_circulation_request()
+    if error:
+        return error
+    return _circulation_response(user, bulk_return(user['_id'], items))
+
+@api_bp.route('/monitoring/user_cache')
+@api_admin_required
+def user_cache_stats():
+    # Treffer/Fehlschläge des Benutzer-Caches dieses Worker-Prozesses
+    return jsonify(user_cache.stats())
+
+@api_bp.route('/monitoring/db_pool')
+@api_admin_required
+def db_pool_stats():
+    # Verbindungspool dieses Worker-Prozesses pro Server, die wirksamen Client-Optionen und das Lese-Routing
+    return jsonify({
+        'options': client_options(settings),
+        'pools': pool_metrics.stats(),
+        'read_preferences': {name: preference.document for name, preference in read_router.preferences.items()},
+        'read_routes': read_router.routes,
+    })
+
+@api_bp.route('/jobs/authors/<job_id>')
+@api_librarian_required
+def author_job_status(job_id):
+    # Fortschritt eines Autoren-Auftrags (Umbenennen oder Löschen)
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Auftrag nicht gefunden.'}), 404
+    return jsonify(job_status(job))
@@ -6,9 +6,11 @@ import datetime
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import login_user, logout_user, login_required, current_user
+from pymongo.errors import DuplicateKeyError
 
 from ..db import users_collection
 from ..models import User
+from ..search import USER_SEARCH, search_fields
 
 auth_bp = Blueprint('auth', __name__, template_folder='templates')
 
@@ -24,12 +26,19 @@ def register():
         
         hashed_password = generate_password_hash(password)
         role = 'admin' if users_collection.count_documents({}) == 0 else 'user'
-        users_collection.insert_one({
-            'username': username, 
-            'password': hashed_password, 
-            'role': role,
-            'registered_on': datetime.datetime.now(datetime.timezone.utc)
-        })
+        try:
+            new_user = {
+                'username': username, 
+                'password': hashed_password, 
+                'role': role,
+                'registered_on': datetime.datetime.now(datetime.timezone.utc)
+            }
+            new_user.update(search_fields(USER_SEARCH, new_user))
+            users_collection.insert_one(new_user)
+        except DuplicateKeyError:
+            # Eindeutiger Index auf username greift bei gleichzeitigen Registrierungen
+            flash('Benutzername bereits vergeben.', 'danger')
+            return redirect(url_for('auth.register'))
        
         flash(f'Registrierung erfolgreich! Sie haben die Rolle "{role}". Bitte anmelden.', 'success')
         
@@ -1,31 +1,40 @@
 # library_app/routes/authors.py
 # Blueprint für alle Routen, die die Verwaltung von Autoren betreffen (CRUD und Suche).
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash
 from bson.objectid import ObjectId
 
-from ..db import authors_collection, books_collection
-from ..decorators import librarian_required
+from ..author_index import author_index
+from ..author_jobs import enqueue, recent_jobs, start_in_background
+from ..db import authors_collection
+from ..decorators import conditional, librarian_required
+from ..pagination import paginate
+from ..search import AUTHOR_SEARCH, search_fields, search_page
 
 authors_bp = Blueprint('authors', __name__, template_folder='templates')
 
+# Nur die Felder, die in authors.html angezeigt werden
+AUTHOR_LIST_PROJECTION = {'name': 1, 'biography': 1}
+
 @authors_bp.route('/authors')
 @librarian_required
+@conditional('authors', 'author_jobs')
 def list_authors():
     search_query = request.args.get('search', None)
-    query = {}
     
     if search_query:
-        query = {
-            '$or': [
-                {'name': {'$regex': search_query, '$options': 'i'}},
-                {'biography': {'$regex': search_query, '$options': 'i'}}
-            ]
-        }
-   
-    all_authors = list(authors_collection.find(query).sort('name', 1))
+        page = search_page(AUTHOR_SEARCH, search_query, AUTHOR_LIST_PROJECTION)
+    else:
+        page = paginate(authors_collection, {}, 'name', AUTHOR_LIST_PROJECTION)
     
-    return render_template('authors.html', authors=all_authors)
+    return render_template('authors.html', authors=page.items, page=page, jobs=recent_jobs())
+
+def _start_job(kind, author_id, author_name):
+    # Bücher und Ausleihen werden im Hintergrund bearbeitet, die Anfrage kehrt sofort zurück
+    job_id = enqueue(kind, author_id, author_name)
+    if current_app.config.get('AUTHOR_JOBS_IN_PROCESS', True):
+        start_in_background(current_app._get_current_object(), job_id)
+    return job_id
 
 @authors_bp.route('/author/add', methods=['GET', 'POST'])
 @librarian_required
@@ -36,7 +45,10 @@ def add_author():
         if authors_collection.find_one({'name': name}):
             flash('Ein Autor mit diesem Namen existiert bereits.', 'warning')
         else:
-            authors_collection.insert_one({'name': name, 'biography': biography})
+            author = {'name': name, 'biography': biography}
+            author.update(search_fields(AUTHOR_SEARCH, author))
+            authors_collection.insert_one(author)
+            author_index.add(name)
             flash('Autor erfolgreich hinzugefügt.', 'success')
         
         return redirect(url_for('authors.list_authors'))
@@ -51,10 +63,17 @@ def edit_author(author_id):
     if request.method == 'POST':
         name = request.form.get('name')
         biography = request.form.get('biography')
-        authors_collection.update_one({'_id': ObjectId(author_id)}, {'$set': {'name': name, 'biography': biography}})
-        books_collection.update_many({'author_id': ObjectId(author_id)}, {'$set': {'author_name': name}})
-        
-        flash('Autor erfolgreich aktualisiert.', 'success')
+        changes = {'name': name, 'biography': biography}
+        changes.update(search_fields(AUTHOR_SEARCH, changes))
+        authors_collection.update_one({'_id': ObjectId(author_id)}, {'$set': changes})
+        author_index.invalidate()
+
+        # Denormalisierten Autorennamen und die Suchfelder der Bücher im Hintergrund mitziehen
+        if author and author.get('name') != name:
+            _start_job('rename', ObjectId(author_id), name)
+            flash('Autor erfolgreich aktualisiert. Die Bücher werden im Hintergrund angepasst.', 'success')
+        else:
+            flash('Autor erfolgreich aktualisiert.', 'success')
         
         return redirect(url_for('authors.list_authors'))
     
@@ -64,9 +83,13 @@ def edit_author(author_id):
 @librarian_required
 def delete_author(author_id):
     author_object_id = ObjectId(author_id)
-    books_collection.delete_many({'author_id': author_object_id})
-    authors_collection.delete_one({'_id': author_object_id})
+    author = authors_collection.find_one_and_delete({'_id': author_object_id}, {'name': 1})
+    if author is None:
+        flash('Autor nicht gefunden.', 'danger')
+        return redirect(url_for('authors.list_authors'))
+    author_index.invalidate()
+    _start_job('delete', author_object_id, author['name'])
     
-    flash('Autor und alle zugehörigen Bücher wurden gelöscht.', 'success')
+    flash('Autor wurde gelöscht. Die zugehörigen Bücher werden im Hintergrund entfernt.', 'success')
     
     return redirect(url_for('authors.list_authors'))
\ No newline at end of file
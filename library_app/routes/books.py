@@ -1,33 +1,36 @@
 # library_app/routes/books.py
 # Blueprint für alle Routen, die die Verwaltung von Büchern betreffen (CRUD und Suche).
 
+import datetime
+
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required
 from bson.objectid import ObjectId
 
+from ..author_index import author_index
 from ..db import books_collection, authors_collection, loans_collection 
-from ..decorators import librarian_required
+from ..decorators import conditional, librarian_required
+from ..pagination import paginate
+from ..search import BOOK_SEARCH, AUTHOR_SEARCH, search_fields, search_page
 
 
 books_bp = Blueprint('books', __name__, template_folder='templates')
 
+# Nur die Felder, die in books.html angezeigt werden
+BOOK_LIST_PROJECTION = {'title': 1, 'author_name': 1, 'isbn': 1, 'available_copies': 1, 'total_copies': 1}
+
 @books_bp.route('/books')
 @login_required
+@conditional('books')
 def list_books():
     search_query = request.args.get('search')
-    query = {}
    
     if search_query:
-        query = {
-            '$or': [
-                {'title': {'$regex': search_query, '$options': 'i'}},
-                {'author_name': {'$regex': search_query, '$options': 'i'}},
-                {'isbn': {'$regex': search_query, '$options': 'i'}}
-            ]
-        }
-    all_books = list(books_collection.find(query).sort('title', 1))
+        page = search_page(BOOK_SEARCH, search_query, BOOK_LIST_PROJECTION)
+    else:
+        page = paginate(books_collection, {}, 'title', BOOK_LIST_PROJECTION)
     
-    return render_template('books.html', books=all_books)
+    return render_template('books.html', books=page.items, page=page)
 
 @books_bp.route('/book/add', methods=['GET', 'POST'])
 @librarian_required
@@ -38,19 +41,24 @@ def add_book():
         author_name = request.form.get('author_name')
         total_copies = int(request.form.get('total_copies', 1))
 
+        new_author = {'name': author_name, 'biography': ''}
+        new_author.update(search_fields(AUTHOR_SEARCH, new_author))
         author = authors_collection.find_one_and_update(
-            {'name': author_name}, {'$setOnInsert': {'name': author_name, 'biography': ''}},
+            {'name': author_name}, {'$setOnInsert': new_author},
             upsert=True, return_document=True
         )
+        author_index.add(author['name'])
         
-        books_collection.insert_one({
+        book = {
             'title': title, 
             'isbn': isbn, 
             'author_id': author['_id'], 
             'author_name': author['name'], 
             'total_copies': total_copies, 
             'available_copies': total_copies 
-        })
+        }
+        book.update(search_fields(BOOK_SEARCH, book))
+        books_collection.insert_one(book)
         
         flash('Buch erfolgreich hinzugefügt.', 'success')
         
@@ -76,13 +84,17 @@ def edit_book(book_id):
 
         new_available_copies = new_total_copies - borrowed_count
 
-        books_collection.update_one({'_id': ObjectId(book_id)}, {'$set': {
+        changes = {
             'title': request.form.get('title'),
             'isbn': request.form.get('isbn'),
             'author_name': request.form.get('author_name'),
             'total_copies': new_total_copies,
             'available_copies': new_available_copies
-        }})
+        }
+        changes.update(search_fields(BOOK_SEARCH, changes))
+        # Bestandsänderung: der nächste inkrementelle Verfügbarkeitsabgleich prüft das Buch
+        changes['updated_at'] = datetime.datetime.now(datetime.timezone.utc)
+        books_collection.update_one({'_id': ObjectId(book_id)}, {'$set': changes})
         
         flash('Buch erfolgreich aktualisiert.', 'success')
         
@@ -1,14 +1,19 @@
 # library_app/routes/main.py
 # Blueprint für allgemeine Routen wie die Startseite, Berichte und CSV-Exporte.
 
-import csv
-from io import StringIO
 import datetime
+import io
 
-from flask import Blueprint, render_template, make_response
+from flask import Blueprint, abort, current_app, flash, redirect, render_template, request, url_for
 
-from ..decorators import admin_required
-from ..db import loans_collection, books_collection, users_collection, authors_collection
+from ..async_db import fetch_all
+from ..decorators import admin_required, conditional
+from ..db import books_collection, users_collection, authors_collection
+from ..exports import csv_response, export_batch_size
+from ..importer import CSV_COLUMNS, detect_format, import_stream
+from ..loan_rollups import (DIMENSIONS, GRANULARITIES, recent_range, refresh_if_stale, series, top_in_range,
+                            top_in_range_query, totals_by_period)
+from ..reports import REPORTS, report_engine
 
 main_bp = Blueprint('main', __name__, template_folder='templates')
 
@@ -16,180 +21,136 @@ main_bp = Blueprint('main', __name__, template_folder='templates')
 def index():
     return render_template('index.html')
 
+TREND_HEADERS = {'all': 'Gesamt', 'book': 'Buch', 'author': 'Autor', 'user': 'Nutzer'}
+
+def _report_range(granularities=GRANULARITIES):
+    # Zeitraum aus ?from=JJJJ-MM-TT&to=JJJJ-MM-TT (beide Tage einschließlich), Standard: letzte 30 Tage
+    start, end = recent_range(30)
+    try:
+        if request.args.get('from'):
+            start = datetime.datetime.fromisoformat(request.args['from']).replace(tzinfo=datetime.timezone.utc)
+        if request.args.get('to'):
+            end = (datetime.datetime.fromisoformat(request.args['to']).replace(tzinfo=datetime.timezone.utc)
+                   + datetime.timedelta(days=1))
+    except ValueError:
+        abort(400)
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in granularities or end <= start:
+        abort(400)
+    return start, end, granularity
+
 @main_bp.route('/reports')
 @admin_required
 def reports():
-    now = datetime.datetime.now(datetime.timezone.utc)
-
-    top_books_pipeline = [
-        {'$group': {'_id': '$book_id', 'loan_count': {'$sum': 1}}},
-        {'$sort': {'loan_count': -1}}, {'$limit': 5},
-        {'$lookup': {'from': 'books', 'localField': '_id', 'foreignField': '_id', 'as': 'book_details'}},
-        {'$unwind': '$book_details'},
-        {'$project': {'title': '$book_details.title', 'author_name': '$book_details.author_name', 'loan_count': 1}}
-    ]
-    top_books = list(loans_collection.aggregate(top_books_pipeline))
-
-    top_users_pipeline = [
-        {'$group': {'_id': '$user_id', 'loan_count': {'$sum': 1}}},
-        {'$sort': {'loan_count': -1}}, {'$limit': 5},
-        {'$lookup': {'from': 'users', 'localField': '_id', 'foreignField': '_id', 'as': 'user_details'}},
-        {'$unwind': '$user_details'},
-        {'$project': {'username': '$user_details.username', 'loan_count': 1}}
-    ]
-    top_users = list(loans_collection.aggregate(top_users_pipeline))
-
-    overdue_books_pipeline = [
-        {'$match': {'return_date': None, 'due_date': {'$lt': now}}},
-        {'$lookup': {'from': 'books', 'localField': 'book_id', 'foreignField': '_id', 'as': 'book_details'}},
-        {'$lookup': {'from': 'users', 'localField': 'user_id', 'foreignField': '_id', 'as': 'user_details'}},
-        {'$unwind': '$book_details'}, {'$unwind': '$user_details'},
-        {'$project': {
-            '_id': 0, 'username': '$user_details.username', 'book_title': '$book_details.title',
-            'due_date': '$due_date',
-            'days_overdue': {'$floor': {'$divide': [{'$subtract': [now, '$due_date']}, 1000 * 60 * 60 * 24]}}
-        }},
-        {'$sort': {'due_date': 1}}
-    ]
-    overdue_loans = list(loans_collection.aggregate(overdue_books_pipeline))
+    results = report_engine.get(['top_books', 'top_users', 'overdue_books'])
+
+    refresh_if_stale(current_app.config['LOAN_ROLLUP_REFRESH'])
+    start, end, granularity = _report_range()
+    # Die drei Ranglisten sind unabhängig und laufen mit ASYNC_DB gleichzeitig
+    dimensions = ('book', 'author', 'user')
+    range_top = fetch_all(top_in_range_query(dimension, start, end, limit=10) for dimension in dimensions)
 
     return render_template('reports.html', 
-                           top_books=top_books, 
-                           top_users=top_users,
-                           overdue_loans=overdue_loans)
+                           top_books=results['top_books'].rows[:5], 
+                           top_users=results['top_users'].rows[:5],
+                           overdue_loans=results['overdue_books'].rows,
+                           range_start=start, range_end=end - datetime.timedelta(days=1), granularity=granularity,
+                           trend=totals_by_period(start, end, granularity),
+                           range_top=dict(zip(dimensions, range_top)))
 
 @main_bp.route('/export/books/csv')
 @admin_required
+@conditional('books')
 def export_books_csv():
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Titel', 'Autor', 'ISBN', 'Status'])
+    books = books_collection.find(
+        {}, {'_id': 0, 'title': 1, 'author_name': 1, 'isbn': 1, 'available_copies': 1, 'total_copies': 1},
+        batch_size=export_batch_size()
+    )
+    rows = (
+        [book['title'], book['author_name'], book['isbn'],
+         f"{book.get('available_copies', 0)} / {book.get('total_copies', 0)}"]
+        for book in books
+    )
     
-    for book in books_collection.find():
-        status = f"{book.get('available_copies', 0)} / {book.get('total_copies', 0)}"
-        writer.writerow([book['title'], book['author_name'], book['isbn'], status])
-   
-    output.seek(0)
-    response = make_response(output.getvalue())
-    response.headers["Content-Disposition"] = "attachment; filename=buecher_export.csv"
-    response.headers["Content-type"] = "text/csv"
-    
-    return response
+    return csv_response('buecher_export.csv', ['Titel', 'Autor', 'ISBN', 'Status'], rows)
 
 @main_bp.route('/export/users/csv')
 @admin_required
+@conditional('users')
 def export_users_csv():
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Benutzername', 'Rolle', 'Registriert am (UTC)'])
-    
-    for user in users_collection.find():
-        writer.writerow([user['username'], user['role'], user['registered_on'].strftime('%Y-%m-%d %H:%M:%S')])
+    users = users_collection.find(
+        {}, {'_id': 0, 'username': 1, 'role': 1, 'registered_on': 1},
+        batch_size=export_batch_size()
+    )
+    rows = (
+        [user['username'], user['role'], user['registered_on'].strftime('%Y-%m-%d %H:%M:%S')]
+        for user in users
+    )
     
-    output.seek(0)
-    response = make_response(output.getvalue())
-    response.headers["Content-Disposition"] = "attachment; filename=benutzer_export.csv"
-    response.headers["Content-type"] = "text/csv"
-    
-    return response
+    return csv_response('benutzer_export.csv', ['Benutzername', 'Rolle', 'Registriert am (UTC)'], rows)
 
 @main_bp.route('/export/authors/csv')
 @admin_required
+@conditional('authors')
 def export_authors_csv():
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Name', 'Biografie'])
-    for author in authors_collection.find():
-        writer.writerow([author.get('name'), author.get('biography', '')])
-    output.seek(0)
-    response = make_response(output.getvalue())
-    response.headers["Content-Disposition"] = "attachment; filename=autoren_export.csv"
-    response.headers["Content-type"] = "text/csv"
+    authors = authors_collection.find({}, {'_id': 0, 'name': 1, 'biography': 1}, batch_size=export_batch_size())
+    rows = ([author.get('name'), author.get('biography', '')] for author in authors)
     
-    return response
+    return csv_response('autoren_export.csv', ['Name', 'Biografie'], rows)
 
-@main_bp.route('/export/report/top_books/csv')
+@main_bp.route('/export/report/<report_name>/csv')
 @admin_required
-def export_top_books_report_csv():
-    pipeline = [
-        {'$group': {'_id': '$book_id', 'loan_count': {'$sum': 1}}},
-        {'$sort': {'loan_count': -1}},
-        {'$lookup': {'from': 'books', 'localField': '_id', 'foreignField': '_id', 'as': 'book_details'}},
-        {'$unwind': '$book_details'},
-        {'$project': {'title': '$book_details.title', 'author_name': '$book_details.author_name', 'loan_count': 1, '_id': 0}}
-    ]
-    report_data = list(loans_collection.aggregate(pipeline))
-    
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Titel', 'Autor', 'Anzahl Ausleihen'])
-    
-    for row in report_data:
-        writer.writerow([row.get('title'), row.get('author_name'), row.get('loan_count')])
-        
-    output.seek(0)
-    response = make_response(output.getvalue())
-    response.headers["Content-Disposition"] = "attachment; filename=bericht_top_buecher.csv"
-    response.headers["Content-type"] = "text/csv"
+def export_report_csv(report_name):
+    # Kein @conditional: Ausleihen werden zu jeder Tageszeit überfällig, und die Zeilen kommen aus
+    # dem prozesslokalen Bericht-Cache, der nicht zu den Versionsstempeln passt
+    if report_name not in REPORTS:
+        abort(404)
+
+    definition = REPORTS[report_name]
+    rows = report_engine.stream(report_name, batch_size=export_batch_size())
     
-    return response
+    return csv_response(definition.filename, definition.header, rows)
 
-@main_bp.route('/export/report/top_users/csv')
+@main_bp.route('/export/trends/<dimension>/csv')
 @admin_required
-def export_top_users_report_csv():
-    pipeline = [
-        {'$group': {'_id': '$user_id', 'loan_count': {'$sum': 1}}},
-        {'$sort': {'loan_count': -1}},
-        {'$lookup': {'from': 'users', 'localField': '_id', 'foreignField': '_id', 'as': 'user_details'}},
-        {'$unwind': '$user_details'},
-        {'$project': {'username': '$user_details.username', 'loan_count': 1, '_id': 0}}
-    ]
-    report_data = list(loans_collection.aggregate(pipeline))
-
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Benutzername', 'Anzahl Ausleihen'])
-    
-    for row in report_data:
-        writer.writerow([row.get('username'), row.get('loan_count')])
-        
-    output.seek(0)
-    response = make_response(output.getvalue())
-    response.headers["Content-Disposition"] = "attachment; filename=bericht_top_nutzer.csv"
-    response.headers["Content-type"] = "text/csv"
-    
-    return response
-
-@main_bp.route('/export/report/overdue_books/csv')
+@conditional('loan_rollups', daily=True)
+def export_trends_csv(dimension):
+    # Ausleihen pro Zeitraum aus den Rollups; mit ?granularity=total eine Summe pro Eintrag
+    if dimension not in DIMENSIONS:
+        abort(404)
+    start, end, granularity = _report_range(GRANULARITIES + ('total',))
+    filename = f"trend_{dimension}_{start:%Y%m%d}_{end - datetime.timedelta(days=1):%Y%m%d}.csv"
+
+    if granularity == 'total':
+        rows = ([row.get('label') or '', row['loans']] for row in top_in_range(dimension, start, end, limit=None))
+        return csv_response(filename, [TREND_HEADERS[dimension], 'Ausleihen'], rows)
+
+    rows = (
+        [period.strftime('%Y-%m-%d'), label or '', loans]
+        for period, _, label, loans in series(dimension, start, end, granularity, batch_size=export_batch_size())
+    )
+    return csv_response(filename, ['Beginn', TREND_HEADERS[dimension], 'Ausleihen'], rows)
+
+
+@main_bp.route('/import', methods=['GET', 'POST'])
 @admin_required
-def export_overdue_books_report_csv():
-    now = datetime.datetime.now(datetime.timezone.utc)
-
-    pipeline = [
-        {'$match': {'return_date': None, 'due_date': {'$lt': now}}},
-        {'$lookup': {'from': 'books', 'localField': 'book_id', 'foreignField': '_id', 'as': 'book_details'}},
-        {'$lookup': {'from': 'users', 'localField': 'user_id', 'foreignField': '_id', 'as': 'user_details'}},
-        {'$unwind': '$book_details'}, {'$unwind': '$user_details'},
-        {'$project': {
-            '_id': 0, 'username': '$user_details.username', 'book_title': '$book_details.title',
-            'due_date': '$due_date',
-            'days_overdue': {'$floor': {'$divide': [{'$subtract': [now, '$due_date']}, 1000 * 60 * 60 * 24]}}
-        }},
-        {'$sort': {'due_date': 1}}
-    ]
-    report_data = list(loans_collection.aggregate(pipeline))
-    
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Nutzername', 'Buchtitel', 'Fällig am', 'Tage überfällig'])
-    
-    for row in report_data:
-        due_date_str = row['due_date'].strftime('%d.%m.%Y')
-        writer.writerow([row.get('username'), row.get('book_title'), due_date_str, row.get('days_overdue')])
-        
-    output.seek(0)
-    response = make_response(output.getvalue())
-    response.headers["Content-Disposition"] = "attachment; filename=bericht_ueberfaellige_buecher.csv"
-    response.headers["Content-type"] = "text/csv"
-    
-    return response
\ No newline at end of file
+def import_data():
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        upload = request.files.get('file')
+
+        if kind not in CSV_COLUMNS or not upload or not upload.filename:
+            flash('Bitte Datentyp und Datei auswählen.', 'danger')
+            return redirect(url_for('main.import_data'))
+
+        # Die hochgeladene Datei wird zeilenweise gelesen, nicht komplett in den Speicher geladen
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        report = import_stream(kind, stream, detect_format(upload.filename),
+                               current_app.config.get('IMPORT_BATCH_SIZE', 1000))
+
+        category = 'success' if not report.error_count else 'warning'
+        flash(f'{report.rows} Zeilen gelesen, {report.written} geschrieben, {report.error_count} Fehler '
+              f'({report.rows_per_second:.0f} Zeilen/s).', category)
+        return render_template('import.html', report=report)
+
+    return render_template('import.html', report=None)
\ No newline at end of file
@@ -1,32 +1,35 @@
 # library_app/routes/users.py
 # Blueprint für Routen zur Benutzerverwaltung und für Interaktionen wie Ausleihe und Rückgabe.
 
-import datetime
-
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 from bson.objectid import ObjectId
 
-from ..db import users_collection, loans_collection, books_collection
-from ..decorators import admin_required, librarian_required
+from ..circulation import CirculationError, borrow, return_loan
+from ..db import users_collection
+from ..decorators import admin_required, conditional, librarian_required
+from ..loan_views import open_loans_for_user, loan_history_page
+from ..models import user_cache
+from ..pagination import paginate
+from ..reports import report_engine
+from ..search import USER_SEARCH, search_fields, search_page
 
 users_bp = Blueprint('users', __name__, template_folder='templates')
 
+# Nur die Felder, die in users.html angezeigt werden (insbesondere kein Passwort-Hash)
+USER_LIST_PROJECTION = {'username': 1, 'role': 1, 'registered_on': 1}
+
 @users_bp.route('/users')
 @librarian_required
+@conditional('users')
 def list_users():
     search_query = request.args.get('search', None)
-    query = {}
     if search_query:
-        query = {
-            '$or': [
-                {'username': {'$regex': search_query, '$options': 'i'}},
-                {'role': {'$regex': search_query, '$options': 'i'}}
-            ]
-        }
-    all_users = list(users_collection.find(query).sort('username', 1))
+        page = search_page(USER_SEARCH, search_query, USER_LIST_PROJECTION)
+    else:
+        page = paginate(users_collection, {}, 'username', USER_LIST_PROJECTION)
    
-    return render_template('users.html', users=all_users)
+    return render_template('users.html', users=page.items, page=page)
 
 @users_bp.route('/user/edit/<user_id>', methods=['GET', 'POST'])
 @admin_required
@@ -48,7 +51,10 @@ def edit_user(user_id):
                 return redirect(url_for('users.list_users'))
 
         if new_role in ['user', 'librarian', 'admin']:
-            users_collection.update_one({'_id': ObjectId(user_id)}, {'$set': {'role': new_role}})
+            changes = {'role': new_role}
+            changes.update(search_fields(USER_SEARCH, {'username': user_to_edit['username'], 'role': new_role}))
+            users_collection.update_one({'_id': ObjectId(user_id)}, {'$set': changes})
+            user_cache.invalidate(user_id)
             flash(f"Rolle für {user_to_edit['username']} wurde zu '{new_role}' geändert.", 'success')
             return redirect(url_for('users.list_users'))
         else:
@@ -72,6 +78,7 @@ def delete_user(user_id):
             return redirect(url_for('users.list_users'))
 
     users_collection.delete_one({'_id': ObjectId(user_id)})
+    user_cache.invalidate(user_id)
     
     flash('Benutzer erfolgreich gelöscht.', 'success')
    
@@ -80,75 +87,47 @@ def delete_user(user_id):
 @users_bp.route('/profile')
 @login_required
 def user_profile():
-    user_loans = list(loans_collection.find({'user_id': ObjectId(current_user.id), 'return_date': None}))
-   
-    for loan in user_loans:
-        book = books_collection.find_one({'_id': loan['book_id']})
-        loan['book_title'] = book['title'] if book else 'Unbekanntes Buch'
+    user_loans = open_loans_for_user(current_user.id)
     
     return render_template('user_profile.html', loans=user_loans)
 
 @users_bp.route('/user/<user_id>/loans')
 @librarian_required
 def view_user_loans(user_id):
-    user = users_collection.find_one({'_id': ObjectId(user_id)})
+    user = users_collection.find_one({'_id': ObjectId(user_id)}, {'username': 1})
    
     if not user:
         flash('Benutzer nicht gefunden', 'danger')
         return redirect(url_for('users.list_users'))
    
-    user_loans = list(loans_collection.find({'user_id': ObjectId(user_id)}).sort('loan_date', -1))
-   
-    for loan in user_loans:
-        book = books_collection.find_one({'_id': loan['book_id']})
-        loan['book_title'] = book['title'] if book else 'Unbekanntes Buch'
+    page = loan_history_page(user_id)
    
-    return render_template('user_loans.html', loans=user_loans, user=user)
+    return render_template('user_loans.html', loans=page.items, user=user, page=page)
 
 @users_bp.route('/borrow/<book_id>')
 @login_required
 def borrow_book(book_id):
-    book = books_collection.find_one({'_id': ObjectId(book_id)})
-
-    if book and book.get('available_copies', 0) > 0:
-        books_collection.update_one(
-            {'_id': ObjectId(book_id)},
-            {'$inc': {'available_copies': -1}}
-        )
-
-        loan_date = datetime.datetime.now(datetime.timezone.utc)
-        due_date = loan_date + datetime.timedelta(days=21)
-        loans_collection.insert_one({
-            'book_id': ObjectId(book_id), 'user_id': ObjectId(current_user.id),
-            'loan_date': loan_date, 'due_date': due_date, 'return_date': None
-        })
+    try:
+        book, _ = borrow(book_id, current_user.id)
+        report_engine.invalidate()
         flash(f"Sie haben ein Exemplar von '{book['title']}' erfolgreich ausgeliehen.", 'success')
-    else:
-        flash('Dieses Buch ist leider nicht verfügbar oder alle Exemplare sind ausgeliehen.', 'danger')
+    except CirculationError as error:
+        flash(str(error), 'danger')
         
     return redirect(url_for('books.list_books'))
 
 @users_bp.route('/return/<loan_id>')
 @login_required
 def return_book(loan_id):
-    loan = loans_collection.find_one({'_id': ObjectId(loan_id), 'return_date': None})
-
-    if loan:
-        loans_collection.update_one(
-            {'_id': ObjectId(loan_id)}, 
-            {'$set': {'return_date': datetime.datetime.now(datetime.timezone.utc)}}
-        )
-
-        books_collection.update_one(
-            {'_id': loan['book_id']},
-            {'$inc': {'available_copies': 1}}
-        )
-        
+    try:
+        loan = return_loan(loan_id)
+        report_engine.invalidate()
         flash('Buch erfolgreich zurückgegeben.', 'success')
-    else:
-        flash('Ausleihvorgang nicht gefunden oder bereits abgeschlossen.', 'danger')
+    except CirculationError as error:
+        loan = None
+        flash(str(error), 'danger')
         
-    if 'source' in request.args and request.args.get('source') == 'user_loans':
+    if loan and request.args.get('source') == 'user_loans':
         return redirect(url_for('users.view_user_loans', user_id=str(loan['user_id'])))
         
     return redirect(url_for('users.user_profile'))
\ No newline at end of file
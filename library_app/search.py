@@ -0,0 +1,166 @@
+# library_app/search.py
+# Katalogsuche für Bücher, Autoren und Nutzer. Jedes Dokument trägt ein Feld `search_tokens`
+# mit normalisierten Wörtern (klein geschrieben, Umlaute aufgelöst). Gesucht wird über einen
+# Multikey-Index mit verankerten Präfix-Abfragen, die Ergebnisse werden nach Relevanz sortiert.
+
+import bisect
+import re
+import unicodedata
+
+from flask import request
+from pymongo import UpdateOne
+
+from .db import books_collection, authors_collection, users_collection
+from .pagination import Page, decode_values, encode_values, get_per_page
+
+UMLAUT_MAP = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'})
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+ISBN_PATTERN = re.compile(r'^(?:\d{9}[\dx]|97[89]\d{10})$')
+
+class SearchSpec:
+    # Beschreibt, welche Felder einer Collection durchsucht werden und wie stark sie zählen
+    def __init__(self, collection, fields, sort_field, isbn_field=None):
+        self.collection = collection
+        self.fields = fields
+        self.sort_field = sort_field
+        self.isbn_field = isbn_field
+
+BOOK_SEARCH = SearchSpec(books_collection, {'title': 3, 'author_name': 2, 'isbn': 1}, 'title', isbn_field='isbn')
+AUTHOR_SEARCH = SearchSpec(authors_collection, {'name': 3, 'biography': 1}, 'name')
+USER_SEARCH = SearchSpec(users_collection, {'username': 3, 'role': 1}, 'username')
+
+def normalize(text):
+    # Kleinschreibung, Umlaute zu ae/oe/ue/ss, übrige Akzente entfernen (é -> e)
+    text = str(text or '').casefold().translate(UMLAUT_MAP)
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(normalize(text))
+
+def normalize_isbn(text):
+    return re.sub(r'[\s-]', '', normalize(text))
+
+def search_fields(spec, document):
+    # Liefert die Suchfelder, die beim Schreiben eines Dokuments mitgesetzt werden
+    tokens = set()
+    for field in spec.fields:
+        tokens.update(tokenize(document.get(field)))
+
+    fields = {'search_tokens': sorted(tokens)}
+    if spec.isbn_field:
+        fields['isbn_normalized'] = normalize_isbn(document.get(spec.isbn_field))
+    return fields
+
+def _score(spec, document, query_tokens, normalized_query):
+    score = 0
+    for field, weight in spec.fields.items():
+        field_tokens = tokenize(document.get(field))
+        for query_token in query_tokens:
+            if query_token in field_tokens:
+                score += 2 * weight
+            elif any(token.startswith(query_token) for token in field_tokens):
+                score += weight
+
+    # Bonus, wenn das Hauptfeld mit der gesamten Suchanfrage beginnt
+    if ' '.join(tokenize(document.get(spec.sort_field))).startswith(normalized_query):
+        score += 5
+    return score
+
+# Höchstens so viele Treffer werden bewertet; darüber wird die Suche als begrenzt gemeldet
+CANDIDATE_LIMIT = 1000
+# Name des Multikey-Index über search_tokens (siehe indexes.SEARCH_INDEXES)
+SEARCH_INDEX = 'search_tokens'
+
+def _candidates(spec, query_tokens, projection, candidate_limit):
+    # Erst Dokumente, in denen jedes Suchwort als ganzes Wort vorkommt (sie erhalten die höchsten
+    # Punktzahlen), dann reine Präfix-Treffer. Beide Abfragen lesen in der Reihenfolge des Index
+    # search_tokens (Token, dann Speicherort), damit bei einer Begrenzung dieselben Kandidaten
+    # gelesen werden, ohne alle Treffer im Speicher zu sortieren. Liefert (Kandidaten, begrenzt).
+    # Die Tokens bestehen nur aus [a-z0-9], daher ist der verankerte Ausdruck sicher und nutzt den Index.
+    exact_query = {'search_tokens': {'$all': query_tokens}}
+    candidates = list(spec.collection.find(exact_query, projection).hint(SEARCH_INDEX)
+                      .limit(candidate_limit + 1))
+
+    if len(candidates) <= candidate_limit:
+        prefix_query = {'$and': [{'search_tokens': {'$regex': f'^{token}'}} for token in query_tokens]
+                        + [{'_id': {'$nin': [document['_id'] for document in candidates]}}]}
+        remaining = candidate_limit + 1 - len(candidates)
+        candidates.extend(spec.collection.find(prefix_query, projection).hint(SEARCH_INDEX)
+                          .limit(remaining))
+
+    return candidates[:candidate_limit], len(candidates) > candidate_limit
+
+def _ranked(spec, query_text, projection=None, candidate_limit=CANDIDATE_LIMIT):
+    # Liefert ([(Rangschlüssel, Dokument)], begrenzt), nach Relevanz, Sortierfeld und `_id` geordnet
+    query_tokens = tokenize(query_text)
+    if not query_tokens:
+        return [], False
+
+    if projection is not None:
+        projection = dict(projection, **{field: 1 for field in spec.fields})
+
+    # ISBN-Schnellpfad: exakter Treffer auf der normalisierten ISBN
+    if spec.isbn_field:
+        isbn = normalize_isbn(query_text)
+        if ISBN_PATTERN.match(isbn):
+            exact = list(spec.collection.find({'isbn_normalized': isbn}, projection).limit(candidate_limit + 1))
+            if exact:
+                return [((0, '', document['_id']), document) for document in exact[:candidate_limit]], \
+                    len(exact) > candidate_limit
+
+    candidates, truncated = _candidates(spec, query_tokens, projection, candidate_limit)
+    normalized_query = ' '.join(query_tokens)
+    ranked = [((-_score(spec, document, query_tokens, normalized_query),
+                normalize(document.get(spec.sort_field)), document['_id']), document)
+              for document in candidates]
+    ranked.sort(key=lambda entry: entry[0])
+    return ranked, truncated
+
+def search(spec, query_text, projection=None, limit=50, candidate_limit=CANDIDATE_LIMIT):
+    # Durchsucht die Collection und liefert höchstens `limit` Dokumente, nach Relevanz sortiert
+    ranked, _ = _ranked(spec, query_text, projection, candidate_limit)
+    return [document for _, document in ranked[:limit]]
+
+def search_page(spec, query_text, projection=None):
+    # Suchergebnisse als nach Relevanz sortierte Seite für die Listenansichten. Geblättert wird
+    # über die bewerteten Kandidaten mit dem Rangschlüssel (Punktzahl, Sortierwert, `_id`) als Token.
+    per_page = get_per_page()
+    ranked, truncated = _ranked(spec, query_text, projection)
+    keys = [key for key, _ in ranked]
+
+    before, after = request.args.get('before'), request.args.get('after')
+    position = decode_values(before or after, 3) if (before or after) else None
+    start, end = 0, per_page
+    try:
+        if position is not None and before:
+            end = bisect.bisect_left(keys, position)
+            start = max(end - per_page, 0)
+        elif position is not None:
+            start = bisect.bisect_right(keys, position)
+            end = start + per_page
+    except TypeError:
+        # Manipulierte Tokens mit fremden Typen führen zur ersten Seite
+        start, end = 0, per_page
+
+    entries = ranked[start:end]
+    next_token = encode_values(entries[-1][0]) if entries and end < len(ranked) else None
+    prev_token = encode_values(entries[0][0]) if entries and start > 0 else None
+    return Page([document for _, document in entries], next_token=next_token, prev_token=prev_token,
+                per_page=per_page, truncated=truncated)
+
+def reindex(spec, batch_size=1000):
+    # Berechnet die Suchfelder aller Dokumente einer Collection neu (z.B. nach Migrationen)
+    projection = {field: 1 for field in spec.fields}
+    operations = []
+    updated = 0
+
+    for document in spec.collection.find({}, projection):
+        operations.append(UpdateOne({'_id': document['_id']}, {'$set': search_fields(spec, document)}))
+        if len(operations) >= batch_size:
+            updated += spec.collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+
+    if operations:
+        updated += spec.collection.bulk_write(operations, ordered=False).modified_count
+    return updated
@@ -25,26 +25,51 @@ function initializeAuthorAutocomplete() {
     if (!input) { return; }
 
     const suggestionsContainer = document.getElementById("author_suggestions");
+    const debounceDelay = 200;
+    let debounceTimer = null;
+    let pendingRequest = null;
+
+    // Vorschläge erst nach einer kurzen Tipp-Pause laden, laufende Anfragen abbrechen
     input.addEventListener("input", function(e) {
         const query = this.value;
+        clearTimeout(debounceTimer);
+        if (pendingRequest) {
+            pendingRequest.abort();
+            pendingRequest = null;
+        }
         closeAllLists();
         if (!query || query.length < 1) { return false; }
-        fetch(`/api/search_authors?q=${query}`)
-            .then(response => response.json())
+        debounceTimer = setTimeout(() => fetchSuggestions(query), debounceDelay);
+    });
+
+    function fetchSuggestions(query) {
+        pendingRequest = new AbortController();
+
+        fetch(`/api/search_authors?q=${encodeURIComponent(query)}`, { signal: pendingRequest.signal })
+            // Bei 429/503 (Last- oder Ratenbegrenzung) bleiben die bisherigen Vorschläge stehen
+            .then(response => response.ok ? response.json() : null)
             .then(data => {
+                pendingRequest = null;
+                if (!Array.isArray(data)) { return; }
                 suggestionsContainer.innerHTML = '';
                 data.forEach(authorName => {
                     const suggestionDiv = document.createElement("DIV");
-                    suggestionDiv.innerHTML = "<strong>" + authorName.substr(0, query.length) + "</strong>";
-                    suggestionDiv.innerHTML += authorName.substr(query.length);
+                    const match = document.createElement("STRONG");
+                    match.textContent = authorName.substr(0, query.length);
+                    suggestionDiv.appendChild(match);
+                    suggestionDiv.appendChild(document.createTextNode(authorName.substr(query.length)));
                     suggestionDiv.addEventListener("click", function(e) {
                         input.value = authorName;
                         closeAllLists();
                     });
                     suggestionsContainer.appendChild(suggestionDiv);
                 });
+            })
+            .catch(error => {
+                // Abgebrochene Anfragen sind erwartet und werden ignoriert
+                if (error.name !== 'AbortError') { throw error; }
             });
-    });
+    }
 
     function closeAllLists(elmnt) {
         suggestionsContainer.innerHTML = '';
@@ -0,0 +1,56 @@
+# library_app/versions.py
+# Versionsstempel pro Collection (fortlaufende Nummer und Änderungszeitpunkt). Listen und
+# Exporte leiten daraus ETag und Last-Modified ab und antworten mit 304, solange sich die
+# zugrunde liegenden Collections nicht geändert haben.
+#
+# Anfragen und CLI-Befehle erhöhen die Stempel automatisch (flush_writes am Ende des App-Kontexts).
+# Skripte ohne App-Kontext rufen flush_writes() selbst auf, und zwar in jedem schreibenden Thread.
+# Andere Programme, die direkt in die Datenbank schreiben, müssen die Stempel selbst erhöhen, z.B.
+#   db.collection_versions.updateOne({_id: 'books'}, {$inc: {version: 1}, $max: {modified: new Date()}}, {upsert: true})
+# sonst liefern Listen und Exporte bis zur nächsten Änderung durch die Anwendung 304 mit altem Inhalt.
+
+import contextlib
+import datetime
+
+from pymongo import UpdateOne
+
+from .db import db
+from .write_tracking import write_tracker
+
+versions_collection = db['collection_versions']
+
+def bump(names):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    versions_collection.bulk_write([
+        UpdateOne({'_id': name}, {'$inc': {'version': 1}, '$max': {'modified': now}}, upsert=True)
+        for name in sorted(names)
+    ], ordered=False)
+
+def flush_writes():
+    # Stempel aller Collections erhöhen, in die der aktuelle Thread seit dem letzten Aufruf geschrieben hat
+    names = write_tracker.take_pending()
+    if names:
+        bump(names)
+    return names
+
+@contextlib.contextmanager
+def background_writes():
+    # Schreibzugriffe im Block sind Verwaltungsarbeit, keine Änderung durch die Anfrage (z.B. die
+    # Rollup-Aktualisierung aus /reports): ihre Stempel werden am Ende des Blocks erhöht, ohne
+    # dass die Sitzung danach vom Primary liest (read_routing.note_write)
+    outer = write_tracker.take_pending()
+    try:
+        yield
+    finally:
+        flush_writes()
+        write_tracker.add_pending(outer)
+
+def get_versions(names):
+    # Liefert {name: (Version, Änderungszeitpunkt)}; nie geänderte Collections haben (0, None)
+    versions = {name: (0, None) for name in names}
+    for stamp in versions_collection.find({'_id': {'$in': list(names)}}):
+        modified = stamp.get('modified')
+        if modified is not None and modified.tzinfo is None:
+            modified = modified.replace(tzinfo=datetime.timezone.utc)
+        versions[stamp['_id']] = (stamp.get('version', 0), modified)
+    return versions
@@ -0,0 +1,46 @@
+# library_app/write_tracking.py
+# Merkt sich pro Thread, in welche Collections geschrieben wurde. Der Listener hängt am
+# MongoClient (siehe db.py), sodass auch künftige Schreibzugriffe ohne Zusatzaufruf erfasst
+# werden; versions.flush_writes() erhöht danach die Versionsstempel dieser Collections.
+
+import threading
+
+from pymongo import monitoring
+
+# Collections, deren Änderungen in den Versionsstempeln (HTTP-Caching) sichtbar werden
+TRACKED_COLLECTIONS = frozenset({'books', 'authors', 'users', 'loans', 'loans_archive', 'author_jobs', 'loan_rollups'})
+WRITE_COMMANDS = frozenset({'insert', 'update', 'delete', 'findAndModify'})
+
+class WriteTracker(monitoring.CommandListener):
+    def __init__(self):
+        self._local = threading.local()
+
+    def started(self, event):
+        if event.command_name not in WRITE_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if collection in TRACKED_COLLECTIONS:
+            pending = getattr(self._local, 'pending', None)
+            if pending is None:
+                pending = self._local.pending = set()
+            pending.add(collection)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def take_pending(self):
+        # Liefert die seit dem letzten Aufruf beschriebenen Collections dieses Threads
+        pending = getattr(self._local, 'pending', None) or set()
+        self._local.pending = set()
+        return pending
+
+    def add_pending(self, names):
+        pending = getattr(self._local, 'pending', None)
+        if pending is None:
+            pending = self._local.pending = set()
+        pending.update(names)
+
+write_tracker = WriteTracker()